@@ -3,11 +3,18 @@ import tempfile
 import re
 import streamlit as st
 
-from src.config import Config
-from src.log import setup_logging
-from src.document import Document
+from src.bootstrap import bootstrap
 from src.vector_store import VectorStore
+from src.shards import ShardedVectorStore
+from src.ingest import IngestionPipeline
 from src.chat import Chat
+from src.history import ChatHistory
+from src.registry import (
+    shared_answer_cache,
+    shared_chat,
+    shared_vector_store,
+    vector_store_options,
+)
 from src.utils import validate_openai_key
 from src.prompts import QA_PROMPTS
 
@@ -44,6 +51,82 @@ def has_files_except_gitkeep(directory_path):
     return bool(files)
 
 
+def create_vector_store(cfg, **kwargs):
+    """
+    Create a VectorStore (or a ShardedVectorStore if sharded_index is set) using the vector store options
+    from the configuration.
+
+    Parameters:
+    - cfg (Config): The application configuration.
+    - **kwargs: Additional arguments passed to VectorStore (e.g. folder_path).
+
+    Returns:
+    - VectorStore: The configured vector store.
+    """
+    options = vector_store_options(cfg, **kwargs)
+    if options.pop("sharded", False):
+        return ShardedVectorStore(**options)
+    return VectorStore(**options)
+
+
+def create_chat(cfg, db, qa_prompt, shared=False):
+    """
+    Create a Chat over the vector store, sharing the process-wide answer cache if enabled.
+
+    Parameters:
+    - cfg (Config): The application configuration.
+    - db (VectorStore): The vector store to retrieve document chunks from.
+    - qa_prompt (str): The selected QA prompt.
+    - shared (bool): Reuse the chains shared by every session using the same (shared) vector store,
+      prompt and LLM settings. Only the chat history, kept in the session state, is per session.
+
+    Returns:
+    - Chat: The chat.
+    """
+    answer_cache = None
+    if cfg.answer_cache:
+        answer_cache = shared_answer_cache(
+            float(cfg.answer_cache_threshold or 0.97),
+            int(cfg.answer_cache_size or 1000),
+        )
+    if shared:
+        st.session_state.chat_history = ChatHistory()
+        chat = shared_chat(cfg, db, qa_prompt, answer_cache=answer_cache)
+        return chat.with_history(st.session_state.chat_history)
+    return Chat(
+        config=cfg,
+        retriever=db.retriever(),
+        qa_prompt=qa_prompt,
+        vector_store=db,
+        answer_cache=answer_cache,
+    )
+
+
+def ingest_documents(db, document_paths, cfg, sources=None):
+    """
+    Parse, split, and embed documents in parallel and merge them into the vector store.
+
+    Parameters:
+    - db (VectorStore): The vector store to add the document chunks to.
+    - document_paths (list): Paths of the documents to ingest.
+    - cfg (Config): The application configuration.
+    - sources (list, optional): Source of each document in the chunk metadata and IDs, defaults to the paths.
+
+    Returns:
+    - list: IDs of the document chunks added to the vector store.
+    """
+    pipeline = IngestionPipeline(
+        vector_store=db,
+        split_method=cfg.split_method,
+        chunk_size=int(cfg.chunk_size),
+        chunk_overlap=int(cfg.chunk_overlap),
+        max_workers=cfg.ingest_workers,
+        embed_workers=cfg.embedding_workers or 2,
+        queue_size=cfg.ingest_queue_size or 4,
+    )
+    return pipeline.run(document_paths, sources=sources)
+
+
 def clean_document_chunks(chunks):
     """
     Clean the content of document chunks by removing unwanted characters and patterns.
@@ -74,10 +157,22 @@ def handle_userinput(user_question, conversation):
     Returns:
     None
     """
-    response = conversation.ask(user_question)
-    answer = response["answer"]
-    answer = answer.replace("$", "\\$")
-    st.write(answer)
+    if conversation.config.stream_answers:
+        # Render the answer incrementally as tokens arrive
+        placeholder = st.empty()
+        answer = ""
+        for event, value in conversation.ask_stream(user_question):
+            if event == "token":
+                answer += value
+                placeholder.write(answer.replace("$", "\\$") + "▌")
+            elif event == "response":
+                response = value
+        placeholder.write(answer.replace("$", "\\$"))
+    else:
+        response = conversation.ask(user_question)
+        answer = response["answer"]
+        answer = answer.replace("$", "\\$")
+        st.write(answer)
     # Display retrieved document chunks
     with st.expander("View Retrieved Documents"):
         cleaned_chunks = clean_document_chunks(response["source_documents"])
@@ -101,11 +196,8 @@ def main():
                             """
     st.markdown(hide_default_format, unsafe_allow_html=True)
 
-    # Load configuration
-    cfg = Config(CFG_FILE)
-
-    # Set up logging
-    logger = setup_logging(cfg)
+    # Load configuration and set up logging (once per process, not on every rerun)
+    cfg, logger = bootstrap(CFG_FILE)
 
     # Add header for webapp
     st.header(":page_facing_up::mag: DocDigest MD")
@@ -231,6 +323,8 @@ def main():
                         del st.session_state.data_processed
                     if "conversation" in st.session_state:
                         del st.session_state.conversation
+                    if "chat_history" in st.session_state:
+                        del st.session_state.chat_history
 
                     # Reset demo API if used
                     if OSU_CS467_DEMO:
@@ -279,10 +373,13 @@ def main():
                             cfg.chunk_overlap = chunk_overlap
 
                             # Initiate vectorstore
-                            db = VectorStore()
+                            db = create_vector_store(cfg)
                             incorrect_file_ext = False
-                            # Process each uploaded document
-                            for index, doc_path in enumerate(uploaded_files):
+                            temp_file_paths = []
+                            # Original file names, so re-uploads of a file get the same chunk IDs
+                            upload_names = []
+                            # Store each uploaded document in a temporary file for processing
+                            for doc_path in uploaded_files:
                                 # Extract the extension of the uploaded file
                                 file_extension = os.path.splitext(doc_path.name)[1]
                                 if file_extension != ".pdf":
@@ -298,24 +395,18 @@ def main():
                                     delete=False, suffix=file_extension
                                 )
                                 temp_file.write(doc_path.read())
-                                temp_file_path = temp_file.name
-
-                                # Create a Document instance for processing
-                                doc = Document(
-                                    document_path=temp_file_path,
-                                    split_method=cfg.split_method,
-                                    chunk_size=int(cfg.chunk_size),
-                                    chunk_overlap=int(cfg.chunk_overlap),
-                                )
-                                # If it's the first document, create a new vector store, else add to the existing one
-                                if index == 0:
-                                    db.create_from_docs(doc.get_split_document())
-                                else:
-                                    db.add_docs(doc.get_split_document())
-
-                                # Close and delete the temporary file
                                 temp_file.close()
-                                if temp_file_path:
+                                temp_file_paths.append(temp_file.name)
+                                upload_names.append(doc_path.name)
+
+                            try:
+                                # Parse, split and embed all documents in parallel into the vector store
+                                ingest_documents(
+                                    db, temp_file_paths, cfg, sources=upload_names
+                                )
+                            finally:
+                                # Delete the temporary files, also if ingestion failed
+                                for temp_file_path in temp_file_paths:
                                     os.remove(temp_file_path)
 
                             if not incorrect_file_ext:
@@ -323,11 +414,8 @@ def main():
                                 db.save()
 
                                 # Initialize the retriever and chat using the saved vector store
-                                retriever = db.retriever()
-                                st.session_state.conversation = Chat(
-                                    config=cfg,
-                                    retriever=retriever,
-                                    qa_prompt=selected_prompt,
+                                st.session_state.conversation = create_chat(
+                                    cfg, db, selected_prompt
                                 )
                                 # Mark that data processing is complete
                                 st.session_state.data_processed = True
@@ -367,42 +455,33 @@ def main():
                             cfg.chunk_size = chunk_size
                             cfg.chunk_overlap = chunk_overlap
 
-                            # Load sample db
-                            if has_files_except_gitkeep(SAMPLE_DB_DIR):
-                                # If db_dir exists, load the vector database
-                                db = VectorStore(folder_path=SAMPLE_DB_DIR)
-                                db.load()
-                            else:
-                                db = VectorStore(folder_path=SAMPLE_DB_DIR)
-                                index = 0
-                                # Process each uploaded document
-                                for file_path in SAMPLE_FILES:
-                                    # for index, file_path in enumerate(SAMPLE_FILES_DIR):
-                                    # Create a Document instance for processing
-                                    doc = Document(
-                                        document_path=file_path,
-                                        split_method=cfg.split_method,
-                                        chunk_size=int(cfg.chunk_size),
-                                        chunk_overlap=int(cfg.chunk_overlap),
-                                    )
-                                    # If it's the first document, create a new vector store, else add to the existing one
-                                    if index == 0:
-                                        db.create_from_docs(doc.get_split_document())
-                                    else:
-                                        db.add_docs(doc.get_split_document())
-                                    index += 1
+                            # Build sample db if it does not exist yet
+                            if not has_files_except_gitkeep(SAMPLE_DB_DIR):
+                                db = create_vector_store(cfg, folder_path=SAMPLE_DB_DIR)
+                                # Parse, split and embed the sample documents in parallel
+                                ingest_documents(db, SAMPLE_FILES, cfg)
 
                                 db.save()
 
-                            # Initialize the retriever and chat using the saved vector store
-                            retriever = db.retriever()
-                            st.session_state.conversation = Chat(
-                                config=cfg,
-                                retriever=retriever,
-                                qa_prompt=selected_prompt,
+                            # Load sample db once per process, shared read-only by all sessions
+                            db = shared_vector_store(
+                                SAMPLE_DB_DIR,
+                                mmap=bool(cfg.mmap_index),
+                                **vector_store_options(cfg),
                             )
-                            # Mark that data processing is complete
-                            st.session_state.data_processed = True
+
+                            if db is None:
+                                st.error(
+                                    "Failed to load the sample documents.", icon="🚨"
+                                )
+                                logger.error("Failed to load the sample vector store.")
+                            else:
+                                # Initialize the retriever and chat using the shared vector store
+                                st.session_state.conversation = create_chat(
+                                    cfg, db, selected_prompt, shared=True
+                                )
+                                # Mark that data processing is complete
+                                st.session_state.data_processed = True
 
     # Q&A Section
     if "conversation" not in st.session_state:
@@ -0,0 +1,87 @@
+"""Check that Streamlit reruns do not accumulate logging handlers or bootstrap overhead.
+
+Simulates reruns of the app by calling src.bootstrap.bootstrap (what app.main runs on every rerun) and
+src.log.setup_logging (which must stay idempotent when called directly) many times. Reports the number of
+logging handlers and the time per rerun at several points, and exits with status 1 if either grows.
+
+Usage:
+    python benchmarks/bench_bootstrap.py [--reruns 1000]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CFG_FILE = "./config/config.yaml"
+LOGGERS = ["", "langchain", "urllib3", "faiss", "doc_retrieval", "metrics"]
+
+
+def handler_count():
+    """Return the total number of handlers on the loggers configured by setup_logging."""
+    return sum(len(logging.getLogger(name).handlers) for name in LOGGERS)
+
+
+def simulate(rerun, reruns):
+    """Call rerun() the given number of times and record handler counts and timings."""
+    checkpoints = {1, 10, 100, reruns}
+    timings = []
+    results = []
+    for i in range(1, reruns + 1):
+        start = time.perf_counter()
+        rerun()
+        timings.append(time.perf_counter() - start)
+        if i in checkpoints:
+            results.append(
+                {
+                    "reruns": i,
+                    "handlers": handler_count(),
+                    # Exclude the first call, which does the actual initialization.
+                    "mean_rerun_us": 1e6 * sum(timings[1:]) / max(1, len(timings) - 1),
+                }
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=1000)
+    parser.add_argument("--json", action="store_true", help="Print JSON lines")
+    args = parser.parse_args()
+    os.chdir(ROOT)
+
+    from src.bootstrap import bootstrap
+    from src.config import Config
+    from src.log import setup_logging
+
+    ok = True
+    scenarios = {
+        "bootstrap": lambda: bootstrap(CFG_FILE),
+        "setup_logging": lambda: setup_logging(Config(CFG_FILE)),
+    }
+    for name, rerun in scenarios.items():
+        results = simulate(rerun, args.reruns)
+        handlers = {r["handlers"] for r in results}
+        # Mean time per rerun between the 10th and the last rerun must not grow with the rerun count.
+        growth = results[-1]["mean_rerun_us"] / max(results[1]["mean_rerun_us"], 1e-9)
+        passed = len(handlers) == 1 and growth < 3
+        ok = ok and passed
+        for r in results:
+            if args.json:
+                print(json.dumps({"scenario": name, **r}))
+            else:
+                print(
+                    f"{name:<15}reruns={r['reruns']:<6}handlers={r['handlers']:<4}"
+                    f"mean rerun={r['mean_rerun_us']:.1f}us"
+                )
+        if not args.json:
+            print(f"{name:<15}{'OK' if passed else 'FAILED'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Measure the throughput of the local embeddings backends.
+
+Loads and splits PDFs from files/medical, then embeds the chunks with every local backend of the
+embeddings registry (HashingEmbeddings, and FakeEmbeddings for reference) and reports chunks and
+megabytes of text per second, along with the time to build a vector store from the chunks with
+HashingEmbeddings. No API calls are made.
+
+Usage:
+    python benchmarks/bench_embeddings.py [--documents 5] [--repeat 3] [--json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MEDICAL_DIR = os.path.join(ROOT, "files", "medical")
+BACKENDS = ("HashingEmbeddings", "FakeEmbeddings")
+
+
+def load_chunks(count, chunk_size=2000, chunk_overlap=200):
+    """Load and split the first count PDFs of files/medical."""
+    from src.document import Document
+
+    paths = sorted(
+        os.path.join(MEDICAL_DIR, name)
+        for name in os.listdir(MEDICAL_DIR)
+        if name.endswith(".pdf")
+    )[:count]
+    chunks = []
+    for path in paths:
+        document = Document(path, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        chunks.extend(document.get_split_document())
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=5, help="PDFs to load")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print JSON lines")
+    args = parser.parse_args()
+    os.chdir(ROOT)
+    # Local backends never call the API, but langchain's OpenAI classes require a key to be set.
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    from src.embeddings import create_embeddings
+    from src.vector_store import VectorStore
+
+    chunks = load_chunks(args.documents)
+    texts = [chunk.page_content for chunk in chunks]
+    megabytes = sum(len(text.encode("utf-8")) for text in texts) / 1e6
+
+    results = []
+    for name in BACKENDS:
+        embeddings = create_embeddings(name)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            embeddings.embed_documents(texts)
+            timings.append(time.perf_counter() - start)
+        seconds = float(np.median(timings))
+        results.append(
+            {
+                "benchmark": "embed_documents",
+                "embeddings": name,
+                "chunks": len(texts),
+                "seconds": seconds,
+                "chunks_per_s": len(texts) / seconds,
+                "mb_per_s": megabytes / seconds,
+            }
+        )
+
+    db = VectorStore(embeddings_model="HashingEmbeddings", index_type="flat")
+    start = time.perf_counter()
+    db.create_from_docs(chunks)
+    seconds = time.perf_counter() - start
+    results.append(
+        {
+            "benchmark": "create_from_docs",
+            "embeddings": "HashingEmbeddings",
+            "chunks": len(chunks),
+            "seconds": seconds,
+            "chunks_per_s": len(chunks) / seconds,
+        }
+    )
+
+    for r in results:
+        if args.json:
+            print(json.dumps(r))
+        else:
+            mb = f"  {r['mb_per_s']:.2f} MB/s" if "mb_per_s" in r else ""
+            print(
+                f"{r['benchmark']:<17}{r['embeddings']:<19}chunks={r['chunks']:<6}"
+                f"{r['seconds']:.3f}s  {r['chunks_per_s']:.0f} chunks/s{mb}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Check that the chat history sent to the prompts stays flat over long conversations.
+
+Runs a long conversation (the AML questions, cycled) through Chat.ask with the offline fake LLM and
+embeddings, once with the configured history token budget and once without a limit, and reports for
+every few turns the tokens of the chat history put in the condense prompt and the time per turn. With the
+budget, older turns are folded into the running summary, so both must stay flat; exits with status 1 if
+the history of the last turns is larger than at the start of the conversation.
+
+Usage:
+    python benchmarks/bench_history.py [--turns 150] [--budget 1000] [--json]
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import contextlib
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CFG_FILE = "./config/config.yaml"
+QUESTIONS_FILE = "./files/medical/AML LLM Database Questions.docx"
+
+
+def converse(cfg, db, questions, turns):
+    """Run a conversation and return the history tokens and latency of every turn."""
+    from src.chat import Chat
+    from src.utils import count_tokens
+
+    chat = Chat(cfg, vector_store=db).with_history()
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for turn in range(turns):
+            question = questions[turn % len(questions)]
+            start = time.perf_counter()
+            chat.ask(question)
+            seconds = time.perf_counter() - start
+            # History the next turn sends to the condense prompt.
+            history = chat.history_window.format(chat.chat_history)
+            results.append(
+                {
+                    "turn": turn + 1,
+                    "history_tokens": count_tokens(history, chat.llm_model),
+                    "turn_ms": 1000 * seconds,
+                }
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=150)
+    parser.add_argument("--budget", type=int, default=1000, help="History token budget")
+    parser.add_argument("--json", action="store_true", help="Print JSON lines")
+    args = parser.parse_args()
+    os.chdir(ROOT)
+    # The fakes never call the API, but langchain's OpenAI classes require a key to be set.
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    from src.config import Config
+    from src.evaluate import load_questions
+    from src.vector_store import VectorStore
+
+    cfg = Config(CFG_FILE)
+    cfg.config.update(
+        llm_model="fake",
+        condense_llm_model=None,
+        fake_llm_latency=0,
+        condense_cache_size=0,
+        answer_cache=False,
+    )
+    db = VectorStore(folder_path="./db_sample", embeddings_model="FakeEmbeddings")
+    db.load()
+    questions = load_questions(QUESTIONS_FILE)
+
+    ok = True
+    for name, budget in (("bounded", args.budget), ("unbounded", None)):
+        cfg.config["history_token_budget"] = budget
+        results = converse(cfg, db, questions, args.turns)
+        for r in results:
+            if args.json:
+                print(json.dumps({"history": name, **r}))
+            elif r["turn"] in (1, 10, 25, 50, 100) or r["turn"] % 50 == 0:
+                print(
+                    f"{name:<11}turn={r['turn']:<5}history tokens={r['history_tokens']:<7}"
+                    f"turn={r['turn_ms']:.1f}ms"
+                )
+        if budget is not None:
+            # After the window first fills up, the history must not keep growing.
+            tokens = np.array([r["history_tokens"] for r in results])
+            start, end = tokens[20:40].max(), tokens[-20:].max()
+            passed = end <= 1.1 * start
+            ok = ok and passed
+            if not args.json:
+                print(
+                    f"{name:<11}max history tokens turns 21-40={start} "
+                    f"last 20={end} {'OK' if passed else 'FAILED'}"
+                )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Benchmark memory-mapped vs in-memory loading of a FAISS vector store.
+
+Compares load latency, first-query latency and resident memory (RSS) of VectorStore.load(mmap=False)
+and VectorStore.load(mmap=True) on db_sample and on a larger synthetic index. Every measurement runs in
+a fresh Python process so RSS reflects only that load. With mmap, pages touched by a search count towards
+RSS but are file-backed and shared in the page cache by every process that maps the same index.
+
+Usage:
+    python benchmarks/bench_mmap_load.py [--vectors 100000] [--dim 1536] [--repeat 3]
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Loading never calls the embeddings API, but OpenAIEmbeddings requires a key to be set.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+
+def rss_mb():
+    """Return the resident set size of this process in MB."""
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def measure(folder_path, mmap):
+    """Load the vector store in this process and print the measurements as JSON."""
+    from src.vector_store import VectorStore
+
+    db = VectorStore(folder_path=folder_path)
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    db.load(mmap=mmap)
+    load_seconds = time.perf_counter() - start
+    rss_loaded = rss_mb()
+
+    index = db.vector_store.index
+    query = np.random.default_rng(0).random((1, index.d), dtype=np.float32)
+    start = time.perf_counter()
+    index.search(query, 4)
+    search_seconds = time.perf_counter() - start
+    print(
+        json.dumps(
+            {
+                "load_ms": load_seconds * 1000,
+                "first_search_ms": search_seconds * 1000,
+                "rss_load_mb": rss_loaded - rss_before,
+                "rss_search_mb": rss_mb() - rss_before,
+            }
+        )
+    )
+
+
+def build_synthetic(folder_path, vectors, dim):
+    """Write a synthetic flat index and docstore in the same format as VectorStore.save."""
+    import faiss
+    from langchain.docstore.in_memory import InMemoryDocstore
+    from langchain.schema import Document
+
+    rng = np.random.default_rng(0)
+    index = faiss.IndexFlatL2(dim)
+    for start in range(0, vectors, 10000):
+        index.add(rng.random((min(10000, vectors - start), dim), dtype=np.float32))
+    faiss.write_index(index, os.path.join(folder_path, "index.faiss"))
+
+    ids = [str(i) for i in range(vectors)]
+    docstore = InMemoryDocstore(
+        {
+            _id: Document(page_content=f"chunk {_id}", metadata={"source": "synthetic"})
+            for _id in ids
+        }
+    )
+    with open(os.path.join(folder_path, "index.pkl"), "wb") as f:
+        pickle.dump((docstore, dict(enumerate(ids))), f)
+
+
+def run(folder_path, mmap, repeat):
+    """Measure a load mode in fresh processes and return the median of each measurement."""
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, __file__, "--measure", folder_path]
+            + (["--mmap"] if mmap else []),
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=ROOT,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: float(np.median([r[key] for r in results])) for key in results[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--mmap", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.mmap)
+        return
+
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        build_synthetic(synthetic_dir, args.vectors, args.dim)
+        datasets = {
+            "db_sample": os.path.join(ROOT, "db_sample"),
+            f"synthetic ({args.vectors}x{args.dim})": synthetic_dir,
+        }
+        print(
+            f"{'index':<28}{'mode':<8}{'load ms':>10}{'search ms':>11}"
+            f"{'RSS load MB':>13}{'RSS search MB':>15}"
+        )
+        for name, folder_path in datasets.items():
+            for mmap in (False, True):
+                r = run(folder_path, mmap, args.repeat)
+                print(
+                    f"{name:<28}{'mmap' if mmap else 'read':<8}{r['load_ms']:>10.1f}"
+                    f"{r['first_search_ms']:>11.1f}{r['rss_load_mb']:>13.1f}"
+                    f"{r['rss_search_mb']:>15.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
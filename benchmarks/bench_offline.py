@@ -0,0 +1,308 @@
+"""Measure the overhead of the project's own code, without any OpenAI latency.
+
+Runs the document, vector store and chat pipeline with the deterministic offline stand-ins of src.fakes
+(FakeEmbeddings and the "fake" LLM, both with zero latency), so every measured millisecond is spent in this
+project, langchain or FAISS:
+
+- document: Document load and split of PDFs from files/medical, per page.
+- vector_store: VectorStore.create_from_docs, add_docs, save and load (read and mmap) of those chunks, with
+  the pickle and the Arrow docstore.
+- search: similarity_search on synthetic corpora of several sizes (index type picked by index_type auto).
+- chat: Chat.ask chain overhead for single Q&A, a first conversational turn and a follow-up turn (which
+  also condenses the question, with speculative retrieval), with the questions of AML LLM Database
+  Questions.docx.
+
+Results are written as JSON (commit, environment and one record per benchmark with mean/p50/p95/min in ms)
+so runs on different commits can be compared with --compare.
+
+Usage:
+    python benchmarks/bench_offline.py [--documents 3] [--sizes 1000,10000,50000] [--out results.json]
+    python benchmarks/bench_offline.py --compare benchmarks/results/offline-<commit>.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import contextlib
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MEDICAL_DIR = os.path.join(ROOT, "files", "medical")
+QUESTIONS_FILE = os.path.join(MEDICAL_DIR, "AML LLM Database Questions.docx")
+CFG_FILE = os.path.join(ROOT, "config", "config.yaml")
+
+
+def stats(name, seconds, **params):
+    """Build the result record of a benchmark from its timings in seconds."""
+    ms = 1000 * np.asarray(seconds)
+    return {
+        "benchmark": name,
+        "params": params,
+        "n": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "min_ms": float(ms.min()),
+    }
+
+
+def timed(fn, repeat=1):
+    """Call fn() repeat times and return (last result, list of timings in seconds)."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, timings
+
+
+def fake_vector_store(**kwargs):
+    """Create a VectorStore with offline embeddings and no embedding or query cache."""
+    from src.vector_store import VectorStore
+
+    return VectorStore(embeddings_model="FakeEmbeddings", **kwargs)
+
+
+def bench_documents(paths, chunk_size, chunk_overlap):
+    """Time Document load and split of each PDF and return (results, chunks)."""
+    from src.document import Document
+
+    results, chunks = [], []
+    for path in paths:
+        document, timings = timed(
+            lambda: Document(path, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        )
+        pages = len(document.get_document() or [])
+        chunks.extend(document.get_split_document())
+        results.append(
+            stats(
+                "document.load_split_per_page",
+                [timings[0] / max(pages, 1)],
+                file=os.path.basename(path),
+                pages=pages,
+                chunks=len(document.get_split_document()),
+            )
+        )
+    return results, chunks
+
+
+def bench_vector_store(chunks, repeat):
+    """Time create_from_docs, add_docs, save and load of the chunks with each docstore format."""
+    half = len(chunks) // 2
+    results = []
+    for docstore_format in ("pickle", "arrow"):
+        with tempfile.TemporaryDirectory() as folder_path:
+            timings = {"create_from_docs": [], "add_docs": [], "save": []}
+            for _ in range(repeat):
+                db = fake_vector_store(
+                    folder_path=folder_path, docstore_format=docstore_format
+                )
+                _, t = timed(lambda: db.create_from_docs(chunks[:half]))
+                timings["create_from_docs"] += t
+                _, t = timed(lambda: db.add_docs(chunks[half:]))
+                timings["add_docs"] += t
+                _, t = timed(db.save)
+                timings["save"] += t
+            for name, seconds in timings.items():
+                results.append(
+                    stats(
+                        f"vector_store.{name}",
+                        seconds,
+                        chunks=len(chunks),
+                        docstore_format=docstore_format,
+                    )
+                )
+            for mmap in (False, True):
+                db = fake_vector_store(folder_path=folder_path)
+                _, t = timed(lambda: db.load(mmap=mmap), repeat)
+                results.append(
+                    stats(
+                        "vector_store.load",
+                        t,
+                        chunks=len(chunks),
+                        docstore_format=docstore_format,
+                        mmap=mmap,
+                    )
+                )
+    return results
+
+
+def synthetic_corpus(size, dim, clusters=100):
+    """Return (documents, vectors) of a synthetic corpus of unit vectors around cluster centres."""
+    from langchain.schema import Document as LangchainDocument
+
+    rng = np.random.default_rng(0)
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centres[rng.integers(clusters, size=size)]
+    vectors += 0.6 * rng.standard_normal(vectors.shape, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    documents = [
+        LangchainDocument(
+            page_content=f"synthetic chunk {i}",
+            metadata={"source": f"synthetic-{i % 50}.pdf", "page": i % 20},
+        )
+        for i in range(size)
+    ]
+    return documents, vectors
+
+
+def bench_search(sizes, questions, dim, k):
+    """Time similarity_search on synthetic corpora of the given sizes."""
+    from src.index import index_type_of
+
+    results = []
+    for size in sizes:
+        documents, vectors = synthetic_corpus(size, dim)
+        db = fake_vector_store()
+        db.add_embeddings(documents, vectors.tolist())
+        # Use the index type save() would write for this corpus size.
+        db.build_index()
+        timings = [timed(lambda: db.similarity_search(q, k=k))[1][0] for q in questions]
+        results.append(
+            stats(
+                "search.similarity_search",
+                timings,
+                vectors=size,
+                dim=dim,
+                k=k,
+                index_type=index_type_of(db.vector_store.index),
+            )
+        )
+    return results
+
+
+def bench_chat(chunks, questions):
+    """Time Chat.ask with the fake LLM, i.e. the overhead of the chains and retrieval."""
+    from src.config import Config
+    from src.chat import Chat
+
+    cfg = Config(CFG_FILE)
+    cfg.config["llm_model"] = "fake"
+    cfg.config["fake_llm_latency"] = 0
+    # Off by default in the configuration.
+    cfg.config["speculative_retrieval"] = True
+    db = fake_vector_store()
+    db.create_from_docs(chunks)
+    results = []
+    # The chains are verbose and print every prompt; keep the output readable.
+    with contextlib.redirect_stdout(io.StringIO()):
+        single = Chat(cfg, conversational=False, vector_store=db)
+        timings = [timed(lambda: single.ask(q))[1][0] for q in questions]
+        results.append(stats("chat.ask", timings, conversational=False))
+
+        conversational = Chat(cfg, vector_store=db)
+        first, follow_up = [], []
+        for q in questions:
+            chat = conversational.with_history([])
+            first += timed(lambda: chat.ask(q))[1]
+            follow_up += timed(lambda: chat.ask(f"And why? {q}"))[1]
+        results.append(stats("chat.ask", first, conversational=True, turn="first"))
+        results.append(
+            stats("chat.ask", follow_up, conversational=True, turn="follow_up")
+        )
+    return results
+
+
+def commit():
+    """Return the current git commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=ROOT,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def result_key(result):
+    """Return the key identifying a benchmark across runs."""
+    return (result["benchmark"], json.dumps(result["params"], sort_keys=True))
+
+
+def print_results(results, baseline=None):
+    """Print the results as a table, with the change of p50 against a baseline run."""
+    previous = {result_key(r): r for r in (baseline or {}).get("results", [])}
+    print(f"{'benchmark':<32}{'params':<52}{'p50 ms':>10}{'p95 ms':>10}{'vs base':>9}")
+    for r in results:
+        params = " ".join(f"{k}={v}" for k, v in r["params"].items())
+        base = previous.get(result_key(r))
+        change = f"{r['p50_ms'] / base['p50_ms']:.2f}x" if base else ""
+        print(
+            f"{r['benchmark']:<32}{params[:50]:<52}{r['p50_ms']:>10.3f}"
+            f"{r['p95_ms']:>10.3f}{change:>9}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=3, help="PDFs to load")
+    parser.add_argument(
+        "--sizes", default="1000,10000,50000", help="Search corpus sizes"
+    )
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--out", help="Results file (default: benchmarks/results/offline-<commit>.json)"
+    )
+    parser.add_argument(
+        "--compare", help="Results file of a previous run to compare with"
+    )
+    args = parser.parse_args()
+    os.chdir(ROOT)
+    # The fakes never call the API, but langchain's OpenAI classes require a key to be set.
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    from src.evaluate import load_questions
+
+    paths = sorted(
+        os.path.join(MEDICAL_DIR, f)
+        for f in os.listdir(MEDICAL_DIR)
+        if f.endswith(".pdf")
+    )[: args.documents]
+    questions = load_questions(QUESTIONS_FILE)[: args.questions]
+
+    results, chunks = bench_documents(paths, chunk_size=1000, chunk_overlap=10)
+    results += bench_vector_store(chunks, args.repeat)
+    results += bench_search(
+        [int(size) for size in args.sizes.split(",")], questions, args.dim, args.k
+    )
+    results += bench_chat(chunks, questions)
+
+    run = {
+        "commit": commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    out = args.out or os.path.join(
+        ROOT, "benchmarks", "results", f"offline-{run['commit'] or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(run, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Report recall versus memory for the FAISS index types and scalar quantizations of VectorStore.
+
+Builds every configuration with src.index.build_index on a synthetic corpus of normalized, clustered
+vectors (shaped like OpenAI embeddings) and compares it with exact flat search: recall@k of the true
+nearest neighbours, index memory (serialized index size, which is what is held in RAM and written to
+index.faiss), full-precision vectors kept on disk for re-ranking, and mean query latency.
+
+Usage:
+    python benchmarks/bench_quantization.py [--vectors 20000] [--dim 1536] [--queries 200] [--k 4]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.index import RerankIndex, build_index, set_search_params  # noqa: E402
+
+# (index_type, quantization, rerank_factor)
+CONFIGS = [
+    ("flat", None, 0),
+    ("flat", "fp16", 0),
+    ("flat", "sq8", 0),
+    ("flat", "sq8", 4),
+    ("ivf_flat", None, 0),
+    ("ivf_flat", "sq8", 0),
+    ("ivf_flat", "sq8", 4),
+    ("hnsw", None, 0),
+    ("hnsw", "sq8", 4),
+    ("ivf_pq", None, 0),
+    ("ivf_pq", None, 4),
+]
+
+
+def synthetic_corpus(vectors, dim, queries, clusters=200):
+    """Return (corpus, queries) of unit vectors drawn around random cluster centres."""
+    rng = np.random.default_rng(0)
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    points = centres[rng.integers(clusters, size=vectors + queries)]
+    points += 0.6 * rng.standard_normal(points.shape, dtype=np.float32)
+    points /= np.linalg.norm(points, axis=1, keepdims=True)
+    return points[:vectors], points[vectors:]
+
+
+def evaluate(corpus, queries, truth, index_type, quantization, rerank_factor, args):
+    """Build one configuration and return its recall, memory and latency."""
+    start = time.perf_counter()
+    index = build_index(corpus, index_type=index_type, quantization=quantization)
+    build_seconds = time.perf_counter() - start
+    set_search_params(index, nprobe=args.nprobe, ef_search=args.ef_search)
+    index_bytes = faiss.serialize_index(index).nbytes
+    if rerank_factor:
+        index = RerankIndex(index, corpus, rerank_factor)
+
+    start = time.perf_counter()
+    _, labels = index.search(queries, args.k)
+    search_seconds = time.perf_counter() - start
+    recall = np.mean(
+        [len(set(found) & set(true)) / args.k for found, true in zip(labels, truth)]
+    )
+    return {
+        "index_type": index_type,
+        "quantization": quantization or "none",
+        "rerank_factor": rerank_factor,
+        f"recall@{args.k}": float(recall),
+        "index_mb": index_bytes / 1e6,
+        "rerank_disk_mb": corpus.nbytes / 1e6 if rerank_factor else 0.0,
+        "build_s": build_seconds,
+        "query_ms": search_seconds * 1000 / len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--json", action="store_true", help="Print JSON lines")
+    args = parser.parse_args()
+
+    corpus, queries = synthetic_corpus(args.vectors, args.dim, args.queries)
+    _, truth = faiss.knn(queries, corpus, args.k)
+
+    if not args.json:
+        print(
+            f"{'index':<10}{'quant':<7}{'rerank':>7}{f'recall@{args.k}':>11}{'index MB':>10}"
+            f"{'disk MB':>9}{'build s':>9}{'query ms':>10}"
+        )
+    for index_type, quantization, rerank_factor in CONFIGS:
+        r = evaluate(
+            corpus, queries, truth, index_type, quantization, rerank_factor, args
+        )
+        if args.json:
+            print(json.dumps(r))
+            continue
+        print(
+            f"{r['index_type']:<10}{r['quantization']:<7}{r['rerank_factor']:>7}"
+            f"{r[f'recall@{args.k}']:>11.3f}{r['index_mb']:>10.1f}"
+            f"{r['rerank_disk_mb']:>9.1f}{r['build_s']:>9.2f}{r['query_ms']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
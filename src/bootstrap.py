@@ -0,0 +1,41 @@
+"""Module for the one-time initialization of the application process.
+
+Streamlit re-executes the app script on every widget interaction, while imported modules stay loaded for
+the lifetime of the server process. This module provides the bootstrap function, which the app calls on
+every rerun and which loads the configuration and sets up logging only on the first call.
+"""
+import time
+import threading
+
+from src.config import Config
+from src.log import setup_logging
+from src.metrics import metrics
+
+_lock = threading.Lock()
+# Configuration file -> (Config, root logger) of the completed bootstrap.
+_bootstrapped = {}
+
+
+def bootstrap(cfg_file):
+    """Load the configuration and set up logging, exactly once per process.
+
+    Later calls, from reruns or other sessions, return the objects created by the first call.
+
+    Args:
+        cfg_file (str): Path to the YAML configuration file.
+
+    Returns:
+        tuple: (Config, logging.Logger) the application configuration and the root logger.
+    """
+    with _lock:
+        if cfg_file not in _bootstrapped:
+            start = time.perf_counter()
+            cfg = Config(cfg_file)
+            logger = setup_logging(cfg)
+            if cfg.metrics_port:
+                metrics.serve(int(cfg.metrics_port))
+            _bootstrapped[cfg_file] = (cfg, logger)
+            logger.info(
+                f"Application bootstrapped in {time.perf_counter() - start:.3f}s"
+            )
+        return _bootstrapped[cfg_file]
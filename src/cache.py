@@ -0,0 +1,693 @@
+"""Module for caching expensive results between runs of the application.
+
+This module provides the EmbeddingCache class, a persistent SQLite store of chunk embeddings keyed by the
+content hash of the chunk text and the embeddings model, the QueryEmbeddingCache class, an in-process
+LRU/TTL cache of query embeddings, the CachedEmbeddings wrapper which lets any langchain embeddings
+object consult these caches before calling the embeddings API (see cached_embeddings), the AnswerCache class, which reuses
+answers to semantically equivalent questions, and the CondensedQuestionCache class, which reuses
+standalone questions condensed from the same conversation.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+# Access times of cache hits are kept in memory and written to the database with the next put_many, or on
+# a lookup once this many are pending or this many seconds have passed since they were last written.
+RECENCY_FLUSH_ENTRIES = 10000
+RECENCY_FLUSH_SECONDS = 60.0
+
+
+def embedding_key(text, model):
+    """Return the content-addressed cache key for a text embedded with the given model.
+
+    Args:
+        text (str): Text that is embedded.
+        model (str): Name of the embeddings model.
+
+    Returns:
+        str: SHA-256 hex digest of the model name and text.
+    """
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def normalize_query(text):
+    """Normalize a query for caching: collapse whitespace and ignore case."""
+    return " ".join(text.split()).casefold()
+
+
+class EmbeddingCache:
+    """Class to persist embeddings on disk with a size cap and LRU eviction.
+
+    Entries are stored in a local SQLite database. Every lookup refreshes the entry's access time and,
+    once the cache holds more than max_entries embeddings, the least recently used entries are evicted.
+    Access times are collected in memory and written in batches (see RECENCY_FLUSH_ENTRIES), so lookups
+    do not write to the disk; pending ones are always written before entries are evicted. The number of
+    entries is counted once when the cache is opened and then kept up to date by put_many, so writes and
+    stats() do not scan the table.
+
+    Attributes:
+    - path (str): Path to the SQLite database file.
+    - max_entries (int): Maximum number of embeddings kept in the cache.
+    - hits (int): Number of lookups answered from the cache.
+    - misses (int): Number of lookups that were not in the cache.
+    """
+
+    def __init__(self, path="./cache/embeddings.sqlite", max_entries=200000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Key -> access time of the hits not yet written to the database.
+        self._accessed = {}
+        self._accessed_flushed = time.monotonic()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[
+            0
+        ]
+
+    def get_many(self, keys):
+        """Look up embeddings for a list of keys.
+
+        Args:
+            keys (list): Cache keys to look up.
+
+        Returns:
+            list: Embedding (list of floats) for each key, or None where the key is not cached.
+        """
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's limit on the number of query parameters.
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                for key in found:
+                    self._accessed[key] = now
+                if (
+                    len(self._accessed) >= RECENCY_FLUSH_ENTRIES
+                    or time.monotonic() - self._accessed_flushed
+                    >= RECENCY_FLUSH_SECONDS
+                ):
+                    self.__write_access_times()
+                    self._conn.commit()
+            results = []
+            for key in keys:
+                vector = found.get(key)
+                if vector is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(np.frombuffer(vector, dtype=np.float32).tolist())
+        return results
+
+    def put_many(self, keys, vectors):
+        """Store embeddings in the cache and evict the least recently used entries if needed.
+
+        Args:
+            keys (list): Cache keys.
+            vectors (list): Embedding for each key.
+        """
+        now = time.time()
+        rows = [
+            (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in zip(keys, vectors)
+        ]
+        with self._lock:
+            # Stored now, so the pending access times of these keys are out of date.
+            for key in keys:
+                self._accessed.pop(key, None)
+            # Written before evicting, so recently read entries are kept.
+            self.__write_access_times()
+            # Update the existing keys first, so the insert's row count is the number of new entries.
+            self._conn.executemany(
+                "UPDATE embeddings SET vector = ?, last_access = ? WHERE key = ?",
+                [(vector, last_access, key) for key, vector, last_access in rows],
+            )
+            self._count += self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                rows,
+            ).rowcount
+            if self.max_entries and self._count > self.max_entries:
+                self._count -= self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (self._count - self.max_entries,),
+                ).rowcount
+            self._conn.commit()
+
+    def flush(self):
+        """Write the pending access times of cache hits to the database."""
+        with self._lock:
+            self.__write_access_times()
+            self._conn.commit()
+
+    def __write_access_times(self):
+        """Update the access times of the pending cache hits, without committing. Call with the lock held."""
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(now, key) for key, now in self._accessed.items()],
+            )
+            self._accessed = {}
+        self._accessed_flushed = time.monotonic()
+
+    def __len__(self):
+        return self._count
+
+    def stats(self):
+        """Return cache hit/miss counters.
+
+        Returns:
+            dict: Number of hits, misses, hit rate and entries currently stored.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        """Write the pending access times and close the underlying database connection."""
+        with self._lock:
+            self.__write_access_times()
+            self._conn.commit()
+            self._conn.close()
+
+
+class QueryEmbeddingCache:
+    """Class to keep recent query embeddings in memory with LRU eviction and an optional time to live.
+
+    An optional EmbeddingCache can be given as a persistent second tier: memory misses are looked up there
+    and new embeddings are stored in both, so repeated queries survive restarts of the application.
+
+    Attributes:
+    - max_entries (int): Maximum number of query embeddings kept in memory.
+    - ttl (float): Seconds an entry stays valid in memory, or None to keep entries until evicted.
+    - store (EmbeddingCache): Persistent cache behind the in-memory cache, or None.
+    - hits (int): Number of lookups answered from memory.
+    - store_hits (int): Number of lookups answered from the persistent cache.
+    - misses (int): Number of lookups that had to be embedded.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None, store=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Look up a query embedding.
+
+        Args:
+            key (str): Cache key of the normalized query.
+
+        Returns:
+            list: The embedding, or None if it is not cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+        if self.store is not None:
+            vector = self.store.get_many([key])[0]
+            if vector is not None:
+                with self._lock:
+                    self.store_hits += 1
+                self.__remember(key, vector)
+                return vector
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, vector):
+        """Store a query embedding in memory and in the persistent cache, if any.
+
+        Args:
+            key (str): Cache key of the normalized query.
+            vector (list): The embedding.
+        """
+        self.__remember(key, vector)
+        if self.store is not None:
+            self.store.put_many([key], [vector])
+
+    def __remember(self, key, vector):
+        """Add an entry to the in-memory cache, evicting the least recently used entries."""
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (vector, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return cache hit/miss counters.
+
+        Returns:
+            dict: Number of memory hits, persistent cache hits, misses, hit rate and entries in memory.
+        """
+        lookups = self.hits + self.store_hits + self.misses
+        return {
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.store_hits) / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves document embeddings from an EmbeddingCache and query embeddings
+    from a QueryEmbeddingCache.
+
+    Only the texts missing from the cache are sent to the wrapped embeddings object, and duplicate texts
+    within a call are embedded once. Either cache may be None to disable it.
+
+    Attributes:
+    - embeddings (Embeddings): Wrapped embeddings object used on cache misses.
+    - cache (EmbeddingCache): Persistent embedding cache for documents.
+    - query_cache (QueryEmbeddingCache): Cache for query embeddings, keyed by the normalized query.
+    - model (str): Name of the embeddings model, part of every cache key.
+    """
+
+    def __init__(self, embeddings, cache=None, model=None, query_cache=None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.query_cache = query_cache
+        self.model = model or getattr(embeddings, "model", type(embeddings).__name__)
+
+    def embed_documents(self, texts):
+        """Embed a list of texts, calling the wrapped embeddings only for cache misses."""
+        if self.cache is None:
+            return self.embeddings.embed_documents(texts)
+        keys, vectors, missing = self.__lookup_documents(texts)
+        if missing:
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            vectors = self.__store_documents(keys, vectors, missing, new_vectors)
+        return vectors
+
+    async def aembed_documents(self, texts):
+        """Asynchronously embed a list of texts, calling the wrapped embeddings only for cache misses."""
+        if self.cache is None:
+            return await self.embeddings.aembed_documents(texts)
+        keys, vectors, missing = self.__lookup_documents(texts)
+        if missing:
+            new_vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            vectors = self.__store_documents(keys, vectors, missing, new_vectors)
+        return vectors
+
+    def __lookup_documents(self, texts):
+        """Look texts up in the cache.
+
+        Returns:
+            tuple: (cache keys, cached vector or None per text, {key: text} of unique cache misses)
+        """
+        keys = [embedding_key(text, self.model) for text in texts]
+        vectors = self.cache.get_many(keys)
+        cached = sum(vector is not None for vector in vectors)
+        missing = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None and key not in missing:
+                missing[key] = text
+        logging.info(
+            "Embedding cache: %s/%s chunks cached, %s",
+            cached,
+            len(texts),
+            self.cache.stats(),
+        )
+        return keys, vectors, missing
+
+    def __store_documents(self, keys, vectors, missing, new_vectors):
+        """Store newly computed embeddings and fill them in for the cache misses."""
+        self.cache.put_many(list(missing.keys()), new_vectors)
+        computed = dict(zip(missing.keys(), new_vectors))
+        return [
+            computed[key] if vector is None else vector
+            for key, vector in zip(keys, vectors)
+        ]
+
+    def embed_query(self, text):
+        """Embed a query, calling the wrapped embeddings only if the normalized query is not cached."""
+        if self.query_cache is None:
+            return self.embeddings.embed_query(text)
+        key = embedding_key(normalize_query(text), self.model)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.query_cache.put(key, vector)
+        logging.info("Query embedding cache: %s", self.query_cache.stats())
+        return vector
+
+    async def aembed_query(self, text):
+        """Asynchronously embed a query, calling the wrapped embeddings only if it is not cached."""
+        if self.query_cache is None:
+            return await self.embeddings.aembed_query(text)
+        key = embedding_key(normalize_query(text), self.model)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.query_cache.put(key, vector)
+        logging.info("Query embedding cache: %s", self.query_cache.stats())
+        return vector
+
+
+def cached_embeddings(
+    embeddings,
+    embedding_cache_path=None,
+    embedding_cache_size=200000,
+    query_cache_size=0,
+    query_cache_ttl=None,
+    query_cache_path=None,
+):
+    """Wrap an embeddings object in the configured embedding caches.
+
+    Args:
+        embeddings (Embeddings): Embeddings object to wrap.
+        embedding_cache_path (str, optional): Path of the persistent document embedding cache, or None to
+            disable it.
+        embedding_cache_size (int): Maximum number of cached document embeddings.
+        query_cache_size (int): Maximum number of query embeddings kept in memory, 0 to disable the query
+            cache.
+        query_cache_ttl (float, optional): Seconds a query embedding stays valid.
+        query_cache_path (str, optional): Path of the persistent store behind the query cache.
+
+    Returns:
+        Embeddings: A CachedEmbeddings, or the embeddings themselves if both caches are disabled.
+    """
+    cache = None
+    if embedding_cache_path:
+        cache = EmbeddingCache(
+            path=embedding_cache_path, max_entries=embedding_cache_size
+        )
+    query_cache = None
+    if query_cache_size:
+        store = None
+        if query_cache_path:
+            store = EmbeddingCache(
+                path=query_cache_path, max_entries=query_cache_size * 10
+            )
+        query_cache = QueryEmbeddingCache(
+            max_entries=query_cache_size, ttl=query_cache_ttl, store=store
+        )
+    if cache is not None or query_cache is not None:
+        return CachedEmbeddings(embeddings, cache, query_cache=query_cache)
+    return embeddings
+
+
+class AnswerCache:
+    """Class to reuse chat answers for questions that are semantically equivalent to earlier ones.
+
+    Questions are matched by cosine similarity of their embeddings. Entries live in a namespace, a
+    (scope, version) pair: the scope identifies everything the answer depends on besides the question
+    (prompt, model, retrieval settings) and the version the contents of the vector store (its
+    fingerprint), so answers of a changed vector store or prompt are never matched. Only one version per
+    scope is kept: entries of the previous version are dropped as soon as another one is used. The
+    embeddings of a namespace are kept in one matrix, so a lookup is a single matrix-vector product over
+    that namespace only.
+
+    Attributes:
+    - threshold (float): Minimum cosine similarity for two questions to share an answer.
+    - max_entries (int): Maximum number of answers kept across all namespaces (least recently used are
+      evicted first).
+    - hits (int): Number of questions answered from the cache.
+    - misses (int): Number of questions that were not in the cache.
+    """
+
+    def __init__(self, threshold=0.97, max_entries=1000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Scope -> _AnswerNamespace of its current version.
+        self._namespaces = {}
+        # (scope, question) of every entry, least recently used first.
+        self._order = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace, vector):
+        """Find the answer to the most similar cached question in a namespace.
+
+        Args:
+            namespace (tuple): (scope, version) of the question (see Chat).
+            vector (list): Embedding of the question.
+
+        Returns:
+            object: The cached answer, or None if no cached question is similar enough.
+        """
+        scope, version = namespace
+        vector = self.__unit(vector)
+        with self._lock:
+            entries = self.__namespace(scope, version, len(vector))
+            if entries is not None and len(entries):
+                similarities = entries.matrix() @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._order.move_to_end((scope, entries.questions[best]))
+                    self.hits += 1
+                    return entries.answers[best]
+            self.misses += 1
+        return None
+
+    def put(self, namespace, question, vector, answer):
+        """Store the answer to a question.
+
+        Args:
+            namespace (tuple): (scope, version) of the question (see Chat).
+            question (str): The question, used to replace earlier answers to the same question.
+            vector (list): Embedding of the question.
+            answer (object): Answer to cache.
+        """
+        scope, version = namespace
+        vector = self.__unit(vector)
+        with self._lock:
+            entries = self.__namespace(scope, version, len(vector), create=True)
+            entries.add(question, vector, answer)
+            self._order[(scope, question)] = None
+            self._order.move_to_end((scope, question))
+            while len(self._order) > self.max_entries:
+                (evicted_scope, evicted_question), _ = self._order.popitem(last=False)
+                self.__remove(evicted_scope, evicted_question)
+
+    def clear(self):
+        """Remove all cached answers."""
+        with self._lock:
+            self._namespaces.clear()
+            self._order.clear()
+
+    def __namespace(self, scope, version, dimension, create=False):
+        """Return the entries of a scope at a version, dropping those of any other version of the scope.
+
+        Call with the lock held.
+        """
+        entries = self._namespaces.get(scope)
+        if entries is not None and (entries.version, entries.dimension) != (
+            version,
+            dimension,
+        ):
+            logging.info(f"Answer cache: dropping {len(entries)} outdated answers")
+            for question in entries.questions:
+                del self._order[(scope, question)]
+            del self._namespaces[scope]
+            entries = None
+        if entries is None and create:
+            entries = self._namespaces[scope] = _AnswerNamespace(version, dimension)
+        return entries
+
+    def __remove(self, scope, question):
+        """Remove one entry. Call with the lock held."""
+        entries = self._namespaces[scope]
+        entries.remove(question)
+        if not len(entries):
+            del self._namespaces[scope]
+
+    def __unit(self, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def __len__(self):
+        return len(self._order)
+
+    def stats(self):
+        """Return cache hit/miss counters.
+
+        Returns:
+            dict: Number of hits, misses, hit rate and answers currently stored.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+
+class _AnswerNamespace:
+    """Questions, answers and unit question embeddings (one matrix row each) of one AnswerCache namespace.
+
+    Rows are kept contiguous: removing an entry moves the last row into its place.
+
+    Attributes:
+    - version (object): Version of the namespace (the vector store fingerprint).
+    - dimension (int): Dimension of the embeddings.
+    - questions (list): Question of each row.
+    - answers (list): Answer of each row.
+    - rows (dict): Question -> row.
+    """
+
+    def __init__(self, version, dimension, capacity=16):
+        self.version = version
+        self.dimension = dimension
+        self.questions = []
+        self.answers = []
+        self.rows = {}
+        self._vectors = np.empty((capacity, dimension), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def matrix(self):
+        """Return the (n, dimension) embeddings of the questions, in row order."""
+        return self._vectors[: len(self.questions)]
+
+    def add(self, question, vector, answer):
+        """Add a question, or replace the answer of a question already in the namespace."""
+        row = self.rows.get(question)
+        if row is None:
+            row = len(self.questions)
+            if row == len(self._vectors):
+                self._vectors = np.vstack([self._vectors, np.empty_like(self._vectors)])
+            self.rows[question] = row
+            self.questions.append(question)
+            self.answers.append(answer)
+        else:
+            self.answers[row] = answer
+        self._vectors[row] = vector
+
+    def remove(self, question):
+        """Remove a question, moving the last row into its place."""
+        row = self.rows.pop(question)
+        last = len(self.questions) - 1
+        if row != last:
+            moved = self.questions[last]
+            self._vectors[row] = self._vectors[last]
+            self.questions[row] = moved
+            self.answers[row] = self.answers[last]
+            self.rows[moved] = row
+        self.questions.pop()
+        self.answers.pop()
+
+
+class CondensedQuestionCache:
+    """Class to reuse standalone questions condensed from the same chat history and follow-up question.
+
+    Entries are keyed by a hash of the chat history, the follow-up question and the model that condensed
+    it, and evicted least recently used first.
+
+    Attributes:
+    - max_entries (int): Maximum number of condensed questions kept.
+    - hits (int): Number of follow-up questions condensed from the cache.
+    - misses (int): Number of follow-up questions that were not in the cache.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(chat_history, question, model):
+        """Return the cache key of a follow-up question.
+
+        Args:
+            chat_history (str): The chat history, formatted as in the condense prompt.
+            question (str): The follow-up question.
+            model (str): Name of the model that condenses the question.
+
+        Returns:
+            str: SHA-256 hex digest of the model, chat history and question.
+        """
+        text = "\0".join([str(model), chat_history, question.strip()])
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Look up a condensed question.
+
+        Returns:
+            str: The standalone question, or None if it is not cached.
+        """
+        with self._lock:
+            question = self._entries.get(key)
+            if question is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return question
+
+    def put(self, key, question):
+        """Store a condensed question."""
+        with self._lock:
+            self._entries[key] = question
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return cache hit/miss counters.
+
+        Returns:
+            dict: Number of hits, misses, hit rate and condensed questions currently stored.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
@@ -4,8 +4,18 @@ This module provides the Chat class which oversees chat interactions, leveraging
 the capabilities of large language models, document retrieval, and other utilities.
 """
 from src import prompts
+from src.fakes import FakeChatModel
+from src.metrics import metrics as shared_metrics
+from src.context import context_budget, pack_documents
+from src.condense import is_standalone, question_similarity
+from src.cache import CondensedQuestionCache
+from src.history import ChatHistory, HistoryWindow, format_turns
+import copy
+import asyncio
+import hashlib
 import logging
 import re
+from concurrent.futures import ThreadPoolExecutor
 from langchain.chat_models import ChatOpenAI
 from langchain.chains import (
     RetrievalQA,
@@ -13,7 +23,7 @@ from langchain.chains import (
     StuffDocumentsChain,
     LLMChain,
 )
-from langchain.schema import HumanMessage, AIMessage
+from langchain.schema import HumanMessage, AIMessage, format_document
 from langchain.prompts import (
     PromptTemplate,
     SystemMessagePromptTemplate,
@@ -24,7 +34,37 @@ from langchain.prompts import (
 
 # Imports for deprecated Gradio chat function
 from langchain.callbacks.manager import trace_as_chain_group
-from src.utils import remove_non_ascii
+from src.utils import remove_non_ascii, count_tokens
+
+
+def _stuff_prompt_inputs(combine_docs_chain, docs, **inputs):
+    """Get the answer prompt inputs for the document chunks, the way StuffDocumentsChain builds them.
+
+    Each chunk is formatted with the chain's document prompt and the chunks are joined with its document
+    separator into the document variable. Only the other inputs the answer prompt uses are kept.
+
+    Args:
+        combine_docs_chain (StuffDocumentsChain): The chain putting the chunks in the answer prompt.
+        docs (list): The document chunks.
+        **inputs: The other inputs of the prompt (question, chat_history).
+
+    Returns:
+        dict: The inputs of the answer prompt.
+    """
+    input_variables = combine_docs_chain.llm_chain.prompt.input_variables
+    prompt_inputs = {k: v for k, v in inputs.items() if k in input_variables}
+    doc_strings = [
+        format_document(doc, combine_docs_chain.document_prompt) for doc in docs
+    ]
+    context = combine_docs_chain.document_separator.join(doc_strings)
+    prompt_inputs[combine_docs_chain.document_variable_name] = context
+    return prompt_inputs
+
+
+# Threads retrieving document chunks for raw follow-up questions while they are condensed.
+_speculation_executor = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="speculative-retrieval"
+)
 
 
 class Chat:
@@ -42,7 +82,19 @@ class Chat:
     - conversational (bool): Determines if the chat mode is conversational (ConversationalRetrievalChain or RetrievalQA).
     - combine_docs_chain (object): Chain for combining document chunks into prompts.
     - qa_chain (object): Main Q&A chain.
-    - chat_history (list): History of chat interactions.
+    - chat_history (ChatHistory): History of chat interactions.
+    - history_window (HistoryWindow): Limits the chat history sent to the prompts to a token budget.
+    - vector_store (VectorStore): The vector store behind the retriever, used to invalidate cached answers.
+    - answer_cache (AnswerCache): Cache of answers to earlier, semantically equivalent questions.
+    - llm_model (str): LLM model the chains were created with.
+    - temperature (float): LLM temperature the chains were created with.
+    - context_budget (int): Maximum tokens of document chunks in the answer prompt (None for no limit).
+    - condense_llm_model (str): LLM model that condenses follow-up questions into standalone questions.
+    - condense_heuristic (bool): Skip condensing follow-up questions that look self-contained.
+    - condense_cache (CondensedQuestionCache): Cache of condensed questions, or None.
+    - speculative_retrieval (bool): Retrieve with the raw follow-up question while it is condensed.
+    - speculative_similarity (float): Minimum cosine similarity of the query embeddings of the raw and
+      condensed question to use the speculatively retrieved chunks.
 
     """
 
@@ -52,25 +104,64 @@ class Chat:
         retriever=None,
         conversational=True,
         qa_prompt=prompts.CHAT_QA_PROMPT,
+        vector_store=None,
+        answer_cache=None,
+        metrics=None,
     ):
         self.config = config
+        if retriever is None and vector_store is not None:
+            retriever = vector_store.retriever()
         self.retriever = retriever
         self.conversational = conversational
         self.qa_prompt = qa_prompt
+        self.vector_store = vector_store
+        self.answer_cache = answer_cache
+        self.metrics = metrics if metrics is not None else shared_metrics
+        # The configuration may be changed later (e.g. by another session), the chains keep these settings.
+        self.llm_model = config.llm_model
+        self.temperature = config.temperature
+        self.context_budget = context_budget(
+            config.context_token_budget, self.llm_model
+        )
+        self.condense_llm_model = config.condense_llm_model or self.llm_model
+        self.condense_heuristic = bool(config.condense_heuristic)
+        # The raw and condensed questions are compared by their embeddings, which needs the vector store.
+        self.speculative_retrieval = (
+            bool(config.speculative_retrieval) and vector_store is not None
+        )
+        self.speculative_similarity = (
+            0.9
+            if config.speculative_similarity is None
+            else config.speculative_similarity
+        )
+        # Shared by every view created with with_history(), i.e. by every conversation using these chains.
+        self.condense_cache = (
+            CondensedQuestionCache(config.condense_cache_size)
+            if config.condense_cache_size
+            else None
+        )
         self.combine_docs_chain = self.__create_combine_docs_chain()
         self.qa_chain = self.__create_qa_chain()
-        self.chat_history = []
+        self.history_window = self.__create_history_window()
+        self.chat_history = ChatHistory()
 
-    def __create_llm(self):
+    def __create_llm(self, llm_model=None):
         """
         Wrapper around OpenAI Chat large language models. Needs an environment variable ``OPENAI_API_KEY`` set with an API key.
         Note the `model_kwargs` parameter holds any model parameters that are valid with openai.ChatCompletion.create(...). This
         includes but not limited to model, messages, temperature. Need to still look at langchain source code and see how it is
         implemented.
+
+        Args:
+            llm_model (str, optional): Model to use instead of the chat's LLM model.
         """
-        return ChatOpenAI(
-            model_name=self.config.llm_model, temperature=self.config.temperature
-        )
+        llm_model = llm_model or self.llm_model
+        if llm_model == "fake":
+            # Offline stand-in for evaluation runs and benchmarks
+            return FakeChatModel(
+                latency=float(self.config.get_config_value("fake_llm_latency") or 0)
+            )
+        return ChatOpenAI(model_name=llm_model, temperature=self.temperature)
 
     def __create_question_generator(self):
         """
@@ -108,6 +199,25 @@ class Chat:
             # document_separator="---------", # default "\n\n"
         )
 
+    def __create_history_window(self):
+        """
+        Create the history window that keeps the chat history sent to the prompts within its token budget,
+        summarizing older turns with the condensing LLM.
+        """
+        summarizer = None
+        if self.config.history_summary:
+            summarizer = LLMChain(
+                llm=self.__create_llm(self.condense_llm_model),
+                prompt=PromptTemplate.from_template(prompts.SUMMARIZE_HISTORY_PROMPT),
+            )
+        return HistoryWindow(
+            max_tokens=self.config.history_token_budget,
+            format_turns=format_turns,
+            summarizer=summarizer,
+            summary_max_tokens=self.config.history_summary_tokens or 300,
+            model=self.llm_model,
+        )
+
     def __create_qa_chain(self):
         """
         Creates either a ConversationalRetrievalChain or RetrievalQA.
@@ -128,9 +238,11 @@ class Chat:
                 llm=llm,
                 retriever=self.retriever,
                 condense_question_prompt=condense_question_prompt,
+                condense_question_llm=self.__create_llm(self.condense_llm_model),
                 chain_type="stuff",
                 combine_docs_chain_kwargs=combine_docs_chain_kwargs,
                 return_source_documents=True,
+                get_chat_history=format_turns,
                 verbose=True,
             )
         else:
@@ -150,6 +262,25 @@ class Chat:
             )
             return qa
 
+    def with_history(self, chat_history=None):
+        """Get a view of this chat with its own chat history.
+
+        The view shares the chains, LLM clients, retriever and caches with this chat, so many
+        conversations can use one set of chains while each keeps its own history.
+
+        Args:
+            chat_history (ChatHistory, optional): The conversation's chat history, updated in place by ask().
+                A plain list is copied into a new ChatHistory, which then holds the turns and their summary.
+
+        Returns:
+            Chat: Chat sharing everything but the chat history.
+        """
+        chat = copy.copy(self)
+        if not isinstance(chat_history, ChatHistory):
+            chat_history = ChatHistory(chat_history or [])
+        chat.chat_history = chat_history
+        return chat
+
     def format_terms(self, text):
         """Format the given text for better visibility.
 
@@ -168,8 +299,9 @@ class Chat:
     def ask(self, question):
         """Accepts a user's question and returns the model's response.
 
-        Depending on the mode (conversational or not), this method processes the user's
-        query differently and leverages different chains to generate the response.
+        The question goes through explicit stages: condense it into a standalone question (conversational
+        mode with chat history only), look the standalone question up in the answer cache, and on a miss
+        retrieve the relevant document chunks and generate the answer from them.
 
         Args:
             question (str): The user's query.
@@ -177,18 +309,509 @@ class Chat:
         Returns:
             dict/str: The model's response.
         """
+        trace = self.metrics.trace("ask")
+        self.__fold_history(trace)
+        standalone_question, speculation = self.__condense(question, trace)
+        cache_key = self.__answer_cache_key(standalone_question, trace)
+        cached = self.__cached_answer(cache_key, trace)
+        if cached is not None:
+            answer, docs = cached
+            self.__finish_speculation(speculation, "unused")
+        else:
+            docs = self.__speculative_docs(standalone_question, speculation, trace)
+            if docs is None:
+                docs = self.__retrieve(standalone_question, trace)
+            docs = self.__pack(docs, trace)
+            answer = self.__generate(standalone_question, docs, trace)
+            self.__cache_answer(cache_key, standalone_question, answer, docs)
+        trace.finish()
+
+        return self.__respond(question, answer, docs)
+
+    def ask_stream(self, question):
+        """Accepts a user's question and streams the model's response as it is generated.
+
+        Runs the same stages as ask(), but yields the source documents as soon as retrieval finishes and
+        then the answer token by token, so the first token arrives after about the retrieval latency
+        instead of after the full completion.
+
+        Args:
+            question (str): The user's query.
+
+        Yields:
+            tuple: ("source_documents", list of documents) once, then ("token", str) for each token, and
+            finally ("response", dict) with the same response ask() returns.
+        """
+        trace = self.metrics.trace("ask_stream")
+        self.__fold_history(trace)
+        standalone_question, speculation = self.__condense(question, trace)
+        cache_key = self.__answer_cache_key(standalone_question, trace)
+        cached = self.__cached_answer(cache_key, trace)
+        if cached is not None:
+            answer, docs = cached
+            self.__finish_speculation(speculation, "unused")
+            yield "source_documents", list(docs)
+            yield "token", answer
+        else:
+            docs = self.__speculative_docs(standalone_question, speculation, trace)
+            if docs is None:
+                docs = self.__retrieve(standalone_question, trace)
+            docs = self.__pack(docs, trace)
+            yield "source_documents", list(docs)
+            tokens = []
+            for token in self.__generate_stream(standalone_question, docs, trace):
+                tokens.append(token)
+                yield "token", token
+            answer = "".join(tokens)
+            self.__cache_answer(cache_key, standalone_question, answer, docs)
+        trace.finish()
+        yield "response", self.__respond(question, answer, docs)
+
+    async def aask(self, question):
+        """Asynchronously accepts a user's question and returns the model's response.
+
+        Runs the same stages as ask() with the async OpenAI APIs, so a single event loop can keep many
+        questions in flight without a thread per request. Run it inside utils.openai_session() to share
+        one connection pool between all of them. Use one Chat per conversation: questions of the same
+        conversation must be awaited one after the other to keep the chat history consistent.
+
+        Args:
+            question (str): The user's query.
+
+        Returns:
+            dict/str: The model's response.
+        """
+        trace = self.metrics.trace("aask")
+        await self.__afold_history(trace)
+        standalone_question, speculation = await self.__acondense(question, trace)
+        cache_key = await self.__aanswer_cache_key(standalone_question, trace)
+        cached = self.__cached_answer(cache_key, trace)
+        if cached is not None:
+            answer, docs = cached
+            self.__finish_speculation(speculation, "unused")
+        else:
+            docs = await self.__aspeculative_docs(
+                standalone_question, speculation, trace
+            )
+            if docs is None:
+                docs = await self.__aretrieve(standalone_question, trace)
+            docs = self.__pack(docs, trace)
+            answer = await self.__agenerate(standalone_question, docs, trace)
+            self.__cache_answer(cache_key, standalone_question, answer, docs)
+        trace.finish()
+        return self.__respond(question, answer, docs)
+
+    def __respond(self, question, answer, docs):
+        """Record a question and its answer in the chat history and build the response."""
+        if self.conversational:
+            response = {
+                "question": question,
+                "chat_history": self.chat_history,
+                "answer": answer,
+                "source_documents": list(docs),
+            }
+        else:
+            response = {
+                "query": question,
+                "result": answer,
+                "source_documents": list(docs),
+            }
+        self.chat_history.append((question, answer))
+        return response
+
+    def __condense(self, question, trace):
+        """Rephrase a follow-up question as a standalone question using the chat history.
+
+        With speculative_retrieval, document chunks are retrieved for the raw question in a background
+        thread while the LLM condenses it.
+
+        Returns:
+            tuple: (standalone question, speculative retrieval or None, see __speculate)
+        """
+        chat_history, standalone_question, cache_key = self.__condense_fast_path(
+            question, trace
+        )
+        if standalone_question is not None:
+            return standalone_question, None
+        speculation = None
+        if self.speculative_retrieval:
+            speculation_trace = self.metrics.trace("speculative_retrieval")
+            speculation = (
+                _speculation_executor.submit(
+                    self.__speculate, question, speculation_trace
+                ),
+                speculation_trace,
+            )
+        try:
+            with trace.span("condense"):
+                standalone_question = self.qa_chain.question_generator.run(
+                    question=question, chat_history=chat_history
+                )
+        except Exception:
+            self.__finish_speculation(speculation, "error")
+            raise
+        return self.__condensed(cache_key, standalone_question, trace), speculation
+
+    async def __acondense(self, question, trace):
+        """Asynchronous version of __condense, the speculative retrieval runs in an asyncio Task."""
+        chat_history, standalone_question, cache_key = self.__condense_fast_path(
+            question, trace
+        )
+        if standalone_question is not None:
+            return standalone_question, None
+        speculation = None
+        if self.speculative_retrieval:
+            speculation_trace = self.metrics.trace("speculative_retrieval")
+            speculation = (
+                asyncio.create_task(self.__aspeculate(question, speculation_trace)),
+                speculation_trace,
+            )
+        try:
+            with trace.span("condense"):
+                standalone_question = await self.qa_chain.question_generator.arun(
+                    question=question, chat_history=chat_history
+                )
+        except Exception:
+            self.__finish_speculation(speculation, "error")
+            raise
+        return self.__condensed(cache_key, standalone_question, trace), speculation
+
+    def __speculate(self, question, trace):
+        """Retrieve the document chunks for a raw follow-up question, runs while the question is condensed.
+
+        Returns:
+            tuple: (query embedding of the question, documents)
+        """
+        with trace.span("embed_query"):
+            embedding = self.vector_store.embeddings.embed_query(question)
+        return embedding, self.__retrieve(question, trace, embedding)
+
+    async def __aspeculate(self, question, trace):
+        """Asynchronous version of __speculate."""
+        with trace.span("embed_query"):
+            embedding = await self.vector_store.embeddings.aembed_query(question)
+        return embedding, await self.__aretrieve(question, trace, embedding)
+
+    def __use_speculation(self, embedding, standalone_embedding, speculation, trace):
+        """Decide whether chunks retrieved for the raw question can serve its condensed version."""
+        similarity = question_similarity(embedding, standalone_embedding)
+        used = similarity >= self.speculative_similarity
+        trace.set(
+            speculative_similarity=round(similarity, 3),
+            speculation="hit" if used else "miss",
+        )
+        self.__finish_speculation(speculation, "hit" if used else "miss")
+        return used
+
+    def __finish_speculation(self, speculation, result):
+        """Record whether the speculatively retrieved chunks were used, once the retrieval is done.
+
+        The retrieval is not interrupted: it is either finished already or stuck in an API call.
+
+        Args:
+            speculation (tuple): Speculative retrieval from __condense, or None.
+            result (str): "hit", "miss", "unused" (the answer was cached) or "error" (the retrieval or the
+                condensing failed).
+        """
+        if speculation is None:
+            return
+        task, speculation_trace = speculation
+        speculation_trace.set(speculation=result)
+        self.metrics.inc("chat_speculative_retrievals_total", result=result)
+        task.add_done_callback(lambda _: speculation_trace.finish())
+
+    def __speculative_docs(self, standalone_question, speculation, trace):
+        """Get the speculatively retrieved chunks if they can be used, else None."""
+        if speculation is None:
+            return None
+        try:
+            # Usually finished already, the search is faster than the condensing LLM call.
+            with trace.span("speculation_wait"):
+                embedding, docs = speculation[0].result()
+            # Served from the query embedding cache when the answer cache or retrieval embed it again.
+            with trace.span("embed_query"):
+                standalone_embedding = self.vector_store.embeddings.embed_query(
+                    standalone_question
+                )
+        except Exception as e:
+            logging.error(f"Failed to retrieve documents speculatively: {e}")
+            self.__finish_speculation(speculation, "error")
+            return None
+        if self.__use_speculation(embedding, standalone_embedding, speculation, trace):
+            return docs
+        return None
+
+    async def __aspeculative_docs(self, standalone_question, speculation, trace):
+        """Asynchronous version of __speculative_docs."""
+        if speculation is None:
+            return None
+        try:
+            with trace.span("speculation_wait"):
+                embedding, docs = await speculation[0]
+            with trace.span("embed_query"):
+                standalone_embedding = await self.vector_store.embeddings.aembed_query(
+                    standalone_question
+                )
+        except Exception as e:
+            logging.error(f"Failed to retrieve documents speculatively: {e}")
+            self.__finish_speculation(speculation, "error")
+            return None
+        if self.__use_speculation(embedding, standalone_embedding, speculation, trace):
+            return docs
+        return None
+
+    def __condense_fast_path(self, question, trace):
+        """Get the standalone question without the condensing LLM call, if possible.
+
+        The question is used as is in single Q&A mode, for the first question of a conversation and,
+        with condense_heuristic, for follow-up questions that look self-contained. Otherwise the
+        condensed question is looked up in the condense cache.
+
+        Returns:
+            tuple: (chat history string, standalone question or None if it must be condensed, condense
+            cache key or None)
+        """
+        if not self.conversational:
+            return None, question, None
+        chat_history = self.__chat_history_str()
+        if not chat_history:
+            return chat_history, question, None
+        if self.condense_heuristic and is_standalone(question):
+            trace.set(condense="skipped")
+            return chat_history, question, None
+        if self.condense_cache is None:
+            return chat_history, None, None
+        cache_key = CondensedQuestionCache.key(
+            chat_history, question, self.condense_llm_model
+        )
+        standalone_question = self.condense_cache.get(cache_key)
+        if standalone_question is not None:
+            trace.set(condense="cached")
+        return chat_history, standalone_question, cache_key
+
+    def __condensed(self, cache_key, standalone_question, trace):
+        """Record a question condensed by the LLM and return it."""
+        trace.set(condense="llm")
+        if cache_key is not None:
+            self.condense_cache.put(cache_key, standalone_question)
+        return standalone_question
+
+    def __chat_history_str(self):
+        """Format the chat history the way the conversational chain does, within the history token budget."""
+        return self.history_window.format(self.chat_history)
+
+    def __fold_history(self, trace):
+        """Fold the oldest turns of the chat history into its summary when they exceed the budget."""
+        if not self.conversational:
+            return
+        with trace.span("summarize_history"):
+            folded = self.history_window.fold(self.chat_history)
+        if folded:
+            trace.set(history_turns_folded=folded)
+
+    async def __afold_history(self, trace):
+        """Asynchronous version of __fold_history."""
+        if not self.conversational:
+            return
+        with trace.span("summarize_history"):
+            folded = await self.history_window.afold(self.chat_history)
+        if folded:
+            trace.set(history_turns_folded=folded)
+
+    def __searches_vector_store(self):
+        """Whether retrieval is a plain similarity search of the vector store (embedding, then search)."""
+        return (
+            self.vector_store is not None
+            and getattr(self.retriever, "search_type", None) == "similarity"
+        )
+
+    def __retrieve(self, question, trace, embedding=None):
+        """Retrieve the document chunks relevant to a standalone question (with its embedding, if known)."""
+        if not self.__searches_vector_store():
+            with trace.span("search"):
+                return self.qa_chain.retriever.get_relevant_documents(question)
+        k = self.retriever.search_kwargs.get("k", 4)
+        filter = self.retriever.search_kwargs.get("filter")
+        if embedding is None:
+            with trace.span("embed_query"):
+                embedding = self.vector_store.embeddings.embed_query(question)
+        with trace.span("search"):
+            return self.vector_store.similarity_search_by_vector(
+                embedding, k=k, filter=filter
+            )
+
+    async def __aretrieve(self, question, trace, embedding=None):
+        """Asynchronous version of __retrieve."""
+        if not self.__searches_vector_store():
+            with trace.span("search"):
+                return await self.qa_chain.retriever.aget_relevant_documents(question)
+        # langchain's async retrieval runs the synchronous search in a thread; the vector store
+        # embeds the query with the async API instead.
+        k = self.retriever.search_kwargs.get("k", 4)
+        filter = self.retriever.search_kwargs.get("filter")
+        if embedding is None:
+            with trace.span("embed_query"):
+                embedding = await self.vector_store.embeddings.aembed_query(question)
+        with trace.span("search"):
+            return await self.vector_store.asimilarity_search_by_vector(
+                embedding, k=k, filter=filter
+            )
+
+    def __combine_docs_chain(self):
+        """Return the StuffDocumentsChain that puts the document chunks in the answer prompt."""
         if self.conversational:
-            answer = self.qa_chain(
-                {"question": question, "chat_history": self.chat_history}
+            return self.qa_chain.combine_docs_chain
+        return self.qa_chain.combine_documents_chain
+
+    def __pack(self, docs, trace):
+        """Keep the most relevant document chunks that fit in the context token budget of the LLM."""
+        if self.context_budget is None:
+            return docs
+        with trace.span("pack"):
+            packed = pack_documents(
+                docs,
+                self.context_budget,
+                model=self.llm_model,
+                document_prompt=self.__combine_docs_chain().document_prompt,
+                separator=self.__combine_docs_chain().document_separator,
             )
-            self.chat_history.append((question, answer["answer"]))
+        trace.set(documents=len(packed), documents_dropped=len(docs) - len(packed))
+        return packed
+
+    def __prompt(self, question, docs):
+        """Build the answer prompt the same way StuffDocumentsChain does.
+
+        Returns:
+            tuple: (LLM to send the prompt to, PromptValue)
+        """
+        combine_docs_chain = self.__combine_docs_chain()
+        if self.conversational:
+            inputs = {"question": question, "chat_history": self.__chat_history_str()}
         else:
-            answer = self.qa_chain(question)
+            inputs = {"question": question}
+        llm_chain = combine_docs_chain.llm_chain
+        prompt = llm_chain.prompt.format_prompt(
+            **_stuff_prompt_inputs(combine_docs_chain, docs, **inputs)
+        )
+        return llm_chain.llm, prompt
 
-            self.chat_history.append((question, answer["result"]))
+    def __generate(self, question, docs, trace):
+        """Generate the answer to a standalone question from the retrieved document chunks."""
+        with trace.span("prompt"):
+            llm, prompt = self.__prompt(question, docs)
+        with trace.span("llm"):
+            result = llm.generate_prompt([prompt])
+        answer = result.generations[0][0].text
+        self.__count_tokens(trace, prompt, answer, result.llm_output)
+        return answer
 
+    async def __agenerate(self, question, docs, trace):
+        """Asynchronous version of __generate."""
+        with trace.span("prompt"):
+            llm, prompt = self.__prompt(question, docs)
+        with trace.span("llm"):
+            result = await llm.agenerate_prompt([prompt])
+        answer = result.generations[0][0].text
+        self.__count_tokens(trace, prompt, answer, result.llm_output)
         return answer
 
+    def __generate_stream(self, question, docs, trace):
+        """Generate the answer to a standalone question, yielding tokens as the LLM returns them."""
+        with trace.span("prompt"):
+            llm, prompt = self.__prompt(question, docs)
+        tokens = []
+        # The span also covers the time the caller takes to consume each token.
+        with trace.span("llm"):
+            for chunk in llm.stream(prompt):
+                if not tokens:
+                    trace.set(first_token_ms=round(1000 * trace.elapsed(), 3))
+                token = chunk if isinstance(chunk, str) else chunk.content
+                tokens.append(token)
+                yield token
+        self.__count_tokens(trace, prompt, "".join(tokens))
+
+    def __count_tokens(self, trace, prompt, answer, llm_output=None):
+        """Record the prompt and completion tokens, as reported by the API or counted locally."""
+        usage = (llm_output or {}).get("token_usage") or {}
+        trace.set(
+            prompt_tokens=usage.get("prompt_tokens")
+            or count_tokens(prompt.to_string(), self.llm_model),
+            completion_tokens=usage.get("completion_tokens")
+            or count_tokens(answer, self.llm_model),
+        )
+
+    def __answer_namespace(self):
+        """Return the answer cache namespace of this chat, or None if answers cannot be cached.
+
+        The namespace covers everything the answer depends on besides the question. It is a (scope,
+        version) pair: the scope covers the vector store folder, the retrieval, the QA prompt, the chat
+        mode and the LLM settings, the version the contents of the vector store, so the answer cache drops
+        the answers of the previous contents once they change.
+        """
+        if self.answer_cache is None or self.vector_store is None:
+            return None
+        fingerprint = self.vector_store.fingerprint()
+        if fingerprint is None:
+            return None
+        scope = "\0".join(
+            [
+                str(getattr(self.vector_store, "folder_path", None)),
+                self.qa_prompt,
+                str(self.conversational),
+                str(getattr(self.retriever, "search_type", None)),
+                str(getattr(self.retriever, "search_kwargs", None)),
+                str(self.llm_model),
+                str(self.temperature),
+                str(self.context_budget),
+            ]
+        )
+        return hashlib.sha256(scope.encode("utf-8")).hexdigest(), fingerprint
+
+    def __answer_cache_key(self, question, trace):
+        """Return the (namespace, embedding) of a standalone question for the answer cache, or None."""
+        try:
+            namespace = self.__answer_namespace()
+            if namespace is None:
+                return None
+            # Served from the query embedding cache when retrieval embeds the same question.
+            with trace.span("embed_query"):
+                vector = self.vector_store.embeddings.embed_query(question)
+            return namespace, vector
+        except Exception as e:
+            logging.error(f"Failed to create answer cache key: {e}")
+            return None
+
+    async def __aanswer_cache_key(self, question, trace):
+        """Asynchronous version of __answer_cache_key."""
+        try:
+            namespace = self.__answer_namespace()
+            if namespace is None:
+                return None
+            with trace.span("embed_query"):
+                vector = await self.vector_store.embeddings.aembed_query(question)
+            return namespace, vector
+        except Exception as e:
+            logging.error(f"Failed to create answer cache key: {e}")
+            return None
+
+    def __cached_answer(self, cache_key, trace):
+        """Return the cached (answer, source documents) for a cache key, or None."""
+        if cache_key is None:
+            return None
+        with trace.span("answer_cache"):
+            cached = self.answer_cache.get(*cache_key)
+        trace.set(answer_cache_hit=cached is not None)
+        if cached is not None:
+            logging.info(f"Answer cache hit: {self.answer_cache.stats()}")
+        return cached
+
+    def __cache_answer(self, cache_key, question, answer, docs):
+        """Store an answer and its source documents in the answer cache."""
+        if cache_key is None:
+            return
+        namespace, vector = cache_key
+        self.answer_cache.put(namespace, question, vector, (answer, list(docs)))
+
     # DEPRECATED - switched to Streamlit
     def gradio_chat(self, message, history):
         """Method for Gradio's ChatInterface chatbot UI. DEPRECATED as the application now uses Streamlit for the UI."""
@@ -0,0 +1,112 @@
+"""Module for deciding whether a follow-up question must be condensed before retrieval.
+
+In conversational mode a follow-up question is normally rephrased by the LLM into a standalone question
+using the chat history, which costs a full LLM round trip. This module provides the is_standalone
+heuristic, which recognizes questions that already stand on their own so that round trip can be skipped,
+and question_similarity, which compares the embeddings of a follow-up question and its condensed version.
+"""
+import re
+
+import numpy as np
+
+# Words that refer back to something said earlier in the conversation.
+REFERRING_WORDS = {
+    "it",
+    "its",
+    "itself",
+    "they",
+    "them",
+    "their",
+    "theirs",
+    "themselves",
+    "he",
+    "him",
+    "his",
+    "she",
+    "her",
+    "hers",
+    "this",
+    "these",
+    "those",
+    "former",
+    "latter",
+    "above",
+    "aforementioned",
+    "previous",
+    "previously",
+    "earlier",
+    "same",
+    "such",
+    "else",
+    "again",
+}
+# Openings of elliptical follow-ups, e.g. "And for children?" or "What about the dose?".
+FOLLOW_UP_OPENINGS = (
+    "and",
+    "but",
+    "or",
+    "so",
+    "also",
+    "then",
+    "what about",
+    "how about",
+    "what if",
+    "why",
+    "how come",
+    "which one",
+    "more",
+    "tell me more",
+    "elaborate",
+    "explain",
+    "continue",
+    "go on",
+)
+# Shorter questions are almost always elliptical ("Why not?", "Any side effects?").
+MIN_STANDALONE_WORDS = 5
+
+
+def is_standalone(question):
+    """Check whether a follow-up question can be answered without the chat history.
+
+    The check is conservative: a question is only considered standalone if it is long enough, does not
+    start like an elliptical follow-up and contains no word that refers back to the conversation.
+    Misses only cost the usual condensing round trip.
+
+    Args:
+        question (str): The user's follow-up question.
+
+    Returns:
+        bool: True if the question can be used as is for retrieval.
+    """
+    words = re.findall(r"[a-z']+", question.lower())
+    if len(words) < MIN_STANDALONE_WORDS:
+        return False
+    opening = " ".join(words[:3])
+    if any(
+        opening == start or opening.startswith(start + " ")
+        for start in FOLLOW_UP_OPENINGS
+    ):
+        return False
+    return not any(word.split("'")[0] in REFERRING_WORDS for word in words)
+
+
+def question_similarity(embedding, other):
+    """Measure how similar two phrasings of a question are, from their query embeddings.
+
+    Used to decide whether documents retrieved for the raw follow-up question are good enough for its
+    condensed, standalone version. Unlike shared words, embeddings also match rephrasings that resolve a
+    reference ("its side effects" -> "the side effects of venetoclax").
+
+    Args:
+        embedding (list): Query embedding of a question.
+        other (list): Query embedding of another question.
+
+    Returns:
+        float: Cosine similarity of the embeddings (0 if either is a zero vector).
+    """
+    embedding = np.asarray(embedding, dtype=np.float32)
+    other = np.asarray(other, dtype=np.float32)
+    norms = float(np.linalg.norm(embedding) * np.linalg.norm(other))
+    if norms == 0:
+        return 0.0
+    return float(np.dot(embedding, other)) / norms
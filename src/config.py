@@ -41,6 +41,22 @@ class Config:
         if env_path:
             load_dotenv(env_path)
 
+    def with_overrides(self, **values):
+        """Get a copy of the configuration with some values replaced.
+
+        The shared instance is left unchanged, so overrides for one run (e.g. offline fakes in an
+        evaluation) do not leak into other users of the configuration.
+
+        Args:
+            **values: Configuration keys and their new values.
+
+        Returns:
+            Config: A separate configuration object with the overridden values.
+        """
+        overridden = object.__new__(Config)
+        overridden.config = {**self.config, **values}
+        return overridden
+
     # Below are properties that provide access to specific configuration values.
     @property
     def debug(self):
@@ -62,6 +78,146 @@ class Config:
     def chunk_overlap(self):
         return self.config.get("chunk_overlap")
 
+    @property
+    def ingest_workers(self):
+        return self.config.get("ingest_workers")
+
+    @property
+    def embedding_workers(self):
+        return self.config.get("embedding_workers")
+
+    @property
+    def ingest_queue_size(self):
+        return self.config.get("ingest_queue_size")
+
+    @property
+    def embedding_model(self):
+        return self.config.get("embedding_model")
+
+    @property
+    def embedding_params(self):
+        return self.config.get("embedding_params")
+
+    @property
+    def embedding_cache(self):
+        return self.config.get("embedding_cache")
+
+    @property
+    def embedding_cache_path(self):
+        return self.config.get("embedding_cache_path")
+
+    @property
+    def embedding_cache_size(self):
+        return self.config.get("embedding_cache_size")
+
+    @property
+    def query_cache(self):
+        return self.config.get("query_cache")
+
+    @property
+    def query_cache_size(self):
+        return self.config.get("query_cache_size")
+
+    @property
+    def query_cache_ttl(self):
+        return self.config.get("query_cache_ttl")
+
+    @property
+    def query_cache_path(self):
+        return self.config.get("query_cache_path")
+
+    @property
+    def docstore_format(self):
+        return self.config.get("docstore_format")
+
+    @property
+    def sharded_index(self):
+        return self.config.get("sharded_index")
+
+    @property
+    def max_loaded_shards(self):
+        return self.config.get("max_loaded_shards")
+
+    @property
+    def search_workers(self):
+        return self.config.get("search_workers")
+
+    @property
+    def lexical_search(self):
+        return self.config.get("lexical_search")
+
+    @property
+    def search_mode(self):
+        return self.config.get("search_mode")
+
+    @property
+    def hybrid_search(self):
+        return self.config.get("hybrid_search")
+
+    @property
+    def mmap_index(self):
+        return self.config.get("mmap_index")
+
+    @property
+    def vector_store(self):
+        value = self.config.get("vector_store") or {}
+        # Older configurations name the vector store directly, e.g. "vector_store: FAISS".
+        if isinstance(value, str):
+            return {"name": value}
+        return value
+
+    @property
+    def stream_answers(self):
+        return self.config.get("stream_answers")
+
+    @property
+    def answer_cache(self):
+        return self.config.get("answer_cache")
+
+    @property
+    def answer_cache_threshold(self):
+        return self.config.get("answer_cache_threshold")
+
+    @property
+    def answer_cache_size(self):
+        return self.config.get("answer_cache_size")
+
+    @property
+    def context_token_budget(self):
+        return self.config.get("context_token_budget")
+
+    @property
+    def condense_llm_model(self):
+        return self.config.get("condense_llm_model")
+
+    @property
+    def condense_heuristic(self):
+        return self.config.get("condense_heuristic")
+
+    @property
+    def condense_cache_size(self):
+        return self.config.get("condense_cache_size")
+
+    @property
+    def speculative_retrieval(self):
+        return self.config.get("speculative_retrieval")
+
+    @property
+    def speculative_similarity(self):
+        return self.config.get("speculative_similarity")
+
+    @property
+    def history_token_budget(self):
+        return self.config.get("history_token_budget")
+
+    @property
+    def history_summary(self):
+        return self.config.get("history_summary")
+
+    @property
+    def history_summary_tokens(self):
+        return self.config.get("history_summary_tokens")
+
     @property
     def temperature(self):
         return self.config.get("temperature")
@@ -106,6 +262,18 @@ class Config:
     def doc_retrieval_log_level(self):
         return self.config.get("doc_retrieval_log_level")
 
+    @property
+    def log_metrics(self):
+        return self.config.get("log_metrics")
+
+    @property
+    def metrics_log_file_name(self):
+        return self.config.get("metrics_log_file_name")
+
+    @property
+    def metrics_port(self):
+        return self.config.get("metrics_port")
+
     def get_config_value(self, key):
         """Get configuration value from key name (e.g. filename)."""
         return self.config.get(key)
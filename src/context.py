@@ -0,0 +1,82 @@
+"""Module for fitting retrieved document chunks into the context token budget of the LLM.
+
+This module provides the pack_documents function, which keeps the most relevant document chunks that fit
+in a token budget and trims or drops the rest, and context_budget, which looks up the budget of a model
+in the configuration. Fewer context tokens means cheaper, faster completions, and a budget per model keeps
+the prompt within smaller models' context windows.
+"""
+import logging
+
+from langchain.schema import Document, format_document
+
+from src.utils import count_tokens, truncate_tokens
+
+
+def context_budget(budgets, model):
+    """Get the context token budget of a model.
+
+    Args:
+        budgets (int/dict): A budget for every model, or budgets by model name with an optional
+            "default" entry (e.g. {"gpt-4": 2000, "default": 1500}).
+        model (str): The LLM model name.
+
+    Returns:
+        int: The budget in tokens, or None if the context is not limited.
+    """
+    if isinstance(budgets, dict):
+        return budgets.get(model, budgets.get("default"))
+    return budgets
+
+
+def pack_documents(
+    documents,
+    max_tokens,
+    model="gpt-4",
+    document_prompt=None,
+    separator="\n\n",
+    min_trim_tokens=100,
+):
+    """Keep the most relevant document chunks that fit in a token budget.
+
+    Documents are expected most relevant first, the order in which the similarity search returns them.
+    They are kept in order while they fit. The first one that does not fit is trimmed to the remaining
+    budget if at least min_trim_tokens are left, and it and all the less relevant ones after it are
+    dropped otherwise.
+
+    Args:
+        documents (list): Retrieved document chunks, most relevant first.
+        max_tokens (int): Token budget of the context, or None to keep every chunk.
+        model (str): The LLM model name, selects the tokenizer.
+        document_prompt (PromptTemplate, optional): Prompt each chunk is formatted with in the context.
+        separator (str): Text between two chunks in the context.
+        min_trim_tokens (int): Minimum size of a trimmed chunk; smaller remainders are dropped.
+
+    Returns:
+        list: The document chunks to put in the context, the last one possibly trimmed.
+    """
+    if max_tokens is None:
+        return list(documents)
+    separator_tokens = count_tokens(separator, model)
+    packed = []
+    remaining = max_tokens
+    for doc in documents:
+        text = format_document(doc, document_prompt) if document_prompt else None
+        tokens = count_tokens(text or doc.page_content, model)
+        if packed:
+            remaining -= separator_tokens
+        if tokens <= remaining:
+            packed.append(doc)
+            remaining -= tokens
+            continue
+        # Formatting overhead of the chunk (e.g. "Content: ...\nSource: ...") is not trimmable.
+        overhead = tokens - count_tokens(doc.page_content, model)
+        if remaining - overhead >= min_trim_tokens:
+            content = truncate_tokens(doc.page_content, remaining - overhead, model)
+            packed.append(Document(page_content=content, metadata=doc.metadata))
+        break
+    if len(packed) < len(documents):
+        logging.info(
+            f"Context packed into {max_tokens} tokens: kept {len(packed)} of "
+            f"{len(documents)} chunks"
+        )
+    return packed
@@ -0,0 +1,272 @@
+"""Module for storing document chunks in a columnar, memory-mappable file.
+
+This module provides the ColumnarDocstore class, a langchain docstore backed by an Arrow IPC file with one
+row per chunk, and the RowIdMap class which serves FAISS positions to chunk IDs from the same file. Loading
+memory-maps the file instead of unpickling every chunk, and a search only decodes the rows it returns.
+"""
+import os
+import json
+from collections.abc import MutableMapping
+
+import pyarrow as pa
+from langchain.docstore.base import AddableMixin, Docstore
+from langchain.schema import Document
+
+SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("page_content", pa.large_string()),
+        ("source", pa.string()),
+        ("page", pa.int64()),
+        ("metadata", pa.string()),
+    ]
+)
+
+
+class RowId(str):
+    """Chunk ID that remembers the row of the chunk in the docstore file."""
+
+    __slots__ = ("row",)
+
+    def __new__(cls, value, row):
+        obj = super().__new__(cls, value)
+        obj.row = row
+        return obj
+
+
+def _to_table(ids, documents):
+    """Build an Arrow table in the docstore schema from chunk IDs and documents."""
+    pages = [doc.metadata.get("page") for doc in documents]
+    return pa.Table.from_pydict(
+        {
+            "id": list(ids),
+            "page_content": [doc.page_content for doc in documents],
+            "source": [
+                None
+                if doc.metadata.get("source") is None
+                else str(doc.metadata["source"])
+                for doc in documents
+            ],
+            "page": [page if isinstance(page, int) else None for page in pages],
+            "metadata": [json.dumps(doc.metadata) for doc in documents],
+        },
+        schema=SCHEMA,
+    )
+
+
+class ColumnarDocstore(Docstore, AddableMixin):
+    """Docstore backed by a (memory-mapped) Arrow table with one row per document chunk.
+
+    The table loaded from disk is never modified. Added chunks are kept in memory and deleted chunks are
+    only marked, until the docstore is written out again.
+
+    Attributes:
+    - table (pyarrow.Table): Chunks loaded from disk (id, page_content, source, page, metadata).
+    - added (dict): Chunks added since loading, by ID.
+    - deleted (set): IDs of chunks deleted since loading.
+    """
+
+    def __init__(self, table=None):
+        self.table = table if table is not None else SCHEMA.empty_table()
+        self.added = {}
+        self.deleted = set()
+        self._rows = None
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a docstore file written by ColumnarDocstore.write.
+
+        Args:
+            path (str): Path to the Arrow IPC file.
+
+        Returns:
+            ColumnarDocstore: Docstore reading rows directly from the mapped file.
+        """
+        source = pa.memory_map(path, "r")
+        return cls(pa.ipc.open_file(source).read_all())
+
+    @staticmethod
+    def write(path, docstore, ids):
+        """Write the chunks of any docstore to an Arrow IPC file, in the given ID order.
+
+        The file is written to a temporary file first and then replaces the current one, which may be
+        memory-mapped by the docstore being written. Docstores loaded from the old file stay valid, but
+        should be reloaded to see the new one.
+
+        Args:
+            path (str): Path to the Arrow IPC file.
+            docstore (Docstore): Docstore holding the chunks.
+            ids (list): Chunk IDs in FAISS index order.
+        """
+        if isinstance(docstore, ColumnarDocstore):
+            table = docstore.__ordered_table(ids)
+        else:
+            table = _to_table(ids, [docstore.search(_id) for _id in ids])
+        tmp_path = f"{path}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, SCHEMA) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    def __ordered_table(self, ids):
+        """Return the stored chunks as one table in the given ID order, without decoding any text."""
+        added_ids = list(self.added)
+        combined = pa.concat_tables(
+            [self.table, _to_table(added_ids, list(self.added.values()))]
+        )
+        added_rows = {_id: self.table.num_rows + i for i, _id in enumerate(added_ids)}
+        rows = [
+            added_rows[_id] if _id in added_rows else self.__row(_id) for _id in ids
+        ]
+        return combined.take(pa.array(rows, type=pa.int64()))
+
+    def __row(self, _id):
+        """Return the table row of a stored chunk ID, or None."""
+        if isinstance(_id, RowId):
+            return _id.row
+        if self._rows is None:
+            self._rows = {
+                value: row
+                for row, value in enumerate(self.table.column("id").to_pylist())
+            }
+        return self._rows.get(_id)
+
+    def take(self, row):
+        """Decode a single table row into a Document.
+
+        Args:
+            row (int): Row of the chunk in the table.
+
+        Returns:
+            Document: The chunk.
+        """
+        record = self.table.slice(row, 1).to_pylist()[0]
+        return Document(
+            page_content=record["page_content"], metadata=json.loads(record["metadata"])
+        )
+
+    def search(self, search):
+        """Search via direct lookup.
+
+        Args:
+            search: id of a document to search for.
+
+        Returns:
+            Document if found, else error message.
+        """
+        if search in self.added:
+            return self.added[search]
+        if search not in self.deleted:
+            row = self.__row(search)
+            if row is not None:
+                return self.take(row)
+        return f"ID {search} not found."
+
+    def add(self, texts):
+        """Add documents to the docstore.
+
+        Args:
+            texts: dictionary of id -> document.
+        """
+        overlapping = {
+            _id
+            for _id in texts
+            if _id in self.added
+            or (_id not in self.deleted and self.__row(_id) is not None)
+        }
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self.added.update(texts)
+
+    def delete(self, ids):
+        """Delete documents from the docstore by ID."""
+        for _id in ids:
+            if self.added.pop(_id, None) is None:
+                self.deleted.add(str(_id))
+
+    def source_index(self, ids):
+        """Map each document source to the IDs of its chunks.
+
+        Reads only the id and source columns, so no chunk text is decoded.
+
+        Args:
+            ids (iterable): Chunk IDs currently in the index.
+
+        Returns:
+            dict: Source -> set of chunk IDs.
+        """
+        sources = self.table.column("source").to_pylist()
+        index = {}
+        for _id in ids:
+            if _id in self.added:
+                source = self.added[_id].metadata.get("source")
+            else:
+                source = sources[self.__row(_id)]
+            index.setdefault(source, set()).add(_id)
+        return index
+
+    def metadatas(self, ids):
+        """Get the metadata of chunks, in the given ID order.
+
+        Reads only the metadata column, so no chunk text is decoded.
+
+        Args:
+            ids (iterable): Chunk IDs.
+
+        Returns:
+            list: Metadata dict of each chunk.
+        """
+        column = self.table.column("metadata")
+        return [
+            self.added[_id].metadata
+            if _id in self.added
+            else json.loads(column[self.__row(_id)].as_py())
+            for _id in ids
+        ]
+
+
+class RowIdMap(MutableMapping):
+    """FAISS position -> chunk ID mapping read from the id column of a ColumnarDocstore.
+
+    Positions of the loaded file are served from the Arrow column as RowId values, so they can be looked
+    up in the docstore without an ID -> row dictionary. Positions added later are kept in a dict.
+
+    Attributes:
+    - ids (pyarrow.ChunkedArray): id column of the docstore table.
+    - overrides (dict): Positions added or changed since loading.
+    - removed (set): Positions removed since loading.
+    """
+
+    def __init__(self, docstore):
+        self.ids = docstore.table.column("id")
+        self.overrides = {}
+        self.removed = set()
+
+    def __getitem__(self, position):
+        if position in self.overrides:
+            return self.overrides[position]
+        if position in self.removed or not 0 <= position < len(self.ids):
+            raise KeyError(position)
+        return RowId(self.ids[position].as_py(), position)
+
+    def __setitem__(self, position, value):
+        self.removed.discard(position)
+        self.overrides[position] = value
+
+    def __delitem__(self, position):
+        if position in self.overrides:
+            del self.overrides[position]
+        elif 0 <= position < len(self.ids):
+            self.removed.add(position)
+        else:
+            raise KeyError(position)
+
+    def __iter__(self):
+        for position in range(len(self.ids)):
+            if position not in self.removed and position not in self.overrides:
+                yield position
+        yield from self.overrides
+
+    def __len__(self):
+        base = len(self.ids) - len(self.removed)
+        return base + sum(1 for p in self.overrides if not 0 <= p < len(self.ids))
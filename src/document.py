@@ -3,16 +3,48 @@
 This module provides the Document class which represents a document and offers functionalities to load, split, 
 and access its content.
 """
-import uuid
+import hashlib
 import logging
 
+import pypdf
 from langchain.document_loaders import OnlinePDFLoader, PyPDFLoader
+from langchain.schema import Document as Page
 from langchain.text_splitter import (
     RecursiveCharacterTextSplitter,
     CharacterTextSplitter,
 )
 
 
+def chunk_ids(chunks):
+    """Create deterministic IDs for document chunks.
+
+    Each ID is a SHA-256 hash of the chunk's source, page and content, so the same chunk always gets
+    the same ID. Identical chunks on the same page are told apart by their occurrence number.
+
+    Args:
+        chunks (list): Document chunks.
+
+    Returns:
+        list: IDs for document chunks (content hash)
+    """
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        key = "\0".join(
+            [
+                str(chunk.metadata.get("source", "")),
+                str(chunk.metadata.get("page", "")),
+                chunk.page_content,
+            ]
+        )
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        if occurrence:
+            key = f"{key}\0{occurrence}"
+        ids.append(hashlib.sha256(key.encode("utf-8")).hexdigest())
+    return ids
+
+
 class Document:
     """Class to represent and manage a document.
 
@@ -26,19 +58,67 @@ class Document:
         chunk_overlap (int): Number of overlapping characters between chunks.
         document (str): Loaded content of the document.
         split_document (list): List of document chunks after splitting.
-        split_document_ids (list): List of unique IDs for each chunk.
+        split_document_ids (list): List of deterministic IDs for each chunk.
+        streaming (bool): If True, nothing is loaded up front and chunks are produced lazily by stream_chunks().
+        source (str): Source recorded in the chunk metadata and IDs (e.g. the original name of an uploaded
+            file stored under a temporary path), or None for the document path.
     """
 
     def __init__(
-        self, document_path, split_method="recursive", chunk_size=1000, chunk_overlap=10
+        self,
+        document_path,
+        split_method="recursive",
+        chunk_size=1000,
+        chunk_overlap=10,
+        streaming=False,
+        source=None,
     ):
         self.document_path = document_path
+        self.source = source
         self.split_method = split_method
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.document = self.__load()
-        self.split_document = self.__split()
-        self.split_document_ids = self.__create_ids()
+        self.streaming = streaming
+        if streaming:
+            # Nothing is loaded up front; chunks are produced on demand by stream_chunks().
+            self.document = None
+            self.split_document = []
+            self.split_document_ids = []
+        else:
+            self.document = self.__load()
+            self.split_document = self.__split()
+            self.split_document_ids = self.__create_ids()
+
+    def __loader(self):
+        """Create the document loader for the provided path.
+
+        Returns:
+            BaseLoader: Loader for the document.
+        """
+        if self.document_path.startswith("http"):
+            return OnlinePDFLoader(self.document_path)
+        elif self.document_path.endswith(".pdf"):
+            return PyPDFLoader(self.document_path)
+        else:
+            raise ValueError(f"Invalid document path: {self.document_path}")
+
+    def __splitter(self):
+        """Create the text splitter for the specified split method.
+
+        Returns:
+            TextSplitter: Either RecursiveCharacterTextSplitter or CharacterTextSplitter.
+        """
+        if self.split_method == "recursive":
+            # TODO: implement a way to add the characters e.g. \n \t etc
+            return RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+            )
+        elif self.split_method == "character":
+            return CharacterTextSplitter(
+                chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+            )
+        else:
+            raise ValueError(f"Invalid split_method: {self.split_method}")
 
     def __load(self):
         """Load the document content from the provided path.
@@ -47,14 +127,9 @@ class Document:
             str: Loaded content of the document.
         """
         try:
-            if self.document_path.startswith("http"):
-                loader = OnlinePDFLoader(self.document_path)
-            elif self.document_path.endswith(".pdf"):
-                loader = PyPDFLoader(self.document_path)
-            else:
-                raise ValueError(f"Invalid document path: {self.document_path}")
+            loader = self.__loader()
             logging.info(f"Document loaded: {self.document_path}")
-            return loader.load()
+            return [self.__with_source(page) for page in loader.load()]
         except Exception as e:
             logging.error(f"Failed to load document: {e}")
             return None
@@ -69,29 +144,89 @@ class Document:
             list: List of document chunks after splitting.
         """
         try:
-            if self.split_method == "recursive":
-                # TODO: implement a way to add the characters e.g. \n \t etc
-                splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
-                )
-            elif self.split_method == "character":
-                splitter = CharacterTextSplitter(
-                    chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
-                )
-            else:
-                raise ValueError(f"Invalid split_method: {self.split_method}")
+            splitter = self.__splitter()
             return splitter.split_documents(self.document)
         except Exception as e:
             logging.error(f"Failed to split document: {e}")
             return []
 
+    def __with_source(self, page):
+        """Record the source of the document in the metadata of a page, if it was given."""
+        if self.source is not None:
+            page.metadata["source"] = self.source
+        return page
+
+    def __lazy_pages(self, loader):
+        """Yield the pages of the document one at a time."""
+        if isinstance(loader, PyPDFLoader):
+            # PyPDFLoader and PyPDFParser.lazy_parse (langchain 0.0.261) extract the text of every page
+            # into a list before yielding, so pages are read with pypdf directly, one at a time. The
+            # text and metadata are the same as PyPDFLoader's.
+            with open(loader.file_path, "rb") as f:
+                for page_number, page in enumerate(pypdf.PdfReader(f).pages):
+                    yield Page(
+                        page_content=page.extract_text(),
+                        metadata={"source": loader.file_path, "page": page_number},
+                    )
+        else:
+            try:
+                yield from loader.lazy_load()
+            except NotImplementedError:
+                yield from loader.load()
+
+    def stream_chunks(self):
+        """Lazily load and split the document page by page.
+
+        Only the current page and its chunks are held in memory, regardless of document size. Chunks and
+        IDs are the same as those produced by the non-streaming mode.
+
+        Yields:
+            tuple: (document chunk, chunk ID)
+
+        Raises:
+            Exception: Any error reading or splitting the document, after the chunks of the preceding
+                pages were yielded, so callers can discard the partial document.
+        """
+        try:
+            loader = self.__loader()
+            splitter = self.__splitter()
+            for page in self.__lazy_pages(loader):
+                chunks = splitter.split_documents([self.__with_source(page)])
+                yield from zip(chunks, chunk_ids(chunks))
+            logging.info(f"Document streamed: {self.document_path}")
+        except Exception as e:
+            logging.error(f"Failed to stream document: {e}")
+            raise
+
+    def stream_batches(self, batch_size=64):
+        """Lazily load and split the document in batches of chunks.
+
+        Batches can be passed straight to VectorStore.add_doc_batches so peak memory during ingestion
+        is bounded by the batch size rather than the document size.
+
+        Args:
+            batch_size (int): Maximum number of chunks per batch.
+
+        Yields:
+            tuple: (list of document chunks, list of chunk IDs)
+        """
+        chunks, ids = [], []
+        for chunk, _id in self.stream_chunks():
+            chunks.append(chunk)
+            ids.append(_id)
+            if len(chunks) >= batch_size:
+                yield chunks, ids
+                chunks, ids = [], []
+        if chunks:
+            yield chunks, ids
+
     def __create_ids(self):
         """Creates IDs for document chunks.
 
         Returns:
-            list: IDs for document chunks (UUID4)
+            list: IDs for document chunks (content hash)
         """
-        return [str(uuid.uuid4()) for _ in self.split_document]
+        return chunk_ids(self.split_document)
 
     def get_document(self):
         """Get full document.
@@ -115,7 +250,7 @@ class Document:
         """Returns list of document chunk ids.
 
         Returns:
-            list: IDs for document chunks (UUID4)
+            list: IDs for document chunks (content hash)
         """
         return self.split_document_ids
 
@@ -0,0 +1,140 @@
+"""Module for selecting the embeddings backend of the vector store by name.
+
+This module provides the embeddings registry, which maps the embedding_model names of the configuration
+to the classes creating them (register_embeddings, create_embeddings), and the HashingEmbeddings class, a
+local CPU backend that needs no API calls or downloads. It hashes the character n-grams of a whole batch
+of texts at once with NumPy, so large corpora can be embedded at local CPU throughput and indexes can be
+built and tested offline.
+"""
+import re
+import asyncio
+
+import numpy as np
+from langchain.embeddings import OpenAIEmbeddings
+from langchain.embeddings.base import Embeddings
+
+from src.fakes import FakeEmbeddings
+
+# 64-bit FNV-1a hash of the n-grams.
+FNV_OFFSET = np.uint64(14695981039346656037)
+FNV_PRIME = np.uint64(1099511628211)
+# Runs of characters other than letters and digits (of any script), collapsed to one space before hashing.
+SEPARATOR_PATTERN = re.compile(r"[\W_]+")
+
+# embedding_model name -> callable creating the embeddings from the embedding_params.
+EMBEDDINGS = {}
+
+
+def register_embeddings(name, factory):
+    """Make an embeddings backend selectable as embedding_model in the configuration.
+
+    Args:
+        name (str): Name of the backend.
+        factory (callable): Called with the embedding_params as keyword arguments, returns an Embeddings.
+    """
+    EMBEDDINGS[name] = factory
+
+
+def create_embeddings(name, **params):
+    """Create the embeddings backend registered under a name.
+
+    Args:
+        name (str): Name of the backend (e.g. "OpenAIEmbeddings" or "HashingEmbeddings").
+        **params: Arguments of the backend.
+
+    Returns:
+        Embeddings: The embeddings.
+    """
+    if name not in EMBEDDINGS:
+        raise ValueError(f"Invalid embeddings model: {name}")
+    return EMBEDDINGS[name](**params)
+
+
+class HashingEmbeddings(Embeddings):
+    """Local embeddings from hashed character n-grams, computed on the CPU with NumPy.
+
+    Texts are lowercased and every run of other characters than letters and digits becomes one space.
+    Each character n-gram is hashed into one of ``size`` buckets with a random sign, term counts are
+    damped (sign(x) * log(1 + |x|)) and vectors are normalized, so texts sharing words, word parts and
+    identifiers such as "FLT3-ITD" have similar embeddings. All n-grams of a batch are hashed with a few
+    array operations instead of one Python call each.
+
+    Attributes:
+    - size (int): Dimension of the embeddings.
+    - ngram_range (tuple): Smallest and largest n-gram length, in characters.
+    - batch_size (int): Number of texts encoded per batch.
+    - model (str): Name of the embeddings model, used in cache keys.
+    """
+
+    def __init__(self, size=1024, ngram_range=(3, 5), batch_size=256):
+        self.size = size
+        self.ngram_range = tuple(ngram_range)
+        self.batch_size = batch_size
+        self.model = f"hashing-{size}-{self.ngram_range[0]}-{self.ngram_range[1]}"
+
+    def embed_documents(self, texts):
+        vectors = [
+            self.encode(texts[start : start + self.batch_size])
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        return np.vstack(vectors).tolist() if vectors else []
+
+    def embed_query(self, text):
+        return self.encode([text])[0].tolist()
+
+    async def aembed_documents(self, texts):
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+    def encode(self, texts):
+        """Embed a batch of texts.
+
+        Args:
+            texts (list): Texts to embed.
+
+        Returns:
+            numpy.ndarray: (len(texts), size) float32 unit vectors (zero for texts without n-grams).
+        """
+        data = [
+            f" {SEPARATOR_PATTERN.sub(' ', text.lower()).strip()} ".encode("utf-8")
+            for text in texts
+        ]
+        lengths = np.fromiter((len(d) for d in data), dtype=np.int64, count=len(data))
+        ends = np.cumsum(lengths)
+        chars = np.frombuffer(b"".join(data), dtype=np.uint8).astype(np.uint64)
+        # Text and end of the text of the n-gram starting at each character.
+        text_of = np.repeat(np.arange(len(data)), lengths)
+        end_of = np.repeat(ends, lengths)
+
+        counts = np.zeros(len(data) * self.size, dtype=np.float64)
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            m = len(chars) - n + 1
+            if m <= 0:
+                continue
+            hashes = np.full(m, FNV_OFFSET, dtype=np.uint64)
+            for j in range(n):
+                hashes ^= chars[j : j + m]
+                hashes *= FNV_PRIME
+            valid = np.arange(m) + n <= end_of[:m]
+            hashes = hashes[valid]
+            # The low bits of FNV hashes mix poorly; take the bucket and sign from the high bits.
+            buckets = (hashes >> np.uint64(24)) % np.uint64(self.size)
+            signs = np.where(hashes >> np.uint64(63), 1.0, -1.0)
+            counts += np.bincount(
+                text_of[:m][valid] * self.size + buckets.astype(np.int64),
+                weights=signs,
+                minlength=len(counts),
+            )
+
+        vectors = counts.reshape(len(data), self.size).astype(np.float32)
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+
+register_embeddings("OpenAIEmbeddings", OpenAIEmbeddings)
+# Offline stand-in for evaluation runs and benchmarks
+register_embeddings("FakeEmbeddings", FakeEmbeddings)
+register_embeddings("HashingEmbeddings", HashingEmbeddings)
@@ -0,0 +1,289 @@
+"""Module for answering a file of questions in batch against a saved vector store.
+
+This module provides the BatchRunner class, which asks many questions concurrently through Chat.aask,
+checkpoints every result to a JSONL file so an interrupted run resumes without repeating (paid) calls, and
+reports per-question latency and the retrieval score of every source document. Questions are read from
+.docx, .txt, .json or .jsonl files.
+
+Usage:
+    python -m src.evaluate "files/medical/AML LLM Database Questions.docx" --db ./db --out results.jsonl
+    python -m src.evaluate questions.txt --db ./db_sample --out results.jsonl --fake --workers 16
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import zipfile
+import argparse
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from src.bootstrap import bootstrap
+from src.condense import question_similarity
+from src.metrics import metrics
+from src.prompts import CHAT_QA_PROMPT
+from src.registry import shared_chat, shared_vector_store, vector_store_options
+from src.utils import openai_session
+
+CFG_FILE = "./config/config.yaml"
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def load_questions(path):
+    """Read questions from a file.
+
+    Supported formats: .docx (every paragraph ending with a question mark), .txt (one question per line),
+    .json (list of strings or of objects with a "question" key) and .jsonl (one such value per line).
+
+    Args:
+        path (str): Path to the questions file.
+
+    Returns:
+        list: Questions, in file order.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".docx":
+        with zipfile.ZipFile(path) as docx:
+            root = ET.fromstring(docx.read("word/document.xml"))
+        paragraphs = [
+            "".join(t.text or "" for t in p.iter(f"{WORD_NAMESPACE}t")).strip()
+            for p in root.iter(f"{WORD_NAMESPACE}p")
+        ]
+        # Headings and notes are skipped, questions may end with a stray quote.
+        return [p for p in paragraphs if p.rstrip('"”').endswith("?")]
+    if extension == ".txt":
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    if extension == ".json":
+        with open(path, encoding="utf-8") as f:
+            items = json.load(f)
+    elif extension == ".jsonl":
+        with open(path, encoding="utf-8") as f:
+            items = [json.loads(line) for line in f if line.strip()]
+    else:
+        raise ValueError(f"Invalid questions file: {path}")
+    return [item["question"] if isinstance(item, dict) else item for item in items]
+
+
+def question_id(question, run=None):
+    """Return a stable ID for a question asked in a run, used to match checkpointed results.
+
+    Args:
+        question (str): The question.
+        run (dict, optional): Parameters of the run the answer depends on (vector store, models), so
+            results of runs against another vector store or model are not reused.
+
+    Returns:
+        str: Hex digest of the question and the run parameters.
+    """
+    key = question.strip()
+    if run:
+        key = f"{key}\0{json.dumps(run, sort_keys=True)}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+class BatchRunner:
+    """Class to answer questions concurrently with checkpointing.
+
+    Every question is asked as a new conversation (no chat history). Completed results are appended to
+    the checkpoint file as soon as they finish, and questions whose result for the same run parameters is
+    already in the file are skipped, so a run can be interrupted and resumed at any point. Failed
+    questions are recorded with their error and retried on the next run.
+
+    Attributes:
+    - chat (Chat): Chat whose chains are shared by all questions.
+    - checkpoint_path (str): JSONL file results are appended to.
+    - workers (int): Maximum number of questions in flight.
+    - run_params (dict): Parameters of the run (vector store, models), recorded with every result and
+      part of its question ID.
+    """
+
+    def __init__(self, chat, checkpoint_path, workers=4, run=None):
+        self.chat = chat
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.run_params = dict(run or {})
+
+    def completed(self):
+        """Get the results already in the checkpoint file.
+
+        Returns:
+            dict: Question ID -> result, for results without an error.
+        """
+        results = {}
+        if not os.path.exists(self.checkpoint_path):
+            return results
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line of an interrupted run may be incomplete.
+                    continue
+                if not result.get("error"):
+                    results[result["id"]] = result
+        return results
+
+    def run(self, questions):
+        """Answer the questions not yet in the checkpoint file.
+
+        Args:
+            questions (list): Questions to answer.
+
+        Returns:
+            list: Result of every question (including checkpointed ones), in question order.
+        """
+        return asyncio.run(self.arun(questions))
+
+    async def arun(self, questions):
+        """Asynchronous version of run."""
+        done = self.completed()
+        pending = [
+            q
+            for q in dict.fromkeys(questions)
+            if question_id(q, self.run_params) not in done
+        ]
+        logging.info(
+            f"Batch run: {len(questions)} questions, {len(questions) - len(pending)} "
+            f"already answered, {len(pending)} to run with {self.workers} workers"
+        )
+        semaphore = asyncio.Semaphore(self.workers)
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        async with openai_session(max_connections=self.workers):
+            with open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint:
+
+                async def answer(question):
+                    async with semaphore:
+                        result = await self.__answer(question)
+                    checkpoint.write(json.dumps(result) + "\n")
+                    checkpoint.flush()
+                    return result
+
+                for result in await asyncio.gather(*map(answer, pending)):
+                    done[result["id"]] = result
+        return [done.get(question_id(q, self.run_params)) for q in questions]
+
+    async def __answer(self, question):
+        """Ask one question in a new conversation and build its result record."""
+        result = {
+            "id": question_id(question, self.run_params),
+            "question": question,
+            "run": self.run_params,
+        }
+        start = time.perf_counter()
+        try:
+            response = await self.chat.with_history([]).aask(question)
+            result["latency_s"] = time.perf_counter() - start
+            result["answer"] = response.get("answer", response.get("result"))
+            docs = response["source_documents"]
+            scores = await self.__scores(question, docs)
+            result["source_documents"] = [
+                {
+                    "source": doc.metadata.get("source"),
+                    "page": doc.metadata.get("page"),
+                    "score": score,
+                    "content": doc.page_content,
+                }
+                for doc, score in zip(docs, scores)
+            ]
+        except Exception as e:
+            logging.error(f"Failed to answer question: {e}")
+            result["error"] = str(e)
+            result["latency_s"] = time.perf_counter() - start
+        return result
+
+    async def __scores(self, question, docs):
+        """Get the retrieval score of each source document: the cosine similarity of its embedding and the
+        question's.
+
+        The embeddings are served from the query and embedding caches when they are enabled, as the
+        question and chunks were embedded when they were searched and indexed.
+
+        Returns:
+            list: Score of each document, rounded to 4 digits, or None without a vector store.
+        """
+        embeddings = getattr(self.chat.vector_store, "embeddings", None)
+        if embeddings is None or not docs:
+            return [None] * len(docs)
+        query = await embeddings.aembed_query(question)
+        vectors = await embeddings.aembed_documents([doc.page_content for doc in docs])
+        return [round(question_similarity(query, vector), 4) for vector in vectors]
+
+
+def summarize(results, wall_seconds):
+    """Summarize a batch run.
+
+    Args:
+        results (list): Results returned by BatchRunner.run.
+        wall_seconds (float): Wall-clock duration of the run.
+
+    Returns:
+        dict: Number of questions and errors, latency mean and percentiles, wall time and throughput.
+    """
+    answered = [r for r in results if r and not r.get("error")]
+    latencies = np.array([r["latency_s"] for r in answered]) if answered else None
+    return {
+        "questions": len(results),
+        "answered": len(answered),
+        "errors": len(results) - len(answered),
+        "latency_mean_s": float(latencies.mean()) if answered else None,
+        "latency_p50_s": float(np.percentile(latencies, 50)) if answered else None,
+        "latency_p95_s": float(np.percentile(latencies, 95)) if answered else None,
+        "wall_s": wall_seconds,
+        "throughput_qps": len(answered) / wall_seconds if wall_seconds else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("questions", help="Questions file (.docx, .txt, .json, .jsonl)")
+    parser.add_argument("--db", required=True, help="Directory of a saved vector store")
+    parser.add_argument("--out", default="./eval/results.jsonl", help="Checkpoint file")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--prompt", default=None, help="QA prompt text")
+    parser.add_argument(
+        "--fake", action="store_true", help="Use the offline fake LLM and embeddings"
+    )
+    parser.add_argument("--fake-latency", type=float, default=0.0)
+    parser.add_argument(
+        "--metrics",
+        help="Write the per-stage metrics in Prometheus format to this file",
+    )
+    args = parser.parse_args()
+
+    cfg, _ = bootstrap(CFG_FILE)
+    options = vector_store_options(cfg)
+    if args.fake:
+        # The shared configuration is left unchanged.
+        cfg = cfg.with_overrides(llm_model="fake", fake_llm_latency=args.fake_latency)
+        options["embeddings_model"] = "FakeEmbeddings"
+        options.pop("embedding_params", None)
+    db = shared_vector_store(args.db, mmap=bool(cfg.mmap_index), **options)
+    if db is None:
+        raise SystemExit(f"Failed to load vector store: {args.db}")
+    chat = shared_chat(cfg, db, args.prompt or CHAT_QA_PROMPT)
+
+    questions = load_questions(args.questions)
+    run = {
+        "db": os.path.abspath(args.db),
+        "fingerprint": db.fingerprint(),
+        "llm_model": str(cfg.llm_model),
+        "embeddings_model": options.get("embeddings_model"),
+    }
+    runner = BatchRunner(chat, args.out, workers=args.workers, run=run)
+    start = time.perf_counter()
+    results = runner.run(questions)
+    print(json.dumps(summarize(results, time.perf_counter() - start), indent=2))
+    # Latency of each stage of the questions answered in this run.
+    print(json.dumps(metrics.summary(), indent=2))
+    if args.metrics:
+        metrics.write_prometheus(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Module for offline stand-ins of the OpenAI models.
+
+This module provides the FakeChatModel and FakeEmbeddings classes, deterministic local replacements for
+ChatOpenAI and OpenAIEmbeddings with a configurable latency. They run the whole Chat and VectorStore
+pipeline without network access or API costs, e.g. for the batch evaluation runner and benchmarks.
+Select them with ``llm_model: fake`` and ``embedding_model: FakeEmbeddings`` in the configuration.
+"""
+import re
+import time
+import asyncio
+import hashlib
+
+import numpy as np
+from langchain.chat_models.base import SimpleChatModel
+from langchain.embeddings.base import Embeddings
+from langchain.schema.messages import AIMessage, AIMessageChunk
+from langchain.schema.output import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+def _fake_answer(messages):
+    """Build a deterministic answer from the last question (or line) of the last message."""
+    content = messages[-1].content if messages else ""
+    lines = [line.strip() for line in content.splitlines() if line.strip()]
+    questions = [line for line in lines if line.endswith("?")]
+    last_line = (questions or lines or [""])[-1]
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:8]
+    return f"Fake answer {digest} to: {last_line}"
+
+
+class FakeChatModel(SimpleChatModel):
+    """Chat model that answers instantly (or after a fixed latency) with a deterministic fake answer.
+
+    The answer depends only on the prompt, so repeated runs give identical results.
+
+    Attributes:
+    - latency (float): Seconds to wait before answering, to simulate the API round trip.
+    - model_name (str): Name reported for the model.
+    """
+
+    latency: float = 0.0
+    model_name: str = "fake"
+
+    @property
+    def _llm_type(self):
+        return "fake-chat-model"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return _fake_answer(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message = AIMessage(content=_fake_answer(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        for token in re.findall(r"\S+\s*", _fake_answer(messages)):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings computed locally.
+
+    Words are hashed into ``size`` signed buckets and the result is normalized, so texts sharing words
+    have similar embeddings and retrieval results are meaningful enough for testing.
+
+    Attributes:
+    - size (int): Dimension of the embeddings (1536 matches OpenAIEmbeddings).
+    - latency (float): Seconds to wait per call, to simulate the API round trip.
+    - model (str): Name of the embeddings model, used in cache keys.
+    """
+
+    def __init__(self, size=1536, latency=0.0):
+        self.size = size
+        self.latency = latency
+        self.model = f"fake-{size}"
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16)
+            vector[digest % self.size] += 1.0 if digest & 1 << 31 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._embed(text)
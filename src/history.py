@@ -0,0 +1,158 @@
+"""Module for keeping the chat history sent to the LLM within a token budget.
+
+This module provides the ChatHistory class, the list of (question, answer) turns of a conversation along
+with a running summary of its older turns, and the HistoryWindow class, which formats the history for the
+prompts as the summary followed by the newest turns that fit in a token budget. Turns that leave the
+window are folded into the summary incrementally, a few turns at a time, so the prompt size stays flat
+however long the conversation gets. format_turns formats turns the way ConversationalRetrievalChain does.
+"""
+import logging
+
+from src.utils import count_tokens, truncate_tokens
+
+
+def format_turns(turns):
+    """Format (question, answer) turns for the prompts, one "Human:" and one "Assistant:" line each.
+
+    Same format as ConversationalRetrievalChain's default, which is not part of langchain's public API.
+
+    Args:
+        turns (list): (question, answer) tuples.
+
+    Returns:
+        str: The formatted turns, each preceded by a newline.
+    """
+    return "".join(
+        f"\nHuman: {question}\nAssistant: {answer}" for question, answer in turns
+    )
+
+
+class ChatHistory(list):
+    """Class for the (question, answer) turns of a conversation and the summary of its older turns.
+
+    It is a list, so it can be used wherever a chat history list is expected; every turn is kept for
+    display, only the prompts are limited.
+
+    Attributes:
+    - summary (str): Summary of the turns before `summarized`, or "" if there is none.
+    - summarized (int): Number of turns, from the oldest, folded into the summary.
+    """
+
+    def __init__(self, turns=()):
+        super().__init__(turns)
+        self.summary = ""
+        self.summarized = 0
+
+
+class HistoryWindow:
+    """Class to format the chat history for the prompts within a token budget.
+
+    When the turns after the summary exceed max_tokens, the oldest ones are folded into the summary until
+    only half the budget is used, so the summarizer runs once every few turns rather than on every turn.
+    Without a summarizer the folded turns are simply dropped (plain sliding window).
+
+    Attributes:
+    - max_tokens (int): Token budget of the turns sent to the prompts, or None for no limit.
+    - summarizer (LLMChain): Chain with "summary" and "new_lines" inputs that returns the new summary,
+      or None to drop old turns.
+    - summary_max_tokens (int): Maximum tokens of the summary.
+    - format_turns (callable): Formats a list of turns as in the prompts.
+    - model (str): The LLM model name, selects the tokenizer.
+    """
+
+    def __init__(
+        self,
+        max_tokens,
+        format_turns,
+        summarizer=None,
+        summary_max_tokens=300,
+        model="gpt-4",
+    ):
+        self.max_tokens = max_tokens
+        self.format_turns = format_turns
+        self.summarizer = summarizer
+        self.summary_max_tokens = summary_max_tokens
+        self.model = model
+
+    def format(self, history):
+        """Format the history for the prompts: the summary, then the newest turns that fit the budget.
+
+        Does not call the summarizer; call fold() or afold() first to move old turns into the summary.
+
+        Args:
+            history (list): The turns of the conversation (a ChatHistory to include its summary).
+
+        Returns:
+            str: The formatted history.
+        """
+        summary = getattr(history, "summary", "")
+        turns = list(history[getattr(history, "summarized", 0) :])
+        if self.max_tokens is not None:
+            turns = turns[self.__window_start(turns, self.max_tokens) :]
+        text = self.format_turns(turns)
+        if summary:
+            text = f"Summary of the earlier conversation: {summary}\n{text}"
+        return text
+
+    def fold(self, history):
+        """Fold the oldest turns into the summary if the turns after it exceed the budget.
+
+        Args:
+            history (ChatHistory): The conversation, updated in place.
+
+        Returns:
+            int: Number of turns folded.
+        """
+        turns = self.__turns_to_fold(history)
+        if turns and self.summarizer is not None:
+            try:
+                summary = self.summarizer.run(
+                    summary=history.summary, new_lines=self.format_turns(turns)
+                )
+                history.summary = self.__limit(summary)
+            except Exception as e:
+                logging.error(f"Failed to summarize chat history: {e}")
+        history.summarized += len(turns)
+        return len(turns)
+
+    async def afold(self, history):
+        """Asynchronous version of fold."""
+        turns = self.__turns_to_fold(history)
+        if turns and self.summarizer is not None:
+            try:
+                summary = await self.summarizer.arun(
+                    summary=history.summary, new_lines=self.format_turns(turns)
+                )
+                history.summary = self.__limit(summary)
+            except Exception as e:
+                logging.error(f"Failed to summarize chat history: {e}")
+        history.summarized += len(turns)
+        return len(turns)
+
+    def __turns_to_fold(self, history):
+        """Return the oldest turns after the summary to fold, or [] if the turns fit the budget."""
+        if self.max_tokens is None or not isinstance(history, ChatHistory):
+            return []
+        turns = list(history[history.summarized :])
+        if self.__window_start(turns, self.max_tokens) == 0:
+            return []
+        return turns[: self.__window_start(turns, self.max_tokens // 2)]
+
+    def __window_start(self, turns, max_tokens):
+        """Return the index of the oldest turn such that it and all newer turns fit in max_tokens.
+
+        The newest turn is always kept, even if it alone exceeds the budget.
+        """
+        total = 0
+        for i in range(len(turns) - 1, -1, -1):
+            total += count_tokens(self.format_turns([turns[i]]), self.model)
+            if total > max_tokens:
+                return min(i + 1, len(turns) - 1)
+        return 0
+
+    def __limit(self, summary):
+        """Keep the summary within summary_max_tokens."""
+        summary = summary.strip()
+        if count_tokens(summary, self.model) > self.summary_max_tokens:
+            summary = truncate_tokens(summary, self.summary_max_tokens, self.model)
+        return summary
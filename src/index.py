@@ -0,0 +1,535 @@
+"""Module for building, reading and writing FAISS indexes.
+
+This module provides build_index, which builds an exact (flat) or approximate (IVF-Flat, HNSW, IVF-PQ)
+FAISS index with an "auto" mode that picks the index type from the corpus size and optional fp16/SQ8 scalar
+quantization, and read_index, which can load a FAISS index either fully into memory or memory-mapped
+read-only. The MmapFlatIndex class searches a flat index directly from the memory-mapped file, so every
+process that opens the same file shares one page-cache copy and nothing is read up front. The RerankIndex
+class re-ranks the candidates of a quantized index with the full-precision vectors kept on disk.
+"""
+import os
+import math
+import struct
+import logging
+
+import numpy as np
+import faiss
+
+# FAISS file tags for flat indexes and the metric each one uses.
+FLAT_INDEX_METRICS = {
+    b"IxF2": faiss.METRIC_L2,
+    b"IxFI": faiss.METRIC_INNER_PRODUCT,
+}
+# Index types that can be selected in the vector_store configuration.
+INDEX_TYPES = ("auto", "flat", "ivf_flat", "hnsw", "ivf_pq")
+# Scalar quantizations that can be selected in the vector_store configuration (bytes per dimension: 2, 1).
+QUANTIZATIONS = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+}
+# Corpus sizes (number of vectors) at which "auto" switches to IVF-Flat and to IVF-PQ.
+AUTO_IVF_MIN_VECTORS = 20000
+AUTO_PQ_MIN_VECTORS = 500000
+# FAISS recommends at least this many training vectors per IVF centroid / PQ codeword.
+MIN_TRAINING_POINTS_PER_CENTROID = 39
+# IVF cells visited per query when nprobe is not configured: sqrt(nlist), but at least this many.
+MIN_DEFAULT_NPROBE = 8
+
+# Size of the IndexFlat header: fourcc, d, ntotal, two reserved fields, is_trained,
+# metric_type and the length of the vector data that follows.
+FLAT_HEADER_SIZE = 4 + 4 + 8 + 8 + 8 + 1 + 4 + 8
+
+
+class MmapFlatIndex:
+    """Read-only flat (exact) index searched directly from a memory-mapped FAISS file.
+
+    Implements the subset of the FAISS index interface used by langchain's FAISS vector store
+    (``d``, ``ntotal``, ``metric_type`` and ``search``). Vectors are scanned block by block, so only the
+    pages touched by a search are brought into memory and they stay shared in the OS page cache.
+
+    Attributes:
+    - path (str): Path to the index file.
+    - d (int): Dimension of the vectors.
+    - ntotal (int): Number of vectors in the index.
+    - metric_type (int): faiss.METRIC_L2 or faiss.METRIC_INNER_PRODUCT.
+    - vectors (numpy.memmap): Read-only (ntotal, d) float32 view of the vectors in the file.
+    - block_size (int): Number of vectors scanned per block during a search.
+    """
+
+    def __init__(self, path, block_size=65536):
+        self.path = path
+        self.block_size = block_size
+        with open(path, "rb") as f:
+            header = f.read(FLAT_HEADER_SIZE)
+        fourcc = header[:4]
+        if fourcc not in FLAT_INDEX_METRICS:
+            raise ValueError(f"Not a flat FAISS index: {path}")
+        self.d, self.ntotal = struct.unpack_from("<iq", header, 4)
+        self.metric_type = struct.unpack_from("<i", header, 33)[0]
+        (size,) = struct.unpack_from("<Q", header, 37)
+        # Older FAISS versions store the number of floats, newer ones the number of bytes.
+        if size not in (self.ntotal * self.d, self.ntotal * self.d * 4):
+            raise ValueError(f"Unexpected vector data size in {path}")
+        self.is_trained = True
+        self.vectors = np.memmap(
+            path,
+            dtype=np.float32,
+            mode="r",
+            offset=FLAT_HEADER_SIZE,
+            shape=(self.ntotal, self.d),
+        )
+
+    def search(self, x, k):
+        """Search the k nearest neighbours of each query vector.
+
+        Args:
+            x (numpy.ndarray): (n, d) float32 query vectors.
+            k (int): Number of neighbours to return.
+
+        Returns:
+            tuple: (distances, labels) arrays of shape (n, k), padded with -1 labels like FAISS.
+        """
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        n = x.shape[0]
+        largest_first = self.metric_type == faiss.METRIC_INNER_PRODUCT
+        worst = -np.inf if largest_first else np.inf
+        best_scores = np.full((n, k), worst, dtype=np.float32)
+        best_labels = np.full((n, k), -1, dtype=np.int64)
+
+        for start in range(0, self.ntotal, self.block_size):
+            block = self.vectors[start : start + self.block_size]
+            scores, labels = faiss.knn(
+                x, np.ascontiguousarray(block), min(k, block.shape[0]), self.metric_type
+            )
+            # Merge the block's top-k with the running top-k.
+            scores = np.hstack([best_scores, scores])
+            labels = np.hstack([best_labels, labels + start])
+            order = np.argsort(-scores if largest_first else scores, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, order, axis=1)
+            best_labels = np.take_along_axis(labels, order, axis=1)
+        return best_scores, best_labels
+
+    def add(self, x):
+        raise ValueError("Memory-mapped indexes are read-only")
+
+    def remove_ids(self, ids):
+        raise ValueError("Memory-mapped indexes are read-only")
+
+
+class RerankIndex:
+    """Approximate (quantized) index whose candidates are re-ranked with exact distances.
+
+    Searches fetch rerank_factor * k candidates from the wrapped index, compute their exact distances from
+    the full-precision vectors and keep the best k. The full-precision vectors are normally a read-only
+    memory map of the file next to the index, so only the candidate rows are read and the index itself
+    is the only copy of the corpus held in memory.
+
+    Attributes:
+    - index (object): Wrapped FAISS index.
+    - vectors (numpy.ndarray): (n, d) float32 full-precision vectors, usually memory-mapped.
+    - added (numpy.ndarray): Full-precision vectors added since loading, kept in memory.
+    - rerank_factor (int): Number of candidates fetched per requested neighbour.
+    """
+
+    def __init__(self, index, vectors, rerank_factor=4):
+        if len(vectors) != index.ntotal:
+            raise ValueError("Full-precision vectors do not match the index")
+        self.index = index
+        self.vectors = vectors
+        self.added = np.empty((0, index.d), dtype=np.float32)
+        self.rerank_factor = rerank_factor
+
+    @property
+    def d(self):
+        return self.index.d
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    @property
+    def metric_type(self):
+        return self.index.metric_type
+
+    @property
+    def is_trained(self):
+        return self.index.is_trained
+
+    def rows(self, labels):
+        """Return the full-precision vectors at the given positions as an (n, d) array."""
+        labels = np.asarray(labels, dtype=np.int64)
+        base = len(self.vectors)
+        result = np.empty((len(labels), self.d), dtype=np.float32)
+        in_base = labels < base
+        result[in_base] = self.vectors[labels[in_base]]
+        result[~in_base] = self.added[labels[~in_base] - base]
+        return result
+
+    def search(self, x, k):
+        """Search the k nearest neighbours of each query vector, re-ranked by exact distance.
+
+        Args:
+            x (numpy.ndarray): (n, d) float32 query vectors.
+            k (int): Number of neighbours to return.
+
+        Returns:
+            tuple: (distances, labels) arrays of shape (n, k), padded with -1 labels like FAISS.
+        """
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        _, candidates = self.index.search(x, k * self.rerank_factor)
+        largest_first = self.metric_type == faiss.METRIC_INNER_PRODUCT
+        worst = -np.inf if largest_first else np.inf
+        distances = np.full((x.shape[0], k), worst, dtype=np.float32)
+        labels = np.full((x.shape[0], k), -1, dtype=np.int64)
+        for i, query in enumerate(x):
+            found = candidates[i][candidates[i] >= 0]
+            vectors = self.rows(found)
+            if largest_first:
+                scores = vectors @ query
+                order = np.argsort(-scores)[:k]
+            else:
+                scores = ((vectors - query) ** 2).sum(axis=1)
+                order = np.argsort(scores)[:k]
+            distances[i, : len(order)] = scores[order]
+            labels[i, : len(order)] = found[order]
+        return distances, labels
+
+    def add(self, x):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        self.index.add(x)
+        self.added = np.vstack([self.added, x])
+
+    def remove_ids(self, ids):
+        raise ValueError("Use remove_positions to remove vectors from a RerankIndex")
+
+
+def vectors_path(path):
+    """Return the path of the full-precision vectors file kept next to an index file."""
+    return f"{os.path.splitext(path)[0]}.vectors.npy"
+
+
+def read_index(path, mmap=False, rerank_factor=0):
+    """Read a FAISS index from disk.
+
+    With mmap=True, flat indexes are opened as a MmapFlatIndex and other index types are read with
+    FAISS's own memory-mapping flags, which map the inverted lists of IVF indexes instead of copying them.
+
+    Args:
+        path (str): Path to the index file.
+        mmap (bool): Memory-map the index read-only instead of reading it into memory.
+        rerank_factor (int): If set and full-precision vectors were saved with the index, re-rank this many
+            candidates per neighbour with them (see RerankIndex).
+
+    Returns:
+        object: FAISS index (or MmapFlatIndex, RerankIndex).
+    """
+    if not mmap:
+        index = faiss.read_index(path)
+    else:
+        with open(path, "rb") as f:
+            fourcc = f.read(4)
+        if fourcc in FLAT_INDEX_METRICS:
+            return MmapFlatIndex(path)
+        logging.info(f"Memory-mapping FAISS index with IO_FLAG_MMAP: {path}")
+        index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    if rerank_factor and os.path.exists(vectors_path(path)):
+        # The full-precision vectors are always memory-mapped, only re-ranked rows are read.
+        vectors = np.load(vectors_path(path), mmap_mode="r")
+        return RerankIndex(index, vectors, rerank_factor)
+    return index
+
+
+def write_index(index, path):
+    """Write a FAISS index to disk.
+
+    The full-precision vectors of a RerankIndex are written to a ``.vectors.npy`` file next to the index.
+
+    Args:
+        index (object): FAISS index.
+        path (str): Path to the index file.
+    """
+    if isinstance(index, MmapFlatIndex):
+        raise ValueError("Memory-mapped indexes are read-only")
+    if isinstance(index, RerankIndex):
+        faiss.write_index(index.index, path)
+        # Write to a temporary file first, the current file may be memory-mapped by this index.
+        tmp_path = f"{vectors_path(path)}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, index_vectors(index))
+        os.replace(tmp_path, vectors_path(path))
+    else:
+        faiss.write_index(index, path)
+        if os.path.exists(vectors_path(path)):
+            os.remove(vectors_path(path))
+
+
+def resolve_index_type(index_type, ntotal):
+    """Resolve the "auto" index type for a corpus of the given size.
+
+    Small corpora use an exact flat index, medium corpora IVF-Flat and large corpora IVF-PQ, so query
+    latency and memory grow sublinearly with the corpus.
+
+    Args:
+        index_type (str): One of INDEX_TYPES.
+        ntotal (int): Number of vectors in the corpus.
+
+    Returns:
+        str: Concrete index type ("flat", "ivf_flat", "hnsw" or "ivf_pq").
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Invalid index type: {index_type}")
+    if index_type != "auto":
+        return index_type
+    if ntotal < AUTO_IVF_MIN_VECTORS:
+        return "flat"
+    if ntotal < AUTO_PQ_MIN_VECTORS:
+        return "ivf_flat"
+    return "ivf_pq"
+
+
+def build_index(
+    vectors,
+    index_type="auto",
+    nlist=None,
+    hnsw_m=32,
+    ef_construction=200,
+    pq_m=64,
+    pq_nbits=8,
+    quantization=None,
+    metric=faiss.METRIC_L2,
+):
+    """Build, train and fill a FAISS index of the given type.
+
+    With quantization "fp16" or "sq8", flat, IVF-Flat and HNSW indexes store their vectors as 16-bit floats
+    or 8-bit integers (2x or 4x less memory) instead of float32. IVF-PQ already compresses its vectors and
+    ignores it.
+
+    Args:
+        vectors (numpy.ndarray): (n, d) float32 vectors to index.
+        index_type (str): One of INDEX_TYPES.
+        nlist (int, optional): Number of IVF cells. Defaults to 4 * sqrt(n), capped by the training data.
+        hnsw_m (int): Number of HNSW neighbours per node.
+        ef_construction (int): HNSW search depth while building the graph.
+        pq_m (int): Number of PQ sub-quantizers. Lowered to a divisor of the dimension if needed.
+        pq_nbits (int): Bits per PQ code. Lowered if there is too little training data.
+        quantization (str, optional): Scalar quantization of the stored vectors, "fp16" or "sq8".
+        metric (int): faiss.METRIC_L2 or faiss.METRIC_INNER_PRODUCT.
+
+    Returns:
+        object: FAISS index containing the vectors.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, d = vectors.shape
+    index_type = resolve_index_type(index_type, n)
+    if quantization is not None and quantization not in QUANTIZATIONS:
+        raise ValueError(f"Invalid quantization: {quantization}")
+    qtype = QUANTIZATIONS.get(quantization)
+
+    if index_type == "flat":
+        if qtype is None:
+            index = faiss.IndexFlat(d, metric)
+        else:
+            index = faiss.IndexScalarQuantizer(d, qtype, metric)
+            index.train(vectors)
+    elif index_type == "hnsw":
+        if qtype is None:
+            index = faiss.IndexHNSWFlat(d, hnsw_m, metric)
+        else:
+            index = faiss.IndexHNSWSQ(d, qtype, hnsw_m, metric)
+        index.hnsw.efConstruction = ef_construction
+        index.train(vectors)
+    else:
+        max_nlist = max(1, n // MIN_TRAINING_POINTS_PER_CENTROID)
+        nlist = min(nlist or int(4 * math.sqrt(n)), max_nlist)
+        quantizer = faiss.IndexFlat(d, metric)
+        if index_type == "ivf_flat" and qtype is None:
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, metric)
+        elif index_type == "ivf_flat":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, d, nlist, qtype, metric)
+        else:
+            pq_m = max(m for m in range(1, min(pq_m, d) + 1) if d % m == 0)
+            while pq_nbits > 4 and MIN_TRAINING_POINTS_PER_CENTROID * 2**pq_nbits > n:
+                pq_nbits -= 1
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, pq_m, pq_nbits, metric)
+        index.train(vectors)
+    index.add(vectors)
+    logging.info(f"Built {index_type} FAISS index with {n} vectors ({quantization})")
+    return index
+
+
+def index_type_of(index):
+    """Return the index type name of a FAISS index built by build_index."""
+    if isinstance(index, RerankIndex):
+        return index_type_of(index.index)
+    if isinstance(index, (faiss.IndexFlat, faiss.IndexScalarQuantizer, MmapFlatIndex)):
+        return "flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return type(index).__name__
+
+
+def index_quantization(index):
+    """Return the scalar quantization ("fp16" or "sq8") of a FAISS index built by build_index, or None."""
+    if isinstance(index, RerankIndex):
+        return index_quantization(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        for name, qtype in QUANTIZATIONS.items():
+            if index.sq.qtype == qtype:
+                return name
+    return None
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Set query-time parameters of an approximate index. Ignored for index types they do not apply to.
+
+    Args:
+        index (object): FAISS index.
+        nprobe (int, optional): Number of IVF cells visited per query. Defaults to sqrt(nlist), at least
+            MIN_DEFAULT_NPROBE, instead of FAISS's 1, which often finds fewer than k neighbours.
+        ef_search (int, optional): HNSW search depth.
+    """
+    if isinstance(index, RerankIndex):
+        index = index.index
+    if isinstance(index, faiss.IndexIVF):
+        nprobe = nprobe or max(MIN_DEFAULT_NPROBE, int(math.sqrt(index.nlist)))
+        index.nprobe = min(nprobe, index.nlist)
+    if ef_search and isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+
+
+def index_vectors(index):
+    """Return all vectors stored in an index as an (n, d) array.
+
+    Vectors of IVF-PQ and scalar-quantized indexes are reconstructed from their codes and are therefore
+    approximate, except for a RerankIndex, which returns its full-precision vectors.
+    """
+    if isinstance(index, RerankIndex):
+        return np.vstack([index.vectors, index.added])
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def index_rows(index, positions):
+    """Return the vectors stored at some positions of an index as an (n, d) array.
+
+    Only the requested rows are read: a memory-mapped flat index reads their pages, a RerankIndex returns
+    its full-precision vectors, and other indexes reconstruct them (approximately for quantized indexes).
+
+    Args:
+        index (object): FAISS index.
+        positions (numpy.ndarray): Positions of the vectors.
+
+    Returns:
+        numpy.ndarray: (n, d) float32 vectors.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if isinstance(index, RerankIndex):
+        return index.rows(positions)
+    if isinstance(index, MmapFlatIndex):
+        return np.asarray(index.vectors[positions], dtype=np.float32)
+    if isinstance(index, faiss.IndexIVF) and index.direct_map.no():
+        index.make_direct_map()
+    return index.reconstruct_batch(positions)
+
+
+def search_subset(index, x, positions, k, block_size=65536):
+    """Search the k nearest neighbours of each query vector among some positions of an index.
+
+    The vectors at the positions are scanned exactly, block by block, so the cost is proportional to the
+    number of positions rather than the size of the index.
+
+    Args:
+        index (object): FAISS index.
+        x (numpy.ndarray): (n, d) float32 query vectors.
+        positions (numpy.ndarray): Positions to search among.
+        k (int): Number of neighbours to return.
+        block_size (int): Number of vectors scanned per block.
+
+    Returns:
+        tuple: (distances, labels) arrays of shape (n, k), padded with -1 labels like FAISS.
+    """
+    x = np.ascontiguousarray(x, dtype=np.float32)
+    positions = np.asarray(positions, dtype=np.int64)
+    largest_first = index.metric_type == faiss.METRIC_INNER_PRODUCT
+    worst = -np.inf if largest_first else np.inf
+    best_scores = np.full((x.shape[0], k), worst, dtype=np.float32)
+    best_labels = np.full((x.shape[0], k), -1, dtype=np.int64)
+    for start in range(0, len(positions), block_size):
+        block_positions = positions[start : start + block_size]
+        block = np.ascontiguousarray(index_rows(index, block_positions))
+        scores, labels = faiss.knn(
+            x, block, min(k, len(block_positions)), index.metric_type
+        )
+        scores = np.hstack([best_scores, scores])
+        labels = np.hstack([best_labels, block_positions[labels]])
+        order = np.argsort(-scores if largest_first else scores, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, order, axis=1)
+        best_labels = np.take_along_axis(labels, order, axis=1)
+    return best_scores, best_labels
+
+
+def remove_positions(index, positions):
+    """Remove vectors from an index and renumber the remaining ones consecutively.
+
+    Flat (and flat scalar-quantized) indexes compact themselves on removal. IVF indexes remove the vectors
+    from their inverted lists and shift the labels of the later vectors down, so the stored codes are never
+    re-encoded. HNSW graphs do not support removal and are rebuilt from the remaining vectors, which is only
+    done from exact vectors: an HNSWFlat index, or a RerankIndex, which also drops the removed rows of its
+    full-precision vectors.
+
+    Args:
+        index (object): FAISS index.
+        positions (list): Positions of the vectors to remove.
+
+    Returns:
+        object: Index without the removed vectors.
+
+    Raises:
+        ValueError: If the index is a scalar-quantized HNSW index without full-precision vectors, whose
+            vectors would otherwise be replaced by their lossy reconstructions.
+    """
+    positions = np.unique(np.asarray(positions, dtype=np.int64))
+    if isinstance(index, RerankIndex):
+        keep = np.ones(index.ntotal, dtype=bool)
+        keep[positions] = False
+        vectors = index_vectors(index)[keep]
+        if isinstance(index.index, faiss.IndexHNSW):
+            inner = faiss.clone_index(index.index)
+            inner.reset()
+            inner.add(vectors)
+        else:
+            inner = remove_positions(index.index, positions)
+        return RerankIndex(inner, vectors, index.rerank_factor)
+    if isinstance(index, faiss.IndexFlatCodes):
+        index.remove_ids(positions)
+        return index
+    if isinstance(index, faiss.IndexIVF):
+        # An array direct map does not support removal; index_rows rebuilds it when needed.
+        index.set_direct_map_type(faiss.DirectMap.NoMap)
+        index.remove_ids(positions)
+        invlists = index.invlists
+        for list_no in range(index.nlist):
+            size = invlists.list_size(list_no)
+            if size:
+                labels = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+                labels -= np.searchsorted(positions, labels)
+        return index
+    if isinstance(index, faiss.IndexHNSWFlat):
+        keep = np.ones(index.ntotal, dtype=bool)
+        keep[positions] = False
+        vectors = index_vectors(index)[keep]
+        rebuilt = faiss.clone_index(index)
+        rebuilt.reset()
+        rebuilt.add(vectors)
+        return rebuilt
+    raise ValueError(
+        "Cannot remove vectors from a quantized HNSW index without full-precision vectors, "
+        "configure a rerank_factor to keep them"
+    )
@@ -0,0 +1,237 @@
+"""Module for ingesting many documents into a single vector store in parallel.
+
+This module provides the IngestionPipeline class which overlaps the three stages of building an index:
+parsing and splitting documents (process pool), embedding chunks (thread pool) and merging the results
+into a VectorStore. Stages are connected by bounded queues and the final chunk order always follows the
+order of the input document paths.
+"""
+import os
+import queue
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from src.document import Document
+
+# Sentinel placed on a queue to tell the consuming stage there is no more work.
+_DONE = object()
+
+
+def load_and_split(document_path, split_method, chunk_size, chunk_overlap, source=None):
+    """Parse and split a single document. Runs inside a worker process.
+
+    The document is read and split page by page (see Document.stream_chunks), so a worker never holds
+    the text of every page alongside its chunks.
+
+    Args:
+        document_path (str): Path to the document.
+        split_method (str): Method to use for splitting the document content.
+        chunk_size (int): Size of each chunk after splitting.
+        chunk_overlap (int): Number of overlapping characters between chunks.
+        source (str, optional): Source recorded in the chunk metadata and IDs. Defaults to the path.
+
+    Returns:
+        tuple: (list of document chunks, list of chunk IDs)
+    """
+    doc = Document(
+        document_path=document_path,
+        split_method=split_method,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        streaming=True,
+        source=source,
+    )
+    chunks, ids = [], []
+    for chunk, _id in doc.stream_chunks():
+        chunks.append(chunk)
+        ids.append(_id)
+    return chunks, ids
+
+
+class IngestionPipeline:
+    """Class to parse, split, embed and store a batch of documents concurrently.
+
+    Documents are parsed and split in a process pool while previously split documents are embedded
+    by a pool of threads. Embedded documents are merged into the vector store strictly in input order,
+    so the same list of paths always produces the same chunk order in the index.
+
+    Attributes:
+    - vector_store (VectorStore): Vector store the documents are merged into.
+    - split_method (str): Method to use for splitting the document content.
+    - chunk_size (int): Size of each chunk after splitting.
+    - chunk_overlap (int): Number of overlapping characters between chunks.
+    - max_workers (int): Number of processes used to parse and split documents.
+    - embed_workers (int): Number of threads used to embed document chunks.
+    - queue_size (int): Maximum number of documents in flight between the stages.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        split_method="recursive",
+        chunk_size=1000,
+        chunk_overlap=10,
+        max_workers=None,
+        embed_workers=2,
+        queue_size=4,
+    ):
+        self.vector_store = vector_store
+        self.split_method = split_method
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.embed_workers = max(1, embed_workers)
+        self.queue_size = max(1, queue_size)
+
+    def run(self, document_paths, sources=None):
+        """Ingest the given documents into the vector store.
+
+        Args:
+            document_paths (list): Paths of the documents to ingest.
+            sources (list, optional): Source recorded in the chunk metadata and IDs of each document, e.g.
+                the original names of uploaded files stored under temporary paths. Defaults to the paths.
+
+        Returns:
+            list: List of document chunk IDs added to the vector store, in input order.
+
+        Raises:
+            Exception: The error that stopped documents from being submitted to the process pool, after
+                the documents submitted before it were merged.
+        """
+        document_paths = list(document_paths)
+        sources = list(sources) if sources is not None else [None] * len(document_paths)
+        if not document_paths:
+            return []
+
+        # Limits how many documents can be between submission and merge at once. This bounds the
+        # split and embedded queues as well as the reorder buffer in the merge stage.
+        in_flight = threading.BoundedSemaphore(self.queue_size)
+        split_queue = queue.Queue(maxsize=self.queue_size)
+        embedded_queue = queue.Queue(maxsize=self.queue_size)
+        workers = min(self.max_workers, len(document_paths))
+        # Error raised in the producer thread, re-raised here once the other stages have stopped.
+        errors = []
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            producer = threading.Thread(
+                target=self.__produce,
+                args=(
+                    executor,
+                    document_paths,
+                    sources,
+                    in_flight,
+                    split_queue,
+                    errors,
+                ),
+                daemon=True,
+            )
+            embedders = [
+                threading.Thread(
+                    target=self.__embed,
+                    args=(split_queue, embedded_queue),
+                    daemon=True,
+                )
+                for _ in range(self.embed_workers)
+            ]
+            producer.start()
+            for embedder in embedders:
+                embedder.start()
+
+            ids = self.__merge(len(document_paths), in_flight, embedded_queue)
+
+            producer.join()
+            for embedder in embedders:
+                embedder.join()
+        if errors:
+            raise errors[0]
+        return ids
+
+    def __produce(
+        self, executor, document_paths, sources, in_flight, split_queue, errors
+    ):
+        """Submit documents to the process pool and queue each result as it completes.
+
+        The embedders are always told to stop, also when submitting fails, so the merge stage cannot wait
+        forever; the error is appended to errors for run() to raise.
+        """
+        pending = threading.Semaphore(0)
+
+        def on_done(index, document_path, future):
+            chunks, ids = [], []
+            try:
+                chunks, ids = future.result()
+            except Exception as e:
+                logging.error(f"Failed to process document {document_path}: {e}")
+            finally:
+                split_queue.put((index, chunks, ids))
+                pending.release()
+
+        submitted = 0
+        try:
+            for index, document_path in enumerate(document_paths):
+                in_flight.acquire()
+                future = executor.submit(
+                    load_and_split,
+                    document_path,
+                    self.split_method,
+                    self.chunk_size,
+                    self.chunk_overlap,
+                    sources[index],
+                )
+                future.add_done_callback(
+                    lambda f, i=index, p=document_path: on_done(i, p, f)
+                )
+                submitted += 1
+        except Exception as e:
+            logging.error(f"Failed to submit document {document_paths[submitted]}: {e}")
+            errors.append(e)
+        finally:
+            # Wait for every callback to queue its result before telling the embedders to stop.
+            for _ in range(submitted):
+                pending.acquire()
+            for _ in range(self.embed_workers):
+                split_queue.put(_DONE)
+
+    def __embed(self, split_queue, embedded_queue):
+        """Embed split documents until the producer signals there is no more work."""
+        while True:
+            item = split_queue.get()
+            if item is _DONE:
+                embedded_queue.put(_DONE)
+                return
+            index, chunks, ids = item
+            embeddings = []
+            if chunks:
+                try:
+                    embeddings = self.vector_store.embeddings.embed_documents(
+                        [chunk.page_content for chunk in chunks]
+                    )
+                except Exception as e:
+                    logging.error(f"Failed to embed document chunks: {e}")
+                    chunks, ids = [], []
+            embedded_queue.put((index, chunks, ids, embeddings))
+
+    def __merge(self, total, in_flight, embedded_queue):
+        """Add embedded documents to the vector store in input order."""
+        buffered = {}
+        next_index = 0
+        finished_embedders = 0
+        added_ids = []
+        # Keep reading until every embedder has signalled completion so none blocks on a full queue.
+        while finished_embedders < self.embed_workers:
+            item = embedded_queue.get()
+            if item is _DONE:
+                finished_embedders += 1
+                continue
+            index, chunks, ids, embeddings = item
+            buffered[index] = (chunks, ids, embeddings)
+            while next_index in buffered:
+                chunks, ids, embeddings = buffered.pop(next_index)
+                if chunks:
+                    added_ids.extend(
+                        self.vector_store.add_embeddings(chunks, embeddings, ids=ids)
+                    )
+                logging.info(f"Ingested document {next_index + 1}/{total}")
+                next_index += 1
+                in_flight.release()
+        return added_ids
@@ -0,0 +1,363 @@
+"""Module for the local lexical (BM25) index of the document chunks and hybrid retrieval.
+
+Medical questions often hinge on exact tokens such as "FLT3-ITD", "CPX-351" or "AMLSG 09-09", which
+embedding search can miss. This module provides the LexicalIndex class, an inverted index scored with
+BM25 that is built alongside the vector index and saved next to it as an Arrow IPC file, fuse_scores, which combines lexical
+and vector scores, and the HybridRetriever class, which retrieves through VectorStore.hybrid_search.
+Queries dominated by rare identifiers can be answered from the lexical index alone, without embedding
+the query.
+"""
+import os
+import re
+import math
+from typing import Any, List
+
+import numpy as np
+import pyarrow as pa
+from langchain.schema import BaseRetriever, Document
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+
+# Words and identifiers, keeping internal hyphens, slashes, dots and pluses ("flt3-itd", "7+3", "2.5").
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-/.+][a-z0-9]+)*")
+# Separators of the parts of a compound token, which are indexed as well ("flt3-itd" -> "flt3", "itd").
+PART_PATTERN = re.compile(r"[-/.+]")
+# Words ignored when deciding whether a query is dominated by identifiers.
+STOP_WORDS = {
+    "a",
+    "an",
+    "and",
+    "are",
+    "as",
+    "at",
+    "be",
+    "by",
+    "can",
+    "do",
+    "does",
+    "for",
+    "from",
+    "how",
+    "in",
+    "is",
+    "it",
+    "of",
+    "on",
+    "or",
+    "the",
+    "to",
+    "was",
+    "what",
+    "when",
+    "which",
+    "who",
+    "why",
+    "with",
+}
+# Arrow schema of a saved lexical index: one row per chunk with its terms and their frequencies.
+SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("length", pa.int64()),
+        ("terms", pa.list_(pa.string())),
+        ("tfs", pa.list_(pa.int32())),
+    ]
+)
+
+
+def tokenize(text, parts=True):
+    """Split a text into lowercase index terms.
+
+    Args:
+        text (str): Text to split.
+        parts (bool): Also return the parts of compound tokens, so "FLT3-ITD" matches "FLT3 ITD".
+
+    Returns:
+        list: The terms, in order of appearance.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        if parts and PART_PATTERN.search(token):
+            terms.extend(part for part in PART_PATTERN.split(token) if part)
+    return terms
+
+
+def is_identifier(term):
+    """Check whether a term looks like an identifier (gene, drug code, trial name) rather than a word."""
+    return any(c.isdigit() for c in term) or PART_PATTERN.search(term) is not None
+
+
+def fuse_scores(lexical, vector, lexical_weight=0.3):
+    """Combine the lexical and vector scores of the candidates of a hybrid search.
+
+    Each list of scores is min-max normalized to [0, 1] (higher is better) and the results are combined
+    as lexical_weight * lexical + (1 - lexical_weight) * vector; candidates missing from one list score 0
+    there.
+
+    Args:
+        lexical (dict): Chunk ID -> BM25 score.
+        vector (dict): Chunk ID -> vector similarity (higher is more similar).
+        lexical_weight (float): Weight of the lexical scores, between 0 and 1.
+
+    Returns:
+        list: (chunk ID, fused score) tuples, best first.
+    """
+    fused = {}
+    for scores, weight in ((lexical, lexical_weight), (vector, 1 - lexical_weight)):
+        if not scores:
+            continue
+        low, high = min(scores.values()), max(scores.values())
+        for _id, score in scores.items():
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            fused[_id] = fused.get(_id, 0.0) + weight * normalized
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """Class for an inverted index of the document chunks, scored with BM25.
+
+    Chunks are identified by their chunk ID, as in the vector store. Removed chunks leave an empty slot
+    until the index is saved, so removals do not renumber the postings, and only touch the postings of
+    the terms of the removed chunks.
+
+    Attributes:
+    - k1 (float): BM25 term frequency saturation.
+    - b (float): BM25 document length normalization.
+    - ids (list): Chunk ID of each slot, or None for removed chunks.
+    - lengths (list): Number of terms of each slot.
+    - postings (dict): Term -> {slot: term frequency}.
+    - terms (list): Distinct terms of each slot, empty for removed chunks.
+    - slots (dict): Chunk ID -> slot.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.lengths = []
+        self.postings = {}
+        self.terms = []
+        self.slots = {}
+        self._total_length = 0
+        self._norms = None
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, ids, texts):
+        """Index chunks; chunks whose ID is already indexed are replaced.
+
+        Args:
+            ids (list): Chunk IDs.
+            texts (list): Text of each chunk.
+        """
+        self.remove([_id for _id in ids if _id in self.slots])
+        self._norms = None
+        for _id, text in zip(ids, texts):
+            terms = tokenize(text)
+            slot = len(self.ids)
+            self.ids.append(_id)
+            self.lengths.append(len(terms))
+            self.slots[_id] = slot
+            self._total_length += len(terms)
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[slot] = count
+            self.terms.append(tuple(counts))
+
+    def remove(self, ids):
+        """Remove chunks from the index; unknown IDs are ignored.
+
+        Args:
+            ids (list): Chunk IDs.
+        """
+        slots = {self.slots.pop(_id) for _id in ids if _id in self.slots}
+        if not slots:
+            return
+        self._norms = None
+        for slot in slots:
+            self.ids[slot] = None
+            self._total_length -= self.lengths[slot]
+            self.lengths[slot] = 0
+            for term in self.terms[slot]:
+                postings = self.postings[term]
+                del postings[slot]
+                if not postings:
+                    del self.postings[term]
+            self.terms[slot] = ()
+
+    def document_frequency(self, term):
+        """Return the number of chunks containing a term."""
+        return len(self.postings.get(term, ()))
+
+    def idf(self, term):
+        """Return the BM25 inverse document frequency of a term (never negative)."""
+        df = self.document_frequency(term)
+        return math.log(1 + (len(self) - df + 0.5) / (df + 0.5))
+
+    def search(self, query, k=4, ids=None):
+        """Find the chunks that best match a query.
+
+        Args:
+            query (str): Query to search for.
+            k (int): Number of top results to retrieve.
+            ids (list, optional): Only return chunks with these IDs.
+
+        Returns:
+            list: (chunk ID, BM25 score) tuples, best first; only chunks sharing a term with the query.
+        """
+        if not self.slots:
+            return []
+        norms = self.__norms()
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            slots = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            tfs = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            scores[slots] += self.idf(term) * tfs * (self.k1 + 1) / (tfs + norms[slots])
+        if ids is not None:
+            allowed = np.zeros(len(self.ids), dtype=bool)
+            allowed[[self.slots[_id] for _id in ids if _id in self.slots]] = True
+            scores[~allowed] = 0
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[slot], float(scores[slot])) for slot in top]
+
+    def __norms(self):
+        """Return the length normalization of every slot, recomputed after the index changes."""
+        if self._norms is None:
+            lengths = np.asarray(self.lengths, dtype=np.float32)
+            average_length = self._total_length / len(self) or 1.0
+            self._norms = self.k1 * (1 - self.b + self.b * lengths / average_length)
+        return self._norms
+
+    def rare_identifiers(self, query, identifier_ratio=0.5, rare_df_ratio=0.01):
+        """Return the rare identifiers of a query if they dominate it, so it can be answered lexically.
+
+        A query is dominated by rare identifiers when at least identifier_ratio of its words (ignoring
+        stop words) are identifiers such as "FLT3-ITD" or "09-09" that occur in at most rare_df_ratio of
+        the chunks (and in at least one).
+
+        Args:
+            query (str): Query to check.
+            identifier_ratio (float): Minimum share of rare identifiers among the words of the query.
+            rare_df_ratio (float): Maximum share of chunks an identifier may occur in to be rare.
+
+        Returns:
+            list: The rare identifiers, or [] if the query is not dominated by them.
+        """
+        words = [w for w in tokenize(query, parts=False) if w not in STOP_WORDS]
+        max_df = max(1, rare_df_ratio * len(self))
+        rare = [
+            w
+            for w in words
+            if is_identifier(w) and 0 < self.document_frequency(w) <= max_df
+        ]
+        if words and len(rare) >= identifier_ratio * len(words):
+            return rare
+        return []
+
+    def compact(self):
+        """Drop the slots of removed chunks, renumbering the postings."""
+        if len(self.ids) == len(self):
+            return
+        self._norms = None
+        renumber = {}
+        for slot, _id in enumerate(self.ids):
+            if _id is not None:
+                renumber[slot] = len(renumber)
+        self.ids = [_id for _id in self.ids if _id is not None]
+        self.lengths = [self.lengths[slot] for slot in renumber]
+        self.terms = [self.terms[slot] for slot in renumber]
+        self.slots = {_id: slot for slot, _id in enumerate(self.ids)}
+        self.postings = {
+            term: {renumber[slot]: tf for slot, tf in postings.items()}
+            for term, postings in self.postings.items()
+        }
+
+    def save(self, path):
+        """Save the index to an Arrow IPC file, with one row per chunk holding its terms.
+
+        The file is written to a temporary file first and then replaces the current one.
+
+        Args:
+            path (str): Path of the file, usually ``{index_name}.bm25`` next to the vector index.
+        """
+        self.compact()
+        table = pa.Table.from_pydict(
+            {
+                "id": self.ids,
+                "length": self.lengths,
+                "terms": [list(terms) for terms in self.terms],
+                "tfs": [
+                    [self.postings[term][slot] for term in terms]
+                    for slot, terms in enumerate(self.terms)
+                ],
+            },
+            schema=SCHEMA.with_metadata({"k1": str(self.k1), "b": str(self.b)}),
+        )
+        tmp_path = f"{path}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with save(), rebuilding the postings from the terms of each chunk.
+
+        Args:
+            path (str): Path of the file.
+
+        Returns:
+            LexicalIndex: The index.
+        """
+        with pa.OSFile(path, "rb") as source:
+            table = pa.ipc.open_file(source).read_all()
+        metadata = table.schema.metadata
+        index = cls(k1=float(metadata[b"k1"]), b=float(metadata[b"b"]))
+        index.ids = table.column("id").to_pylist()
+        index.lengths = table.column("length").to_pylist()
+        index.slots = {_id: slot for slot, _id in enumerate(index.ids)}
+        index._total_length = sum(index.lengths)
+        for slot, (terms, tfs) in enumerate(
+            zip(table.column("terms").to_pylist(), table.column("tfs").to_pylist())
+        ):
+            for term, tf in zip(terms, tfs):
+                index.postings.setdefault(term, {})[slot] = tf
+            index.terms.append(tuple(terms))
+        return index
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever fusing the lexical and vector search of a VectorStore (see VectorStore.hybrid_search).
+
+    Attributes:
+    - vector_store (VectorStore): The vector store to search, with a lexical index.
+    - search_kwargs (dict): Keyword arguments of the search: k and filter.
+    - search_type (str): Always "hybrid".
+    """
+
+    vector_store: Any
+    search_kwargs: dict = {}
+    search_type: str = "hybrid"
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.vector_store.hybrid_search(query, **self.search_kwargs)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return await self.vector_store.ahybrid_search(query, **self.search_kwargs)
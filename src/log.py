@@ -2,6 +2,23 @@ import logging
 import coloredlogs
 from src.config import Config
 
+# Handlers added by setup_logging, so calling it again replaces them instead of adding more.
+_installed_handlers = []
+
+
+def _add_handler(logger, handler):
+    """Add a handler to a logger and remember it for reset_logging."""
+    logger.addHandler(handler)
+    _installed_handlers.append((logger, handler))
+
+
+def reset_logging():
+    """Remove and close every handler added by setup_logging."""
+    for logger, handler in _installed_handlers:
+        logger.removeHandler(handler)
+        handler.close()
+    _installed_handlers.clear()
+
 
 def setup_console_logger(name, console_handler, level):
     """
@@ -14,7 +31,7 @@ def setup_console_logger(name, console_handler, level):
     """
     logger = logging.getLogger(name)
     logger.propagate = False
-    logger.addHandler(console_handler)
+    _add_handler(logger, console_handler)
     logger.setLevel(getattr(logging, level))
 
 
@@ -22,6 +39,9 @@ def setup_logging(config: Config):
     """
     Sets up the logging configuration.
 
+    Idempotent: handlers added by an earlier call are removed first, so calling it again (e.g. on a
+    Streamlit rerun) never duplicates log output.
+
     Args:
         config (Config): The application configuration.
 
@@ -30,21 +50,27 @@ def setup_logging(config: Config):
     """
     # Create root logger
     root_logger = logging.getLogger()
+    reset_logging()
 
     # Set up file logging
     if config.log_to_file:
         try:
             file_handler = logging.FileHandler(config.log_file_name)
             file_handler.setLevel(getattr(logging, config.file_log_level))
-            root_logger.addHandler(file_handler)
+            _add_handler(root_logger, file_handler)
         except Exception as e:
             root_logger.warning(f"Could not set up file logging: {e}")
 
     # Set up console logging
     if config.log_to_console:
         console_handler = logging.StreamHandler()
-        root_logger.addHandler(console_handler)
+        _add_handler(root_logger, console_handler)
+        handlers = list(root_logger.handlers)
         coloredlogs.install(level=config.console_log_level, logger=root_logger)
+        # coloredlogs replaces the stderr handler of the root logger with its own, remember that one too.
+        for handler in root_logger.handlers:
+            if handler not in handlers:
+                _installed_handlers.append((root_logger, handler))
 
         # Console-only loggers for langchain and urllib3 - default level to ERROR/CRITICAL to avoid console spam
         setup_console_logger("langchain", console_handler, "CRITICAL")
@@ -61,9 +87,21 @@ def setup_logging(config: Config):
             doc_retrieval_handler.setLevel(
                 getattr(logging, config.doc_retrieval_log_level)
             )
-            doc_retrieval_logger.addHandler(doc_retrieval_handler)
+            _add_handler(doc_retrieval_logger, doc_retrieval_handler)
             doc_retrieval_logger.propagate = False
         except Exception as e:
             root_logger.warning(f"Could not set up document retrieval logging: {e}")
 
+    # Set up metrics logger (one JSON line per chat request with the latency of each stage)
+    if config.log_metrics:
+        try:
+            metrics_logger = logging.getLogger("metrics")
+            metrics_handler = logging.FileHandler(config.metrics_log_file_name)
+            metrics_handler.setFormatter(logging.Formatter("%(message)s"))
+            _add_handler(metrics_logger, metrics_handler)
+            metrics_logger.setLevel(logging.INFO)
+            metrics_logger.propagate = False
+        except Exception as e:
+            root_logger.warning(f"Could not set up metrics logging: {e}")
+
     return root_logger
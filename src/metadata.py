@@ -0,0 +1,106 @@
+"""Module for searching the vector store within a subset of the chunks selected by their metadata.
+
+This module provides the MetadataIndex class, which maps the metadata values of the chunks (source, page,
+title, year, ...) to their positions in the vector index, so a filtered search only scans the vectors of
+the matching chunks instead of over-fetching from the whole index and filtering afterwards, and the
+FilteredRetriever class, which retrieves through VectorStore.similarity_search with a filter.
+"""
+from typing import Any, List
+
+import numpy as np
+from langchain.schema import BaseRetriever, Document
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+
+
+class MetadataIndex:
+    """Class for an inverted index of chunk metadata values to vector index positions.
+
+    Every metadata field with hashable values is indexed, so fields added to the chunks later (e.g. title
+    or year) can be filtered on without changes.
+
+    Attributes:
+    - fields (dict): Field -> {value: list of positions}.
+    - size (int): Number of positions indexed.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.size = 0
+
+    def add(self, metadatas, start=None):
+        """Index the metadata of consecutive positions.
+
+        Args:
+            metadatas (iterable): Metadata dict of each chunk, in position order.
+            start (int, optional): Position of the first chunk. Defaults to after the indexed ones.
+        """
+        position = self.size if start is None else start
+        for metadata in metadatas:
+            for field, value in metadata.items():
+                try:
+                    self.fields.setdefault(field, {}).setdefault(value, []).append(
+                        position
+                    )
+                except TypeError:
+                    # Unhashable values (lists, dicts) cannot be filtered on.
+                    continue
+            position += 1
+        self.size = max(self.size, position)
+
+    def select(self, filter):
+        """Get the positions of the chunks matching a filter.
+
+        Args:
+            filter (dict): Field -> value or list of values, as in langchain's FAISS filter. A chunk
+                matches if, for every field, its value is one of the given values.
+
+        Returns:
+            numpy.ndarray: Sorted int64 positions of the matching chunks.
+        """
+        selected = None
+        for field, values in filter.items():
+            if not isinstance(values, list):
+                values = [values]
+            index = self.fields.get(field, {})
+            positions = np.unique(
+                np.fromiter(
+                    (p for value in values for p in index.get(value, ())),
+                    dtype=np.int64,
+                )
+            )
+            if selected is None:
+                selected = positions
+            else:
+                selected = np.intersect1d(selected, positions, assume_unique=True)
+            if not len(selected):
+                break
+        if selected is None:
+            return np.arange(self.size, dtype=np.int64)
+        return selected
+
+
+class FilteredRetriever(BaseRetriever):
+    """Retriever running VectorStore.similarity_search, which narrows the search with a metadata filter.
+
+    Attributes:
+    - vector_store (VectorStore): The vector store to search.
+    - search_kwargs (dict): Keyword arguments of the search: k and filter.
+    - search_type (str): Always "similarity".
+    """
+
+    vector_store: Any
+    search_kwargs: dict
+    search_type: str = "similarity"
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.vector_store.similarity_search(query, **self.search_kwargs)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return await self.vector_store.asimilarity_search(query, **self.search_kwargs)
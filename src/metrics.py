@@ -0,0 +1,274 @@
+"""Module for per-stage latency and token metrics of the chat pipeline.
+
+This module provides the Metrics class, which aggregates latency and prompt size histograms and token
+counters, and the Trace class, which times the stages of one request (question condensing, query
+embedding, vector search, prompt assembly and LLM completion). Every finished trace is written as a JSON
+line to the "metrics" logger, and the aggregates can be exported in the Prometheus text format, either
+dumped to a file or served over HTTP for a local scraper.
+"""
+import json
+import time
+import logging
+import threading
+import contextlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Histogram buckets of stage and request latencies, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Histogram buckets of prompt sizes, in tokens.
+PROMPT_TOKEN_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+# Recent observations kept per histogram to compute exact percentiles.
+RECENT_SAMPLES = 1024
+
+
+class Histogram:
+    """Class for a cumulative histogram, in the way Prometheus defines them.
+
+    Attributes:
+    - buckets (tuple): Upper bounds of the buckets, in increasing order.
+    - counts (list): Number of observations less than or equal to each bucket bound.
+    - sum (float): Sum of all observations.
+    - count (int): Number of observations.
+    - recent (deque): The most recent observations.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value):
+        """Record one observation."""
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, q):
+        """Return the q-th percentile of the recent observations, or None if there are none."""
+        return float(np.percentile(self.recent, q)) if self.recent else None
+
+
+class Metrics:
+    """Class to aggregate the metrics of the chat pipeline.
+
+    Metrics are identified by a name and a set of labels, e.g. ("chat_stage_seconds", {"stage": "llm"}).
+
+    Attributes:
+    - histograms (dict): (name, labels) -> Histogram.
+    - counters (dict): (name, labels) -> float.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """Record an observation in a histogram, creating it with the given buckets on first use."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def trace(self, operation):
+        """Start timing a request.
+
+        Args:
+            operation (str): Name of the request type (e.g. "ask", "ask_stream", "aask").
+
+        Returns:
+            Trace: Trace to time the stages of the request in.
+        """
+        return Trace(self, operation)
+
+    def summary(self, name="chat_stage_seconds"):
+        """Get the percentiles of the recent observations of a histogram, by label set.
+
+        Returns:
+            dict: Labels (as "key=value,...") -> {"count", "p50", "p95", "max"}.
+        """
+        with self._lock:
+            histograms = [
+                (labels, h) for (n, labels), h in self.histograms.items() if n == name
+            ]
+            return {
+                ",".join(f"{k}={v}" for k, v in labels): {
+                    "count": h.count,
+                    "p50": h.percentile(50),
+                    "p95": h.percentile(95),
+                    "max": max(h.recent) if h.recent else None,
+                }
+                for labels, h in histograms
+            }
+
+    def prometheus_text(self):
+        """Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics, one sample per line.
+        """
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), h in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, count in zip(h.buckets, h.counts):
+                        bucket_labels = labels + (("le", bound),)
+                        lines.append(f"{name}_bucket{_labels(bucket_labels)} {count}")
+                    inf_labels = labels + (("le", "+Inf"),)
+                    lines.append(f"{name}_bucket{_labels(inf_labels)} {h.count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {h.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Dump all metrics in the Prometheus text format to a file (e.g. for node_exporter's textfile collector)."""
+        try:
+            with open(path, "w") as f:
+                f.write(self.prometheus_text())
+        except Exception as e:
+            logging.error(f"Failed to write metrics: {e}")
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve the metrics in the Prometheus text format at http://host:port/metrics.
+
+        The server runs in a daemon thread and is started at most once per Metrics object.
+
+        Args:
+            port (int): Port to listen on.
+            host (str): Address to listen on; local only by default.
+        """
+        if self._server is not None:
+            return
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            logging.info(f"Serving metrics at http://{host}:{port}/metrics")
+        except Exception as e:
+            logging.error(f"Failed to serve metrics: {e}")
+
+    def reset(self):
+        """Forget all recorded metrics."""
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+class Trace:
+    """Class to time the stages of one request.
+
+    Stages are timed with span(); time spent in the same stage several times is added up. finish() records
+    the stage and request latencies and the token counts in the Metrics and logs the trace as JSON.
+
+    Attributes:
+    - operation (str): Name of the request type.
+    - stages (dict): Stage name -> seconds spent in it.
+    - attributes (dict): Other facts about the request (token counts, answer cache hit, ...).
+    """
+
+    def __init__(self, metrics, operation):
+        self.metrics = metrics
+        self.operation = operation
+        self.stages = {}
+        self.attributes = {}
+        self.start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """Time the code run in the context as (part of) a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+
+    def set(self, **attributes):
+        """Record facts about the request, e.g. prompt_tokens and completion_tokens."""
+        self.attributes.update(attributes)
+
+    def elapsed(self):
+        """Return the seconds since the request started."""
+        return time.perf_counter() - self.start
+
+    def finish(self):
+        """Record the trace in the metrics and log it as a JSON line."""
+        total = self.elapsed()
+        for stage, seconds in self.stages.items():
+            self.metrics.observe(
+                "chat_stage_seconds", seconds, operation=self.operation, stage=stage
+            )
+        self.metrics.observe("chat_request_seconds", total, operation=self.operation)
+        prompt_tokens = self.attributes.get("prompt_tokens")
+        completion_tokens = self.attributes.get("completion_tokens")
+        if prompt_tokens is not None:
+            self.metrics.observe(
+                "chat_prompt_tokens", prompt_tokens, PROMPT_TOKEN_BUCKETS
+            )
+            self.metrics.inc("chat_tokens_total", prompt_tokens, type="prompt")
+        if completion_tokens is not None:
+            self.metrics.inc("chat_tokens_total", completion_tokens, type="completion")
+        logging.getLogger("metrics").info(
+            json.dumps(
+                {
+                    "operation": self.operation,
+                    "total_ms": round(1000 * total, 3),
+                    "stages_ms": {
+                        stage: round(1000 * seconds, 3)
+                        for stage, seconds in self.stages.items()
+                    },
+                    **self.attributes,
+                }
+            )
+        )
+
+
+def _labels(labels):
+    """Format a label tuple as {key="value",...} (empty if there are no labels)."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+# Metrics shared by every chat of this process.
+metrics = Metrics()
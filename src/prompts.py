@@ -28,6 +28,19 @@ Chat History:
 Follow Up Input: {question}
 Standalone question:"""
 
+# -----------------------------------------------------------------------------
+# CHAT HISTORY PROMPTS
+# Used for folding older turns of long conversations into a running summary.
+# -----------------------------------------------------------------------------
+
+SUMMARIZE_HISTORY_PROMPT = """Progressively summarize the lines of conversation provided, adding onto the previous summary and returning a new summary.\
+Keep the names, numbers and topics a follow up question could refer to. Be concise.
+Current summary:
+{summary}
+New lines of conversation:
+{new_lines}
+New summary:"""
+
 # -----------------------------------------------------------------------------
 # QA PROMPTS
 # Used for answering user queries based on provided context.
@@ -0,0 +1,218 @@
+"""Module for sharing expensive, read-only resources between sessions of the same process.
+
+This module provides the ResourceRegistry class, which creates each resource once per key and hands the
+same object to every caller, and a process-wide registry with helpers for the resources the application
+shares: vector stores loaded from disk, the chains of a Chat and the answer cache. vector_store_options turns
+the configuration into the arguments those vector stores are opened with. Streamlit keeps imported modules
+loaded between reruns and sessions, so the registry lives as long as the server process.
+"""
+import os
+import json
+import logging
+import threading
+
+from src.chat import Chat
+from src.cache import AnswerCache
+from src.shards import ShardedVectorStore
+from src.vector_store import VectorStore
+
+
+class ResourceRegistry:
+    """Class to create resources once per key and share them.
+
+    Resources are created outside the registry lock, so creating one resource does not block callers of
+    other resources, while concurrent callers of the same key wait for the first one to finish.
+
+    Attributes:
+    - resources (dict): Created resources by key.
+    """
+
+    def __init__(self):
+        self.resources = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, factory):
+        """Return the resource for a key, creating it with factory() on first use.
+
+        Args:
+            key (hashable): Key of the resource.
+            factory (callable): Creates the resource. Not called if the resource already exists. If it
+                raises, nothing is stored and the next call tries again.
+
+        Returns:
+            object: The shared resource.
+        """
+        with self._lock:
+            if key in self.resources:
+                return self.resources[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self.resources:
+                    return self.resources[key]
+            resource = factory()
+            with self._lock:
+                self.resources[key] = resource
+                self._key_locks.pop(key, None)
+            logging.info(f"Shared resource created: {key[0]}")
+            return resource
+
+    def remove(self, key):
+        """Forget a resource, so the next get() creates it again."""
+        with self._lock:
+            self.resources.pop(key, None)
+
+    def clear(self):
+        """Forget all resources."""
+        with self._lock:
+            self.resources.clear()
+
+    def __len__(self):
+        return len(self.resources)
+
+
+# Registry shared by every session of this process.
+registry = ResourceRegistry()
+
+
+def vector_store_options(cfg, **kwargs):
+    """Get the VectorStore arguments for the vector store options in the configuration.
+
+    Used by the app and the batch evaluation runner, so both open vector stores the same way.
+
+    Args:
+        cfg (Config): The application configuration.
+        **kwargs: Additional arguments passed to VectorStore (e.g. folder_path); they take precedence.
+
+    Returns:
+        dict: Keyword arguments for VectorStore, with sharded=True for a ShardedVectorStore.
+    """
+    if cfg.embedding_model:
+        kwargs.setdefault("embeddings_model", cfg.embedding_model)
+    if cfg.embedding_params:
+        kwargs.setdefault("embedding_params", dict(cfg.embedding_params))
+    if cfg.docstore_format:
+        kwargs.setdefault("docstore_format", cfg.docstore_format)
+    if cfg.embedding_cache:
+        kwargs.setdefault("embedding_cache_path", cfg.embedding_cache_path)
+        kwargs.setdefault("embedding_cache_size", cfg.embedding_cache_size or 200000)
+    if cfg.query_cache:
+        kwargs.setdefault("query_cache_size", cfg.query_cache_size or 1024)
+        kwargs.setdefault("query_cache_ttl", cfg.query_cache_ttl)
+        kwargs.setdefault("query_cache_path", cfg.query_cache_path)
+    # The shards of a sharded index are searched by vector only.
+    if cfg.lexical_search and not cfg.sharded_index:
+        kwargs.setdefault("lexical_search", True)
+        kwargs.setdefault("search_mode", cfg.search_mode or "similarity")
+        kwargs.setdefault("hybrid_params", dict(cfg.hybrid_search or {}))
+    if cfg.sharded_index:
+        kwargs.setdefault("sharded", True)
+        kwargs.setdefault("max_loaded_shards", cfg.max_loaded_shards)
+        kwargs.setdefault("search_workers", cfg.search_workers or 4)
+    vector_store = dict(cfg.vector_store)
+    kwargs.setdefault("db_name", vector_store.pop("name", "FAISS"))
+    kwargs.setdefault("index_type", vector_store.pop("index_type", "auto"))
+    kwargs.setdefault(
+        "index_params", {k: v for k, v in vector_store.items() if v is not None}
+    )
+    return kwargs
+
+
+def shared_vector_store(folder_path, mmap=True, **kwargs):
+    """Load a saved vector store once per process and share it read-only.
+
+    Args:
+        folder_path (str): Directory of the saved vector store.
+        mmap (bool): Memory-map the index (see VectorStore.load).
+        **kwargs: Additional arguments passed to VectorStore (or ShardedVectorStore with sharded=True);
+            part of the registry key.
+
+    Returns:
+        VectorStore: The shared vector store, or None if it could not be loaded.
+    """
+    key = (
+        "vector_store",
+        os.path.abspath(folder_path),
+        bool(mmap),
+        json.dumps(kwargs, sort_keys=True, default=str),
+    )
+
+    def load():
+        options = dict(kwargs)
+        if options.pop("sharded", False):
+            db = ShardedVectorStore(folder_path=folder_path, **options)
+        else:
+            db = VectorStore(folder_path=folder_path, **options)
+        if db.load(mmap=mmap) is None:
+            raise ValueError(f"Failed to load vector store: {folder_path}")
+        # Shared between sessions, so nobody may modify it.
+        db.read_only = True
+        return db
+
+    try:
+        return registry.get(key, load)
+    except Exception as e:
+        logging.error(f"Failed to get shared vector store: {e}")
+        return None
+
+
+def shared_answer_cache(threshold=0.97, max_entries=1000):
+    """Get the answer cache shared by every session of this process.
+
+    Args:
+        threshold (float): Minimum cosine similarity for two questions to share an answer.
+        max_entries (int): Maximum number of cached answers.
+
+    Returns:
+        AnswerCache: The shared answer cache.
+    """
+    key = ("answer_cache", threshold, max_entries)
+    return registry.get(key, lambda: AnswerCache(threshold, max_entries))
+
+
+def shared_chat(
+    config, vector_store, qa_prompt, conversational=True, answer_cache=None
+):
+    """Create the chains of a Chat once per vector store, prompt and LLM settings and share them.
+
+    Vector stores are told apart by their directory and fingerprint, so a store loaded again from the
+    same directory with the same chunks gets the same chat.
+
+    The returned Chat must not be used directly for a conversation; call Chat.with_history() to get a
+    view with its own chat history.
+
+    Args:
+        config (Config): The application configuration (LLM model and temperature).
+        vector_store (VectorStore): Shared vector store to retrieve document chunks from.
+        qa_prompt (str): The QA prompt.
+        conversational (bool): Conversational (ConversationalRetrievalChain) or single Q&A (RetrievalQA).
+        answer_cache (AnswerCache, optional): Answer cache used by the chat.
+
+    Returns:
+        Chat: The shared chat.
+    """
+    # Keyed on what the objects hold rather than on id(), so a store loaded again does not add (and keep
+    # alive) another chat, and the key never depends on the address of an object.
+    key = (
+        "chat",
+        os.path.abspath(vector_store.folder_path),
+        vector_store.fingerprint(),
+        str(config.llm_model),
+        str(config.temperature),
+        qa_prompt,
+        conversational,
+        None
+        if answer_cache is None
+        else (answer_cache.threshold, answer_cache.max_entries),
+    )
+    return registry.get(
+        key,
+        lambda: Chat(
+            config=config,
+            qa_prompt=qa_prompt,
+            conversational=conversational,
+            vector_store=vector_store,
+            answer_cache=answer_cache,
+        ),
+    )
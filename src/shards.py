@@ -0,0 +1,523 @@
+"""Module for a vector store sharded into one index per source document.
+
+This module provides the ShardedVectorStore class, which keeps the chunks of every source document in a
+VectorStore of its own, saved in its own folder next to a small manifest. Adding, replacing or removing a
+document only rewrites (or deletes) that document's shard, shards are loaded on first use so only the
+shards a query needs are resident, and searches run on the shards in parallel in a thread pool and merge
+their top-k results.
+"""
+import os
+import json
+import shutil
+import asyncio
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+
+from src.cache import cached_embeddings
+from src.document import chunk_ids
+from src.embeddings import create_embeddings
+from src.index import index_rows
+from src.metadata import FilteredRetriever
+from src.vector_store import VectorStore
+
+
+def shard_name(source):
+    """Return the folder name of the shard of a source document (a hash, as sources are file paths)."""
+    return hashlib.sha256(str(source).encode("utf-8")).hexdigest()[:16]
+
+
+class ShardedVectorStore:
+    """Class for a vector store with one FAISS index per source document.
+
+    Offers the same operations as VectorStore (create, add, upsert, delete, save, load and similarity
+    searches) over a folder laid out as ``{index_name}.shards.json`` (the manifest: source, number of
+    chunks and fingerprint of every shard) and ``shards/<shard name>/`` (one VectorStore per source).
+    Loading only reads the manifest. A search embeds the query once, searches the shards in
+    search_workers threads (only the shards of the sources in a "source" filter, if given) and merges
+    their results.
+
+    Attributes:
+    - folder_path (str): Path to the folder where the shards and manifest are or will be saved.
+    - index_name (str): Name of the index of every shard and of the manifest.
+    - shard_options (dict): VectorStore arguments of the shards (embeddings_model, index_type, ...).
+    - embeddings (object): Embeddings object shared by all shards.
+    - manifest (dict): Shard name -> {"source", "chunks", "fingerprint"} of every shard.
+    - max_loaded_shards (int): Maximum number of shards kept in memory, or None for no limit. The least
+      recently used unmodified shards are unloaded first.
+    - search_workers (int): Number of threads searching shards in parallel.
+    - read_only (bool): True if the store is shared or memory-mapped and cannot be modified.
+    """
+
+    def __init__(
+        self,
+        folder_path="../db",
+        index_name="index",
+        max_loaded_shards=None,
+        search_workers=4,
+        **shard_options,
+    ):
+        self.folder_path = folder_path
+        self.index_name = index_name
+        # Searches are merged across shards by vector score only, so shards build no lexical index.
+        for option in ("lexical_search", "search_mode", "hybrid_params"):
+            shard_options.pop(option, None)
+        self.shard_options = shard_options
+        # Created once, so the shards share the API client and the embedding caches.
+        self.embeddings = cached_embeddings(
+            create_embeddings(
+                shard_options.get("embeddings_model", "OpenAIEmbeddings"),
+                **(shard_options.get("embedding_params") or {}),
+            ),
+            embedding_cache_path=shard_options.get("embedding_cache_path"),
+            embedding_cache_size=shard_options.get("embedding_cache_size", 200000),
+            query_cache_size=shard_options.get("query_cache_size", 0),
+            query_cache_ttl=shard_options.get("query_cache_ttl"),
+            query_cache_path=shard_options.get("query_cache_path"),
+        )
+        self.manifest = {}
+        self.max_loaded_shards = max_loaded_shards
+        self.search_workers = max(1, search_workers or 1)
+        self.read_only = False
+        self.mmap = False
+        self._loaded = OrderedDict()
+        self._modified = set()
+        self._removed = set()
+        self._lock = threading.Lock()
+        self._shard_locks = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.search_workers)
+
+    def create_from_docs(self, documents, ids=None):
+        """Create the shards of a list of documents, replacing any existing shards.
+
+        Args:
+            documents (list): List of documents to be added to the database.
+            ids (list, optional): List of IDs corresponding to the documents. Defaults to content hash IDs.
+
+        Returns:
+            ShardedVectorStore: This store, or None if it could not be created.
+        """
+        try:
+            self.__check_writable()
+        except Exception as e:
+            logging.error(f"Failed to create vector store: {e}")
+            return None
+        self._removed.update(self.manifest)
+        self.manifest = {}
+        self._loaded.clear()
+        self._modified.clear()
+        if self.add_docs(documents, ids=ids) or not documents:
+            return self
+        return None
+
+    def add_docs(self, documents, ids=None):
+        """Embed documents and add them to the shards of their sources.
+
+        Args:
+            documents (list): List of documents to be added.
+            ids (list, optional): List of IDs corresponding to the documents. Defaults to content hash IDs.
+
+        Returns:
+            list: List of document IDs added to the database.
+        """
+        try:
+            embeddings = self.embeddings.embed_documents(
+                [doc.page_content for doc in documents]
+            )
+        except Exception as e:
+            logging.error(f"Failed to add documents to vector store: {e}")
+            return []
+        return self.add_embeddings(documents, embeddings, ids=ids)
+
+    def add_embeddings(self, documents, embeddings, ids=None):
+        """Add documents whose embeddings were already computed to the shards of their sources.
+
+        Shards are created for sources that do not have one yet.
+
+        Args:
+            documents (list): List of documents to be added.
+            embeddings (list): List of embedding vectors, one per document.
+            ids (list, optional): List of IDs corresponding to the documents. Defaults to content hash IDs.
+
+        Returns:
+            list: List of document IDs added to the database.
+        """
+        try:
+            self.__check_writable()
+            ids = ids or chunk_ids(documents)
+            added_ids = []
+            groups = self.__by_source(zip(documents, embeddings, ids))
+            for source, items in groups.items():
+                shard_documents, shard_embeddings, shard_ids = map(list, zip(*items))
+                shard = self.__shard(shard_name(source), source=source)
+                added_ids.extend(
+                    shard.add_embeddings(
+                        shard_documents, shard_embeddings, ids=shard_ids
+                    )
+                )
+                self.__modified(shard_name(source))
+            return added_ids
+        except Exception as e:
+            logging.error(f"Failed to add embeddings to vector store: {e}")
+            return []
+
+    def upsert_docs(self, documents, ids=None):
+        """Insert or replace the chunks of one or more documents, in the shards of their sources.
+
+        Only the changed chunks are embedded or removed (see VectorStore.upsert_docs), and only the shards
+        of the given documents are loaded.
+
+        Args:
+            documents (list): Complete list of chunks for each document being upserted.
+            ids (list, optional): List of IDs corresponding to the documents. Defaults to content hash IDs.
+
+        Returns:
+            list: List of document IDs added to the database.
+        """
+        try:
+            self.__check_writable()
+            ids = ids or chunk_ids(documents)
+            added_ids = []
+            for source, items in self.__by_source(zip(documents, ids)).items():
+                shard_documents, shard_ids = map(list, zip(*items))
+                shard = self.__shard(shard_name(source), source=source)
+                added_ids.extend(shard.upsert_docs(shard_documents, ids=shard_ids))
+                self.__modified(shard_name(source))
+            return added_ids
+        except Exception as e:
+            logging.error(f"Failed to upsert documents in vector store: {e}")
+            return []
+
+    def delete_by_source(self, source):
+        """Delete every chunk of a document, by dropping its shard. The shard folder is deleted by save().
+
+        Args:
+            source (str): Source of the document (the ``source`` metadata of its chunks).
+
+        Returns:
+            list: List of document IDs deleted from the database.
+        """
+        try:
+            self.__check_writable()
+            name = shard_name(source)
+            if name not in self.manifest:
+                return []
+            shard = self.__shard(name)
+            ids = list(shard.vector_store.index_to_docstore_id.values())
+            with self._lock:
+                del self.manifest[name]
+                self._loaded.pop(name, None)
+                self._modified.discard(name)
+                self._removed.add(name)
+            return ids
+        except Exception as e:
+            logging.error(f"Failed to delete documents from vector store: {e}")
+            return []
+
+    def save(self):
+        """Save the modified shards and the manifest, and delete the folders of removed shards.
+
+        Unmodified shards are not rewritten.
+        """
+        try:
+            self.__check_writable()
+            path = Path(self.folder_path)
+            path.mkdir(exist_ok=True, parents=True)
+            for name in list(self._modified):
+                shard = self._loaded[name]
+                shard.save()
+                self.manifest[name]["chunks"] = len(
+                    shard.vector_store.index_to_docstore_id
+                )
+                self.manifest[name]["fingerprint"] = shard.fingerprint()
+            for name in self._removed - set(self.manifest):
+                shutil.rmtree(self.__shard_path(name), ignore_errors=True)
+            manifest_path = path / f"{self.index_name}.shards.json"
+            with open(f"{manifest_path}.tmp", "w") as f:
+                json.dump({"shards": self.manifest}, f, indent=1)
+            os.replace(f"{manifest_path}.tmp", manifest_path)
+            self._modified.clear()
+            self._removed.clear()
+            self.__evict()
+        except Exception as e:
+            logging.error(f"Failed to save vector store: {e}")
+
+    def load(self, mmap=False):
+        """Load the manifest of a sharded vector store. Shards are loaded when a search first needs them.
+
+        A folder holding a single (unsharded) index and no manifest, e.g. one saved before sharded_index
+        was turned on, is split into shards first (see migrate).
+
+        Args:
+            mmap (bool): Memory-map the shards' indexes read-only (see VectorStore.load).
+
+        Returns:
+            ShardedVectorStore: This store, or None if it could not be loaded.
+        """
+        try:
+            path = Path(self.folder_path)
+            manifest_path = path / f"{self.index_name}.shards.json"
+            if (
+                not manifest_path.exists()
+                and (path / f"{self.index_name}.faiss").exists()
+            ):
+                self.migrate()
+            with open(manifest_path, "r") as f:
+                self.manifest = json.load(f)["shards"]
+            self.mmap = mmap
+            self.read_only = mmap
+            self._loaded.clear()
+            self._modified.clear()
+            self._removed.clear()
+            return self
+        except Exception as e:
+            logging.error(f"Failed to load vector store: {e}")
+            return None
+
+    def migrate(self):
+        """Split the single (unsharded) index saved in the folder into one shard per source and save them.
+
+        The vectors are copied from the index instead of being embedded again, so they are approximate for
+        a quantized index saved without full-precision vectors. The single index is left in place and can
+        still be loaded with sharded_index turned off.
+
+        Raises:
+            ValueError: If the single index cannot be loaded or split.
+        """
+        logging.info(f"Splitting the vector store in {self.folder_path} into shards")
+        single = VectorStore(
+            folder_path=self.folder_path,
+            index_name=self.index_name,
+            embeddings=self.embeddings,
+            **self.shard_options,
+        )
+        if single.load() is None:
+            raise ValueError(f"Failed to load vector store: {self.folder_path}")
+        id_map = single.vector_store.index_to_docstore_id
+        positions = list(range(len(id_map)))
+        ids = [id_map[position] for position in positions]
+        documents = [single.vector_store.docstore.search(_id) for _id in ids]
+        vectors = index_rows(single.vector_store.index, positions)
+        self.read_only = False
+        if self.create_from_docs([]) is None or len(
+            self.add_embeddings(documents, vectors.tolist(), ids=ids)
+        ) != len(ids):
+            raise ValueError(f"Failed to split vector store: {self.folder_path}")
+        self.save()
+
+    def similarity_search(self, query, k=4, filter=None):
+        """Perform a similarity search in the shards.
+
+        Args:
+            query (str): Query to search for.
+            k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches. A "source" filter limits
+                the search to (and only loads) the shards of those sources.
+
+        Returns:
+            list: List of most similar documents/entries.
+        """
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)
+        ]
+
+    def similarity_search_with_score(self, query, k=4, filter=None):
+        """Perform a similarity search in the shards and get scores.
+
+        Args:
+            query (str): Query to search for.
+            k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches.
+
+        Returns:
+            list: List of most similar documents/entries along with scores.
+        """
+        embedding = self.embeddings.embed_query(query)
+        return self.similarity_search_with_score_by_vector(
+            embedding, k=k, filter=filter
+        )
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None):
+        """Perform a similarity search in the shards with an already embedded query.
+
+        Args:
+            embedding (list): Embedding of the query.
+            k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches.
+
+        Returns:
+            list: List of most similar documents/entries.
+        """
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_score_by_vector(
+                embedding, k=k, filter=filter
+            )
+        ]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None):
+        """Search the k nearest chunks in every shard in parallel and merge the results.
+
+        Args:
+            embedding (list): Embedding of the query.
+            k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches.
+
+        Returns:
+            list: List of most similar documents/entries along with scores.
+        """
+        filter = dict(filter or {})
+        names = self.__shard_names(filter.pop("source", None))
+
+        def search(name):
+            shard = self.__shard(name)
+            if shard.vector_store is None:
+                return False, []
+            hits = shard.similarity_search_with_score_by_vector(
+                embedding, k=k, filter=filter or None
+            )
+            metric = shard.vector_store.index.metric_type
+            return metric == faiss.METRIC_INNER_PRODUCT, hits
+
+        results = []
+        largest_first = False
+        for inner_product, hits in self._executor.map(search, names):
+            results.extend(hits)
+            largest_first = largest_first or inner_product
+        # Smaller L2 distances are more similar, larger inner products are.
+        results.sort(key=lambda hit: hit[1], reverse=largest_first)
+        return results[:k]
+
+    async def asimilarity_search_by_vector(self, embedding, k=4, filter=None):
+        """Asynchronously perform a similarity search with an already embedded query."""
+        return await asyncio.to_thread(
+            self.similarity_search_by_vector, embedding, k, filter
+        )
+
+    async def asimilarity_search(self, query, k=4, filter=None):
+        """Asynchronously perform a similarity search, embedding the query with the async API."""
+        return [
+            doc
+            for doc, _ in await self.asimilarity_search_with_score(
+                query, k=k, filter=filter
+            )
+        ]
+
+    async def asimilarity_search_with_score(self, query, k=4, filter=None):
+        """Asynchronously perform a similarity search and get scores."""
+        embedding = await self.embeddings.aembed_query(query)
+        return await asyncio.to_thread(
+            self.similarity_search_with_score_by_vector, embedding, k, filter
+        )
+
+    def fingerprint(self):
+        """Get a hash of the chunks currently in the store, from the fingerprints of its shards.
+
+        Returns:
+            str: SHA-256 hex digest, or None if the store is empty.
+        """
+        fingerprints = []
+        for name, entry in self.manifest.items():
+            if name in self._modified:
+                fingerprints.append(self._loaded[name].fingerprint() or "")
+            else:
+                fingerprints.append(entry.get("fingerprint") or "")
+        if not fingerprints:
+            return None
+        return hashlib.sha256(
+            "\0".join(sorted(fingerprints)).encode("utf-8")
+        ).hexdigest()
+
+    def retriever(self, search_kwargs=None):
+        """Get the retriever object, running similarity_search with the given k and filter.
+
+        Args:
+            search_kwargs (dict, optional): Keyword arguments of the search, k and filter.
+
+        Returns:
+            object: Retriever object.
+        """
+        return FilteredRetriever(
+            vector_store=self, search_kwargs=dict(search_kwargs or {})
+        )
+
+    def loaded_shards(self):
+        """Get the names of the shards currently in memory."""
+        with self._lock:
+            return list(self._loaded)
+
+    def __shard_names(self, sources):
+        """Return the names of the shards to search: those of the given sources, or all of them."""
+        if sources is None:
+            return list(self.manifest)
+        if not isinstance(sources, list):
+            sources = [sources]
+        return [
+            shard_name(source)
+            for source in sources
+            if shard_name(source) in self.manifest
+        ]
+
+    def __shard_path(self, name):
+        return str(Path(self.folder_path) / "shards" / name)
+
+    def __shard(self, name, source=None):
+        """Return a shard, loading it on first use (or creating it empty for a new source)."""
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name]
+            shard_lock = self._shard_locks.setdefault(name, threading.Lock())
+        with shard_lock:
+            with self._lock:
+                if name in self._loaded:
+                    return self._loaded[name]
+            shard = VectorStore(
+                folder_path=self.__shard_path(name),
+                index_name=self.index_name,
+                embeddings=self.embeddings,
+                **self.shard_options,
+            )
+            if name in self.manifest:
+                if shard.load(mmap=self.mmap) is None:
+                    raise ValueError(f"Failed to load shard {name}")
+                shard.read_only = self.read_only
+            with self._lock:
+                # Shards of other sources may be created concurrently.
+                self.manifest.setdefault(name, {"source": source, "chunks": 0})
+                self._loaded[name] = shard
+            self.__evict()
+            return shard
+
+    def __modified(self, name):
+        with self._lock:
+            self._modified.add(name)
+
+    def __evict(self):
+        """Unload the least recently used unmodified shards beyond max_loaded_shards."""
+        if self.max_loaded_shards is None:
+            return
+        with self._lock:
+            for name in list(self._loaded):
+                if len(self._loaded) <= self.max_loaded_shards:
+                    break
+                if name not in self._modified:
+                    del self._loaded[name]
+
+    @staticmethod
+    def __by_source(items):
+        """Group (document, ...) tuples by the source of the document, keeping their order."""
+        groups = {}
+        for item in items:
+            groups.setdefault(item[0].metadata.get("source"), []).append(item)
+        return groups
+
+    def __check_writable(self):
+        if self.read_only:
+            raise ValueError("Shared or memory-mapped vector stores are read-only")
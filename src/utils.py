@@ -1,11 +1,17 @@
 import re
 import logging
+import contextlib
+import aiohttp
 import requests
 import openai
+import tiktoken
 
 # Set up a logger for the function
 logger = logging.getLogger(__name__)
 
+# Tokenizers by model name, None if the tokenizer could not be loaded (e.g. offline).
+_encodings = {}
+
 
 def validate_openai_key(api_key):
     """
@@ -41,6 +47,86 @@ def validate_openai_key(api_key):
         return False
 
 
+@contextlib.asynccontextmanager
+async def openai_session(max_connections=100):
+    """
+    Share one HTTP connection pool between all async OpenAI calls made inside the context.
+
+    The openai library uses the aiohttp session stored in ``openai.aiosession`` for every async request
+    (``acreate``), so embeddings and chat completions started from this context, including tasks created
+    in it, reuse the same keep-alive connections. Requests beyond max_connections wait for a free
+    connection instead of opening more.
+
+    Parameters:
+    - max_connections (int): Maximum number of simultaneous connections to the API.
+
+    Yields:
+    - aiohttp.ClientSession: The shared session.
+    """
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=max_connections)
+    )
+    token = openai.aiosession.set(session)
+    try:
+        yield session
+    finally:
+        openai.aiosession.reset(token)
+        await session.close()
+
+
+def _encoding(model):
+    """Return the tiktoken tokenizer of a model, or None if it cannot be loaded."""
+    if model not in _encodings:
+        try:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                # Not an OpenAI model name (e.g. "fake"); use the GPT-4 tokenizer.
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"Token counts of {model} are estimated: {e}")
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def count_tokens(text, model="gpt-4"):
+    """
+    Count the tokens of a text the way the OpenAI model tokenizes it.
+
+    tiktoken downloads the tokenizer files on first use. If that is not possible, the count is estimated
+    as one token per four characters.
+
+    Parameters:
+    - text (str): The text to count the tokens of.
+    - model (str): The OpenAI model name.
+
+    Returns:
+    - int: The number of tokens.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def truncate_tokens(text, max_tokens, model="gpt-4"):
+    """
+    Keep the beginning of a text up to a number of tokens.
+
+    Parameters:
+    - text (str): The text to truncate.
+    - max_tokens (int): Maximum number of tokens to keep.
+    - model (str): The OpenAI model name.
+
+    Returns:
+    - str: The truncated text.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[: 4 * max_tokens]
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+
 def remove_non_ascii(text):
     return re.sub(r"[^\x00-\x7F]+", " ", text)
 
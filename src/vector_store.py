@@ -3,9 +3,36 @@
 This module provides the VectorStore class which offers functionalities for handling vector databases, 
 embedding documents, and performing similarity searches.
 """
+import pickle
+import asyncio
+import hashlib
 import logging
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain.docstore.in_memory import InMemoryDocstore
 from langchain.vectorstores import FAISS, Chroma
-from langchain.embeddings import OpenAIEmbeddings
+
+from src.cache import CachedEmbeddings, cached_embeddings
+from src.document import chunk_ids
+from src.embeddings import create_embeddings
+from src.lexical import HybridRetriever, LexicalIndex, fuse_scores
+from src.metadata import FilteredRetriever, MetadataIndex
+from src.index import (
+    RerankIndex,
+    build_index,
+    index_quantization,
+    index_type_of,
+    index_vectors,
+    read_index,
+    remove_positions,
+    resolve_index_type,
+    search_subset,
+    set_search_params,
+    write_index,
+)
+from src.docstore import ColumnarDocstore, RowIdMap
 
 
 class VectorStore:
@@ -13,54 +40,140 @@ class VectorStore:
 
     This class provides functionalities to:
     - Create, save, and load vector databases.
-    - Add documents to vector databases.
+    - Add, upsert, and delete documents in vector databases.
     - Perform similarity searches on vector databases.
 
     Attributes:
     - db_name (str): Name of the vector database (e.g., "FAISS").
-    - embeddings_model (str): Name of the embeddings model (e.g., "OpenAIEmbeddings").
-    - embeddings (object): Embeddings object based on embeddings_model.
+    - embeddings_model (str): Name of the embeddings model (e.g., "OpenAIEmbeddings"), see src.embeddings.
+    - embedding_params (dict): Arguments of the embeddings model (e.g., size for "HashingEmbeddings").
+    - embeddings (object): Embeddings object based on embeddings_model, or the one given (e.g., shared by
+      the shards of a ShardedVectorStore).
     - folder_path (str): Path to the folder where the database is or will be saved.
     - index_name (str): Name of the database index.
+    - embedding_cache_path (str): Path to the on-disk embedding cache, or None to disable caching.
+    - embedding_cache_size (int): Maximum number of embeddings kept in the embedding cache.
+    - query_cache_size (int): Maximum number of query embeddings kept in memory, or 0 to disable caching.
+    - query_cache_ttl (float): Seconds a cached query embedding stays valid in memory, or None.
+    - query_cache_path (str): Path to the on-disk query embedding cache, or None to keep queries in memory only.
+    - docstore_format (str): Format used to save document chunks, "pickle" (langchain default) or "arrow".
+    - index_type (str): FAISS index type, "flat", "ivf_flat", "hnsw", "ivf_pq" or "auto" (by corpus size).
+    - index_params (dict): Index parameters (nlist, nprobe, ef_search, hnsw_m, ef_construction, pq_m, pq_nbits,
+      quantization, rerank_factor).
+    - lexical_search (bool): Build a lexical (BM25) index of the chunks and save it next to the vector index.
+    - search_mode (str): Retrieval of retriever(), "similarity" (vector search) or "hybrid" (lexical and
+      vector search fused, requires lexical_search).
+    - hybrid_params (dict): Hybrid search parameters (lexical_weight, fetch_k, lexical_only,
+      identifier_ratio, rare_df_ratio).
     - vector_store (object): Vector database object.
+    - lexical_index (LexicalIndex): Lexical index of the chunks, or None if lexical_search is off.
+    - source_index (dict): Maps each document source to the IDs of its chunks. Built lazily.
+    - metadata_index (MetadataIndex): Maps chunk metadata values to index positions, for filtered
+      searches. Built lazily.
+    - read_only (bool): True if the index was loaded memory-mapped and cannot be modified.
     """
 
     def __init__(
         self,
         db_name="FAISS",
         embeddings_model="OpenAIEmbeddings",
+        embedding_params=None,
         folder_path="../db",
         index_name="index",
+        embedding_cache_path=None,
+        embedding_cache_size=200000,
+        docstore_format="pickle",
+        index_type="auto",
+        index_params=None,
+        query_cache_size=0,
+        query_cache_ttl=None,
+        query_cache_path=None,
+        lexical_search=False,
+        search_mode="similarity",
+        hybrid_params=None,
+        embeddings=None,
     ):
         self.db_name = db_name
         self.embeddings_model = embeddings_model
-        self.embeddings = self.__embeddings()
+        self.embedding_params = embedding_params or {}
+        self.embedding_cache_path = embedding_cache_path
+        self.embedding_cache_size = embedding_cache_size
+        self.query_cache_size = query_cache_size
+        self.query_cache_ttl = query_cache_ttl
+        self.query_cache_path = query_cache_path
+        self.docstore_format = docstore_format
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.lexical_search = lexical_search
+        self.search_mode = search_mode
+        self.hybrid_params = hybrid_params or {}
+        self.embeddings = embeddings or self.__embeddings()
         self.folder_path = folder_path
         self.index_name = index_name
         self.vector_store = None
+        self.lexical_index = None
+        self.source_index = None
+        self.metadata_index = None
+        self.read_only = False
+        self._fingerprint = None
 
     def __embeddings(self):
-        if self.embeddings_model == "OpenAIEmbeddings":
-            return OpenAIEmbeddings()
-        else:
-            raise ValueError(f"Invalid embeddings model: {self.embeddings_model}")
+        return cached_embeddings(
+            create_embeddings(self.embeddings_model, **self.embedding_params),
+            embedding_cache_path=self.embedding_cache_path,
+            embedding_cache_size=self.embedding_cache_size,
+            query_cache_size=self.query_cache_size,
+            query_cache_ttl=self.query_cache_ttl,
+            query_cache_path=self.query_cache_path,
+        )
+
+    def embedding_cache_stats(self):
+        """Get hit/miss counters of the embedding cache.
+
+        Returns:
+            dict: Cache statistics, or None if the embedding cache is disabled.
+        """
+        if (
+            isinstance(self.embeddings, CachedEmbeddings)
+            and self.embeddings.cache is not None
+        ):
+            return self.embeddings.cache.stats()
+        return None
+
+    def query_cache_stats(self):
+        """Get hit/miss counters of the query embedding cache.
+
+        Returns:
+            dict: Cache statistics, or None if the query cache is disabled.
+        """
+        if (
+            isinstance(self.embeddings, CachedEmbeddings)
+            and self.embeddings.query_cache is not None
+        ):
+            return self.embeddings.query_cache.stats()
+        return None
 
     def create_from_docs(self, documents, ids=None):
         """Create a vector database from a list of documents.
 
         Args:
             documents (list): List of documents to be added to the database.
-            ids (list, optional): List of IDs corresponding to the documents.
+            ids (list, optional): List of IDs corresponding to the documents. Defaults to content hash IDs.
 
         Returns:
             object: Vector database object.
         """
         try:
             if self.db_name == "FAISS":
-                # Will need to implement document IDs for the document chunks for more control over what is stored. This will always be None currently.
+                ids = ids or chunk_ids(documents)
                 self.vector_store = FAISS.from_documents(
                     documents, self.embeddings, ids=ids
                 )
+                self.source_index = None
+                self.metadata_index = None
+                self.read_only = False
+                self.__index_sources(documents, ids)
+                self.__index_lexical(documents, ids, reset=True)
                 return self.vector_store
             elif self.db_name == "Chroma":
                 # TODO: implement Chroma
@@ -77,12 +190,65 @@ class VectorStore:
             return None
 
     def save(self):
-        """Save the current vector database to a local directory."""
+        """Save the current vector database to a local directory.
+
+        With docstore_format "arrow", document chunks are written to a columnar ``{index_name}.arrow`` file
+        instead of the pickled ``{index_name}.pkl``; the file of the other format is removed. The lexical
+        index, if any, is written to ``{index_name}.bm25``.
+        """
         try:
             if self.db_name == "FAISS":
-                self.vector_store.save_local(
-                    folder_path=self.folder_path, index_name=self.index_name
-                )
+                self.__check_writable()
+                index = self.vector_store.index
+                current = (index_type_of(index), index_quantization(index))
+                # Only rebuild when the configuration or the corpus size calls for another index.
+                if current != self.__target_index_kind(index.ntotal):
+                    self.build_index()
+                if self.docstore_format == "arrow":
+                    path = Path(self.folder_path)
+                    path.mkdir(exist_ok=True, parents=True)
+                    id_map = self.vector_store.index_to_docstore_id
+                    write_index(
+                        self.vector_store.index, str(path / f"{self.index_name}.faiss")
+                    )
+                    ColumnarDocstore.write(
+                        str(path / f"{self.index_name}.arrow"),
+                        self.vector_store.docstore,
+                        [id_map[position] for position in range(len(id_map))],
+                    )
+                    # Serve the chunks from the new file, the pending additions and deletions are in it.
+                    docstore = ColumnarDocstore.load(
+                        str(path / f"{self.index_name}.arrow")
+                    )
+                    self.vector_store.docstore = docstore
+                    self.vector_store.index_to_docstore_id = RowIdMap(docstore)
+                    (path / f"{self.index_name}.pkl").unlink(missing_ok=True)
+                elif self.docstore_format == "pickle":
+                    # Same files as FAISS.save_local, which cannot write a RerankIndex.
+                    path = Path(self.folder_path)
+                    path.mkdir(exist_ok=True, parents=True)
+                    write_index(
+                        self.vector_store.index, str(path / f"{self.index_name}.faiss")
+                    )
+                    docstore = self.vector_store.docstore
+                    id_map = self.vector_store.index_to_docstore_id
+                    if isinstance(docstore, ColumnarDocstore):
+                        # A store loaded from an Arrow docstore is pickled as langchain's in-memory docstore.
+                        ids = [str(id_map[position]) for position in range(len(id_map))]
+                        docstore = InMemoryDocstore(
+                            {_id: docstore.search(_id) for _id in ids}
+                        )
+                        id_map = dict(enumerate(ids))
+                    with open(path / f"{self.index_name}.pkl", "wb") as f:
+                        pickle.dump((docstore, id_map), f)
+                    # load() prefers an Arrow docstore, which would now be out of date.
+                    (path / f"{self.index_name}.arrow").unlink(missing_ok=True)
+                else:
+                    raise ValueError(f"Invalid docstore format: {self.docstore_format}")
+                if self.lexical_index is not None:
+                    self.lexical_index.save(
+                        str(Path(self.folder_path) / f"{self.index_name}.bm25")
+                    )
             elif self.db_name == "Chroma":
                 # TODO: implement Chroma
                 pass
@@ -91,15 +257,54 @@ class VectorStore:
         except Exception as e:
             logging.error(f"Failed to save vector store: {e}")
 
-    def load(self):
-        """Load a vector database from a local directory."""
+    def load(self, mmap=False):
+        """Load a vector database from a local directory.
+
+        Document chunks are read from ``{index_name}.arrow`` if it exists (memory-mapped, rows are decoded
+        only when a search returns them), otherwise from the pickled ``{index_name}.pkl``. With
+        lexical_search, the lexical index is read from ``{index_name}.bm25``, or built from the chunks if
+        it is missing or out of date.
+
+        Args:
+            mmap (bool): Memory-map the FAISS index read-only instead of reading it into memory. The index
+                is then shared through the OS page cache by every process that loads it, but can no longer
+                be modified or saved.
+        """
         try:
             if self.db_name == "FAISS":
-                self.vector_store = FAISS.load_local(
-                    folder_path=self.folder_path,
-                    embeddings=self.embeddings,
-                    index_name=self.index_name,
+                path = Path(self.folder_path)
+                index = read_index(
+                    str(path / f"{self.index_name}.faiss"),
+                    mmap=mmap,
+                    rerank_factor=self.index_params.get("rerank_factor"),
+                )
+                set_search_params(
+                    index,
+                    nprobe=self.index_params.get("nprobe"),
+                    ef_search=self.index_params.get("ef_search"),
                 )
+                arrow_path = path / f"{self.index_name}.arrow"
+                if arrow_path.exists():
+                    docstore = ColumnarDocstore.load(str(arrow_path))
+                    index_to_docstore_id = RowIdMap(docstore)
+                else:
+                    with open(path / f"{self.index_name}.pkl", "rb") as f:
+                        docstore, index_to_docstore_id = pickle.load(f)
+                self.vector_store = FAISS(
+                    self.embeddings.embed_query,
+                    index,
+                    docstore,
+                    index_to_docstore_id,
+                )
+                self.source_index = None
+                self.metadata_index = None
+                self._fingerprint = None
+                self.read_only = mmap
+                self.lexical_index = None
+                if self.lexical_search:
+                    self.lexical_index = self.__load_lexical_index(
+                        path / f"{self.index_name}.bm25"
+                    )
                 return self.vector_store
             elif self.db_name == "Chroma":
                 # TODO: implement Chroma
@@ -110,18 +315,78 @@ class VectorStore:
             logging.error(f"Failed to load vector store: {e}")
             return None
 
-    def add_docs(self, documents):
+    def build_index(self):
+        """Rebuild the FAISS index as the configured index type for the current corpus size.
+
+        langchain always creates an exact flat index. When index_type (or "auto" for the current number of
+        vectors) asks for an approximate index, or a scalar quantization ("fp16" or "sq8") is configured,
+        the flat index is replaced by a trained index of that type holding the same vectors in the same
+        order. With a rerank_factor, the full-precision vectors are kept for re-ranking (see RerankIndex)
+        and saved next to the index. Called by save() when the index type or quantization in use differs
+        from the configured one.
+
+        Returns:
+            str: The index type in use afterwards.
+        """
+        index = self.vector_store.index
+        target_type, quantization = self.__target_index_kind(index.ntotal)
+        rerank_factor = self.index_params.get("rerank_factor")
+        current = (index_type_of(index), index_quantization(index))
+        # Only rebuild from exact vectors, so an index is never rebuilt from lossy reconstructions.
+        exact = isinstance(index, (faiss.IndexFlat, RerankIndex))
+        if current != (target_type, quantization) and exact and index.ntotal:
+            vectors = index_vectors(index)
+            index = build_index(
+                vectors,
+                index_type=target_type,
+                nlist=self.index_params.get("nlist"),
+                hnsw_m=self.index_params.get("hnsw_m", 32),
+                ef_construction=self.index_params.get("ef_construction", 200),
+                pq_m=self.index_params.get("pq_m", 64),
+                pq_nbits=self.index_params.get("pq_nbits", 8),
+                quantization=quantization,
+                metric=index.metric_type,
+            )
+            if rerank_factor and (target_type, quantization) != ("flat", None):
+                index = RerankIndex(index, vectors, rerank_factor)
+            self.vector_store.index = index
+        set_search_params(
+            index,
+            nprobe=self.index_params.get("nprobe"),
+            ef_search=self.index_params.get("ef_search"),
+        )
+        return index_type_of(index)
+
+    def __target_index_kind(self, ntotal):
+        """Return the (index type, quantization) configured for a corpus of ntotal vectors.
+
+        IVF-PQ ignores the scalar quantization, so it is None for IVF-PQ indexes.
+        """
+        target_type = resolve_index_type(self.index_type, ntotal)
+        if target_type == "ivf_pq":
+            return target_type, None
+        return target_type, self.index_params.get("quantization")
+
+    def add_docs(self, documents, ids=None):
         """Add documents to the vector database.
 
         Args:
             documents (list): List of documents to be added.
+            ids (list, optional): List of IDs corresponding to the documents. Defaults to content hash IDs.
 
         Returns:
             list: List of document IDs added to the database.
         """
         try:
             if self.db_name == "FAISS":
-                return self.vector_store.add_documents(documents)
+                self.__check_writable()
+                ids = ids or chunk_ids(documents)
+                start = self.vector_store.index.ntotal
+                added_ids = self.vector_store.add_documents(documents, ids=ids)
+                self.__index_sources(documents, added_ids)
+                self.__index_metadata(documents, start)
+                self.__index_lexical(documents, added_ids)
+                return added_ids
             elif self.db_name == "Chroma":
                 # TODO: implement Chroma
                 pass
@@ -131,34 +396,596 @@ class VectorStore:
             logging.error(f"Failed to add documents to vector store: {e}")
             return []
 
-    def similarity_search(self, query, k=4):
+    def add_embeddings(self, documents, embeddings, ids=None):
+        """Add documents whose embeddings were already computed to the vector database.
+
+        Creates the vector database from the documents if it does not exist yet.
+
+        Args:
+            documents (list): List of documents to be added.
+            embeddings (list): List of embedding vectors, one per document.
+            ids (list, optional): List of IDs corresponding to the documents. Defaults to content hash IDs.
+
+        Returns:
+            list: List of document IDs added to the database.
+        """
+        try:
+            if self.db_name == "FAISS":
+                ids = ids or chunk_ids(documents)
+                text_embeddings = list(
+                    zip([doc.page_content for doc in documents], embeddings)
+                )
+                metadatas = [doc.metadata for doc in documents]
+                if self.vector_store is None:
+                    self.vector_store = FAISS.from_embeddings(
+                        text_embeddings, self.embeddings, metadatas=metadatas, ids=ids
+                    )
+                    self.source_index = None
+                    self.metadata_index = None
+                    self.read_only = False
+                    self.lexical_index = None
+                    added_ids = list(self.vector_store.index_to_docstore_id.values())
+                else:
+                    self.__check_writable()
+                    start = self.vector_store.index.ntotal
+                    added_ids = self.vector_store.add_embeddings(
+                        text_embeddings, metadatas=metadatas, ids=ids
+                    )
+                    self.__index_metadata(documents, start)
+                self.__index_sources(documents, added_ids)
+                self.__index_lexical(documents, added_ids)
+                return added_ids
+            elif self.db_name == "Chroma":
+                # TODO: implement Chroma
+                pass
+            else:
+                raise ValueError(f"Error adding embeddings to {self.db_name}")
+        except Exception as e:
+            logging.error(f"Failed to add embeddings to vector store: {e}")
+            return []
+
+    def add_doc_batches(self, batches):
+        """Add batches of documents to the vector database, creating it from the first batch if needed.
+
+        Intended for generators such as Document.stream_batches, so only one batch is held in memory.
+        If the batches raise partway (e.g. an unreadable page), the chunks already added from them are
+        removed again, so a document is never stored partially.
+
+        Args:
+            batches (iterable): Iterable of (documents, ids) tuples.
+
+        Returns:
+            list: List of document IDs added to the database.
+
+        Raises:
+            Exception: The error raised by the batches, after the added chunks were removed.
+        """
+        created = self.vector_store is None
+        added_ids = []
+        try:
+            for documents, ids in batches:
+                if self.vector_store is None:
+                    if self.create_from_docs(documents, ids=ids) is not None:
+                        added_ids.extend(ids)
+                else:
+                    added_ids.extend(self.add_docs(documents, ids=ids))
+        except Exception as e:
+            logging.error(
+                f"Failed to add document batches, discarding {len(added_ids)} chunks: {e}"
+            )
+            if created:
+                self.vector_store = None
+                self.lexical_index = None
+                self.source_index = None
+                self.metadata_index = None
+                self._fingerprint = None
+            elif added_ids:
+                self.__delete(added_ids)
+            raise
+        return added_ids
+
+    def upsert_docs(self, documents, ids=None):
+        """Insert or replace the chunks of one or more documents.
+
+        For every source in the given documents, chunks that are already stored with the same ID are kept
+        as they are, new chunks are embedded and added, and stored chunks that are no longer part of the
+        document are deleted. Only the changed chunks are embedded or removed.
+
+        Args:
+            documents (list): Complete list of chunks for each document being upserted.
+            ids (list, optional): List of IDs corresponding to the documents. Defaults to content hash IDs.
+
+        Returns:
+            list: List of document IDs added to the database.
+        """
+        ids = ids or chunk_ids(documents)
+        if self.vector_store is None:
+            self.create_from_docs(documents, ids=ids)
+            return list(ids)
+        try:
+            if self.db_name == "FAISS":
+                source_index = self.__source_index()
+                new_ids = set(ids)
+                stale_ids = []
+                for source in {doc.metadata.get("source") for doc in documents}:
+                    stale_ids.extend(source_index.get(source, set()) - new_ids)
+                if stale_ids:
+                    self.__delete(stale_ids)
+
+                stored_ids = set(self.vector_store.index_to_docstore_id.values())
+                to_add = [
+                    (doc, _id)
+                    for doc, _id in zip(documents, ids)
+                    if _id not in stored_ids
+                ]
+                logging.info(
+                    f"Upsert: {len(to_add)} chunks added, {len(stale_ids)} removed, "
+                    f"{len(documents) - len(to_add)} unchanged"
+                )
+                if not to_add:
+                    return []
+                docs_to_add, ids_to_add = zip(*to_add)
+                return self.add_docs(list(docs_to_add), ids=list(ids_to_add))
+            elif self.db_name == "Chroma":
+                # TODO: implement Chroma
+                pass
+            else:
+                raise ValueError(f"Error upserting documents to {self.db_name}")
+        except Exception as e:
+            logging.error(f"Failed to upsert documents in vector store: {e}")
+            return []
+
+    def delete_by_source(self, source):
+        """Delete every chunk of a document from the vector database.
+
+        Args:
+            source (str): Source of the document (the ``source`` metadata of its chunks).
+
+        Returns:
+            list: List of document IDs deleted from the database.
+        """
+        try:
+            if self.db_name == "FAISS":
+                ids = list(self.__source_index().get(source, set()))
+                if ids:
+                    self.__delete(ids)
+                return ids
+            elif self.db_name == "Chroma":
+                # TODO: implement Chroma
+                pass
+            else:
+                raise ValueError(f"Error deleting documents from {self.db_name}")
+        except Exception as e:
+            logging.error(f"Failed to delete documents from vector store: {e}")
+            return []
+
+    def __delete(self, ids):
+        """Remove chunks by ID from the FAISS index, the docstore and the source index.
+
+        The remaining vectors are renumbered consecutively, so index_to_docstore_id is renumbered to
+        keep it in step with the index.
+        """
+        self.__check_writable()
+        self._fingerprint = None
+        ids = set(ids)
+        id_map = self.vector_store.index_to_docstore_id
+        positions = [position for position, _id in id_map.items() if _id in ids]
+        self.vector_store.index = remove_positions(self.vector_store.index, positions)
+        remaining = [
+            id_map[position]
+            for position in sorted(id_map)
+            if id_map[position] not in ids
+        ]
+        self.vector_store.index_to_docstore_id = dict(enumerate(remaining))
+        # Positions were renumbered; rebuilt on the next filtered search.
+        self.metadata_index = None
+
+        docs = [self.vector_store.docstore.search(_id) for _id in ids]
+        self.vector_store.docstore.delete(list(ids))
+        if self.lexical_index is not None:
+            self.lexical_index.remove(ids)
+        if self.source_index is not None:
+            for _id, doc in zip(ids, docs):
+                source_ids = self.source_index.get(doc.metadata.get("source"))
+                if source_ids is not None:
+                    source_ids.discard(_id)
+
+    def __check_writable(self):
+        """Raise if the index is memory-mapped read-only.
+
+        FAISS aborts the process when vectors are added to a memory-mapped IVF index, so modifications are
+        refused before they reach the index.
+        """
+        if self.read_only:
+            raise ValueError("Memory-mapped vector stores are read-only")
+
+    def __source_index(self):
+        """Return the source index, building it from the docstore on first use."""
+        if self.source_index is not None:
+            return self.source_index
+        ids = self.vector_store.index_to_docstore_id.values()
+        if isinstance(self.vector_store.docstore, ColumnarDocstore):
+            # Only reads the id and source columns instead of decoding every chunk.
+            self.source_index = self.vector_store.docstore.source_index(ids)
+        else:
+            self.source_index = {}
+            for _id in ids:
+                doc = self.vector_store.docstore.search(_id)
+                self.source_index.setdefault(doc.metadata.get("source"), set()).add(_id)
+        return self.source_index
+
+    def __index_sources(self, documents, ids):
+        """Record newly added chunk IDs in the source index if it has been built."""
+        self._fingerprint = None
+        if self.source_index is None:
+            return
+        for doc, _id in zip(documents, ids):
+            self.source_index.setdefault(doc.metadata.get("source"), set()).add(_id)
+
+    def __metadata_index(self):
+        """Return the metadata index, building it from the docstore on first use."""
+        if self.metadata_index is not None:
+            return self.metadata_index
+        id_map = self.vector_store.index_to_docstore_id
+        ids = [id_map[position] for position in range(len(id_map))]
+        docstore = self.vector_store.docstore
+        if isinstance(docstore, ColumnarDocstore):
+            # Only reads the metadata column instead of decoding every chunk.
+            metadatas = docstore.metadatas(ids)
+        else:
+            metadatas = [docstore.search(_id).metadata for _id in ids]
+        self.metadata_index = MetadataIndex()
+        self.metadata_index.add(metadatas)
+        return self.metadata_index
+
+    def __index_metadata(self, documents, start):
+        """Record the metadata of chunks added at position start in the metadata index if it has been built."""
+        if self.metadata_index is not None:
+            self.metadata_index.add([doc.metadata for doc in documents], start=start)
+
+    def __index_lexical(self, documents, ids, reset=False):
+        """Add newly added chunks to the lexical index, creating it if lexical_search is on."""
+        if not self.lexical_search:
+            return
+        if reset or self.lexical_index is None:
+            self.lexical_index = LexicalIndex()
+        self.lexical_index.add(list(ids), [doc.page_content for doc in documents])
+
+    def __load_lexical_index(self, path):
+        """Read the lexical index saved next to the vector index, or build it from the docstore."""
+        ids = list(self.vector_store.index_to_docstore_id.values())
+        if path.exists():
+            try:
+                lexical_index = LexicalIndex.load(str(path))
+                if len(lexical_index) == len(ids) and all(
+                    _id in lexical_index.slots for _id in ids
+                ):
+                    return lexical_index
+                logging.info("Lexical index is out of date, rebuilding it")
+            except Exception as e:
+                logging.error(f"Failed to load lexical index: {e}")
+        lexical_index = LexicalIndex()
+        docs = [self.vector_store.docstore.search(_id) for _id in ids]
+        lexical_index.add(ids, [doc.page_content for doc in docs])
+        logging.info(f"Built lexical index of {len(ids)} chunks")
+        return lexical_index
+
+    def similarity_search(self, query, k=4, filter=None):
         """Perform a similarity search in the vector database.
 
         Args:
             query (str): Query to search for.
             k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches, e.g. {"source": path} or
+                {"source": path, "page": [1, 2]} (see MetadataIndex.select).
 
         Returns:
             list: List of most similar documents/entries.
         """
-        return self.vector_store.similarity_search(query=query, k=k)
+        if not filter:
+            return self.vector_store.similarity_search(query=query, k=k)
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)
+        ]
 
-    def similarity_search_with_score(self, query, k=4):
+    def similarity_search_with_score(self, query, k=4, filter=None):
         """Perform a similarity search in the vector database and get scores.
 
         Args:
             query (str): Query to search for.
             k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches.
+
+        Returns:
+            list: List of most similar documents/entries along with scores.
+        """
+        if not filter:
+            return self.vector_store.similarity_search_with_score(query=query, k=k)
+        embedding = self.embeddings.embed_query(query)
+        return self.similarity_search_with_score_by_vector(
+            embedding, k=k, filter=filter
+        )
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None):
+        """Perform a similarity search in the vector database with an already embedded query.
+
+        Args:
+            embedding (list): Embedding of the query.
+            k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches.
+
+        Returns:
+            list: List of most similar documents/entries.
+        """
+        if not filter:
+            return self.vector_store.similarity_search_by_vector(embedding, k=k)
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_score_by_vector(
+                embedding, k=k, filter=filter
+            )
+        ]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None):
+        """Perform a similarity search with an already embedded query and get scores.
+
+        With a filter, the metadata index narrows the search to the matching chunks before the vector
+        scan, so only their vectors are compared with the query (see search_subset) and the cost is
+        proportional to the size of the subset rather than of the whole index.
+
+        Args:
+            embedding (list): Embedding of the query.
+            k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches.
+
+        Returns:
+            list: List of most similar documents/entries along with scores.
+        """
+        if not filter:
+            return self.vector_store.similarity_search_with_score_by_vector(
+                embedding, k=k
+            )
+        return [
+            (self.vector_store.docstore.search(_id), score)
+            for _id, score in self.__vector_hits(embedding, k, filter).items()
+        ]
+
+    async def asimilarity_search_by_vector(self, embedding, k=4, filter=None):
+        """Asynchronously perform a similarity search with an already embedded query.
+
+        The CPU-bound index search runs in the default executor.
+
+        Args:
+            embedding (list): Embedding of the query.
+            k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches.
+
+        Returns:
+            list: List of most similar documents/entries.
+        """
+        return await asyncio.to_thread(
+            self.similarity_search_by_vector, embedding, k, filter
+        )
+
+    async def asimilarity_search(self, query, k=4, filter=None):
+        """Asynchronously perform a similarity search in the vector database.
+
+        The query is embedded with the async embeddings API (no thread is blocked on the network) and
+        the CPU-bound index search runs in the default executor.
+
+        Args:
+            query (str): Query to search for.
+            k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches.
+
+        Returns:
+            list: List of most similar documents/entries.
+        """
+        return [
+            doc
+            for doc, _ in await self.asimilarity_search_with_score(
+                query, k=k, filter=filter
+            )
+        ]
+
+    async def asimilarity_search_with_score(self, query, k=4, filter=None):
+        """Asynchronously perform a similarity search in the vector database and get scores.
+
+        Args:
+            query (str): Query to search for.
+            k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches.
 
         Returns:
             list: List of most similar documents/entries along with scores.
         """
-        return self.vector_store.similarity_search_with_score(query=query, k=k)
+        embedding = await self.embeddings.aembed_query(query)
+        return await asyncio.to_thread(
+            self.similarity_search_with_score_by_vector, embedding, k, filter
+        )
+
+    def __vector_hits(self, embedding, k, filter=None):
+        """Search the k nearest chunks of an embedded query, among those matching the filter if given.
+
+        Returns:
+            dict: Chunk ID -> distance as returned by the index (L2 distance or inner product), best first.
+        """
+        vector = np.array([embedding], dtype=np.float32)
+        if self.vector_store._normalize_L2:
+            faiss.normalize_L2(vector)
+        index = self.vector_store.index
+        if filter:
+            positions = self.__metadata_index().select(filter)
+            if not len(positions):
+                return {}
+            distances, positions = search_subset(
+                index, vector, positions, min(k, len(positions))
+            )
+        else:
+            distances, positions = index.search(vector, k)
+        id_map = self.vector_store.index_to_docstore_id
+        return {
+            id_map[position]: float(distance)
+            for distance, position in zip(distances[0], positions[0])
+            if position != -1
+        }
+
+    def lexical_search_with_score(self, query, k=4, filter=None):
+        """Perform a lexical (BM25) search in the lexical index, without embedding the query.
+
+        Args:
+            query (str): Query to search for.
+            k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches.
+
+        Returns:
+            list: List of best matching documents/entries along with BM25 scores (higher is better).
+        """
+        return [
+            (self.vector_store.docstore.search(_id), score)
+            for _id, score in self.lexical_index.search(
+                query, k=k, ids=self.__filtered_ids(filter)
+            )
+        ]
+
+    def hybrid_search(self, query, k=4, filter=None):
+        """Perform a hybrid search, fusing lexical (BM25) and vector search scores.
+
+        The fetch_k best chunks of each search are combined with fuse_scores, weighing the lexical scores
+        with lexical_weight. With lexical_only, queries dominated by rare identifiers (see
+        LexicalIndex.rare_identifiers) are answered from the lexical index alone, without embedding the
+        query; if fewer than k chunks contain the identifiers, they come first and the remaining results
+        come from the fused search. Falls back to a similarity search without a lexical index.
+
+        Args:
+            query (str): Query to search for.
+            k (int): Number of top results to retrieve.
+            filter (dict, optional): Only search chunks whose metadata matches.
+
+        Returns:
+            list: List of best matching documents/entries.
+        """
+        if self.lexical_index is None:
+            return self.similarity_search(query, k=k, filter=filter)
+        ids = self.__lexical_only_ids(query, k, filter)
+        if len(ids) < k:
+            lexical = self.__lexical_candidates(query, k, filter)
+            embedding = self.embeddings.embed_query(query)
+            vector = self.__vector_candidates(embedding, filter)
+            ids = self.__fuse(ids, lexical, vector, k)
+        return [self.vector_store.docstore.search(_id) for _id in ids]
+
+    async def ahybrid_search(self, query, k=4, filter=None):
+        """Asynchronous version of hybrid_search."""
+        if self.lexical_index is None:
+            return await self.asimilarity_search(query, k=k, filter=filter)
+        ids = self.__lexical_only_ids(query, k, filter)
+        if len(ids) < k:
+            lexical = self.__lexical_candidates(query, k, filter)
+            embedding = await self.embeddings.aembed_query(query)
+            vector = await asyncio.to_thread(
+                self.__vector_candidates, embedding, filter
+            )
+            ids = self.__fuse(ids, lexical, vector, k)
+        return [self.vector_store.docstore.search(_id) for _id in ids]
+
+    def __filtered_ids(self, filter):
+        """Return the IDs of the chunks matching a filter, or None without a filter."""
+        if not filter:
+            return None
+        id_map = self.vector_store.index_to_docstore_id
+        return [id_map[position] for position in self.__metadata_index().select(filter)]
+
+    def __lexical_only_ids(self, query, k, filter=None):
+        """Return the IDs of the best chunks for a query answered from the lexical index alone.
+
+        Returns:
+            list: Up to k chunk IDs, best first, or [] if lexical_only is off or the query is not
+            dominated by rare identifiers.
+        """
+        if not self.hybrid_params.get("lexical_only", True):
+            return []
+        identifiers = self.lexical_index.rare_identifiers(
+            query,
+            identifier_ratio=self.hybrid_params.get("identifier_ratio", 0.5),
+            rare_df_ratio=self.hybrid_params.get("rare_df_ratio", 0.01),
+        )
+        if not identifiers:
+            return []
+        hits = self.lexical_index.search(query, k=k, ids=self.__filtered_ids(filter))
+        if len(hits) < k:
+            logging.info(
+                f"Lexical-only search for identifiers {identifiers} found {len(hits)} of {k} "
+                "chunks, filling up with the hybrid search"
+            )
+        else:
+            logging.info(f"Lexical-only search for identifiers {identifiers}")
+        return [_id for _id, _ in hits]
+
+    def __lexical_candidates(self, query, k, filter=None):
+        """Return chunk ID -> BM25 score of the fetch_k best lexical matches of a hybrid search."""
+        fetch_k = max(k, self.hybrid_params.get("fetch_k", 20))
+        ids = self.__filtered_ids(filter)
+        return dict(self.lexical_index.search(query, k=fetch_k, ids=ids))
+
+    def __vector_candidates(self, embedding, filter=None):
+        """Return chunk ID -> vector similarity (higher is more similar) of the fetch_k nearest chunks."""
+        hits = self.__vector_hits(
+            embedding, self.hybrid_params.get("fetch_k", 20), filter
+        )
+        # Smaller L2 distances are more similar, larger inner products are.
+        inner_product = (
+            self.vector_store.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        )
+        sign = 1 if inner_product else -1
+        return {_id: sign * distance for _id, distance in hits.items()}
+
+    def __fuse(self, ids, lexical, vector, k):
+        """Return the given chunk IDs followed by the best fused candidates not among them, k in total."""
+        fused = fuse_scores(
+            lexical,
+            vector,
+            lexical_weight=self.hybrid_params.get("lexical_weight", 0.3),
+        )
+        found = set(ids)
+        return ids + [_id for _id, _ in fused if _id not in found][: k - len(ids)]
+
+    def fingerprint(self):
+        """Get a hash of the chunks currently in the vector database.
+
+        Chunk IDs are content hashes, so the fingerprint changes whenever chunks are added, removed or
+        replaced, and two stores with the same chunks have the same fingerprint. Recomputed lazily after
+        each change.
+
+        Returns:
+            str: SHA-256 hex digest of the sorted chunk IDs, or None if the vector database is empty.
+        """
+        if self.vector_store is None:
+            return None
+        if self._fingerprint is None:
+            ids = sorted(map(str, self.vector_store.index_to_docstore_id.values()))
+            self._fingerprint = hashlib.sha256(
+                "\0".join(ids).encode("utf-8")
+            ).hexdigest()
+        return self._fingerprint
 
-    def retriever(self):
+    def retriever(self, search_kwargs=None):
         """Get the vector database retriever object.
 
+        With search_mode "hybrid" and a lexical index, the retriever runs hybrid_search. With a filter,
+        it runs the filtered similarity_search of this vector store.
+
+        Args:
+            search_kwargs (dict, optional): Keyword arguments of the search, k and filter (e.g.
+                {"filter": {"source": path}} to only answer from one document).
+
         Returns:
             object: Retriever object.
         """
-        return self.vector_store.as_retriever()
+        search_kwargs = dict(search_kwargs or {})
+        if self.search_mode == "hybrid" and self.lexical_index is not None:
+            return HybridRetriever(vector_store=self, search_kwargs=search_kwargs)
+        if search_kwargs.get("filter"):
+            return FilteredRetriever(vector_store=self, search_kwargs=search_kwargs)
+        return self.vector_store.as_retriever(search_kwargs=search_kwargs)
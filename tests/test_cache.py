@@ -0,0 +1,156 @@
+"""Tests for the embedding, query embedding and answer caches."""
+from langchain.embeddings.base import Embeddings
+
+from src.cache import AnswerCache, EmbeddingCache, cached_embeddings
+
+
+def stored(cache):
+    return cache._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def test_entry_count_tracks_writes_and_evictions(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path, max_entries=4)
+    cache.put_many(["a", "b", "c"], [[1.0], [2.0], [3.0]])
+    assert len(cache) == stored(cache) == 3
+
+    # Replacing a key does not add an entry.
+    cache.put_many(["a", "d"], [[9.0], [4.0]])
+    assert len(cache) == stored(cache) == 4
+    assert cache.get_many(["a"]) == [[9.0]]
+
+    # The least recently used entries are evicted.
+    cache.put_many(["e", "f"], [[5.0], [6.0]])
+    assert len(cache) == stored(cache) == 4
+    assert cache.get_many(["b", "c"]) == [None, None]
+    assert cache.stats()["entries"] == 4
+    cache.close()
+
+    assert len(EmbeddingCache(path, max_entries=4)) == 4
+
+
+def last_access(cache, key):
+    return cache._conn.execute(
+        "SELECT last_access FROM embeddings WHERE key = ?", (key,)
+    ).fetchone()[0]
+
+
+def test_lookups_do_not_write_until_flushed(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path, max_entries=3)
+    cache.put_many(["a", "b", "c"], [[1.0], [2.0], [3.0]])
+    written = last_access(cache, "a")
+
+    assert cache.get_many(["a"]) == [[1.0]]
+    assert last_access(cache, "a") == written
+    assert not cache._conn.in_transaction
+
+    # The pending access time is written before evicting, so the entry read last is kept.
+    cache.put_many(["d"], [[4.0]])
+    assert last_access(cache, "a") > written
+    assert cache.get_many(["a", "d"]) == [[1.0], [4.0]]
+    assert len(cache) == stored(cache) == 3
+
+    # Pending access times are written when the cache is closed.
+    flushed = last_access(cache, "d")
+    cache.get_many(["d"])
+    cache.close()
+    reopened = EmbeddingCache(path, max_entries=3)
+    assert last_access(reopened, "d") > flushed
+
+
+def test_answer_cache_matches_questions_above_threshold():
+    cache = AnswerCache(threshold=0.9)
+    namespace = ("scope", "fingerprint")
+    cache.put(namespace, "What is AML?", [1.0, 0.0, 0.0], "answer")
+
+    # cos = 0.95 and 0.85.
+    assert cache.get(namespace, [0.95, (1 - 0.95**2) ** 0.5, 0.0]) == "answer"
+    assert cache.get(namespace, [0.85, (1 - 0.85**2) ** 0.5, 0.0]) is None
+    # Other scopes never match.
+    assert cache.get(("other", "fingerprint"), [1.0, 0.0, 0.0]) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_answer_cache_drops_outdated_versions():
+    cache = AnswerCache(threshold=0.9)
+    cache.put(("scope", "v1"), "q1", [1.0, 0.0], "old answer")
+    cache.put(("other", "v1"), "q1", [1.0, 0.0], "other answer")
+    assert len(cache) == 2
+
+    assert cache.get(("scope", "v2"), [1.0, 0.0]) is None
+    assert len(cache) == 1
+    cache.put(("scope", "v2"), "q1", [1.0, 0.0], "new answer")
+    assert cache.get(("scope", "v2"), [1.0, 0.0]) == "new answer"
+    assert cache.get(("other", "v1"), [1.0, 0.0]) == "other answer"
+
+
+def test_answer_cache_evicts_least_recently_used():
+    cache = AnswerCache(threshold=0.99, max_entries=3)
+    namespace = ("scope", "v1")
+    vectors = {"a": [1.0, 0.0, 0.0], "b": [0.0, 1.0, 0.0], "c": [0.0, 0.0, 1.0]}
+    for question, vector in vectors.items():
+        cache.put(namespace, question, vector, question)
+    assert cache.get(namespace, vectors["a"]) == "a"
+
+    # b is evicted, the last row (c) takes its place in the matrix.
+    cache.put(namespace, "d", [1.0, 1.0, 0.0], "d")
+    assert len(cache) == 3
+    assert cache.get(namespace, vectors["b"]) is None
+    assert [cache.get(namespace, vectors[q]) for q in "ac"] == ["a", "c"]
+    assert cache.get(namespace, [1.0, 1.0, 0.0]) == "d"
+
+
+class CountingEmbeddings(Embeddings):
+    """Embeddings returning the length of the text, counting the queries embedded."""
+
+    def __init__(self):
+        self.queries = []
+
+    def embed_documents(self, texts):
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text))]
+
+
+def test_query_cache_reuses_normalized_queries_and_evicts_lru():
+    backend = CountingEmbeddings()
+    embeddings = cached_embeddings(backend, query_cache_size=2)
+    embeddings.embed_query("What is AML?")
+    assert embeddings.embed_query("  what IS   aml? ") == [12.0]
+    assert backend.queries == ["What is AML?"]
+
+    embeddings.embed_query("b")
+    embeddings.embed_query("What is AML?")
+    # "b" is the least recently used and is evicted by "c".
+    embeddings.embed_query("c")
+    embeddings.embed_query("What is AML?")
+    embeddings.embed_query("b")
+    assert backend.queries == ["What is AML?", "b", "c", "b"]
+    assert embeddings.query_cache.stats()["hits"] == 3
+
+
+def test_query_cache_expires_entries_and_survives_restarts(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.cache.time.monotonic", lambda: now[0])
+    path = str(tmp_path / "queries.sqlite")
+    backend = CountingEmbeddings()
+    embeddings = cached_embeddings(
+        backend, query_cache_size=8, query_cache_ttl=60, query_cache_path=path
+    )
+    embeddings.embed_query("q")
+    now[0] += 61
+    embeddings.embed_query("q")
+    # Expired in memory, but still in the persistent store.
+    assert backend.queries == ["q"]
+    assert embeddings.query_cache.stats()["store_hits"] == 1
+    embeddings.query_cache.store.close()
+
+    restarted = cached_embeddings(
+        backend, query_cache_size=8, query_cache_ttl=60, query_cache_path=path
+    )
+    assert restarted.embed_query("Q") == [1.0]
+    assert backend.queries == ["q"]
@@ -0,0 +1,238 @@
+"""Tests for the stages of Chat.ask and Chat.aask: history budget, condensing and speculative retrieval."""
+import io
+import os
+import time
+import asyncio
+import contextlib
+
+import pytest
+from langchain.chains import LLMChain
+from langchain.schema import Document
+
+from src.cache import AnswerCache
+from src.chat import Chat, _stuff_prompt_inputs
+from src.config import Config
+from src.metrics import Metrics
+from src.utils import count_tokens
+from src.vector_store import VectorStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CFG_FILE = os.path.join(ROOT, "config", "config.yaml")
+BUDGET = 200
+SUMMARY_TOKENS = 60
+QUESTIONS = [
+    "What is the induction regimen for FLT3-ITD positive AML?",
+    "How long does it last?",
+    "And what are its most common side effects?",
+    "When is an allogeneic transplant recommended instead?",
+]
+
+
+def make_chat(monkeypatch, metrics=None, **settings):
+    """Create a conversational Chat with the fake LLM over a small store, with some settings changed."""
+    # langchain's OpenAI classes require a key, the fake LLM never calls the API.
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    cfg = Config(CFG_FILE)
+    for key, value in {
+        "llm_model": "fake",
+        "condense_llm_model": None,
+        "fake_llm_latency": 0,
+        "condense_heuristic": False,
+        "condense_cache_size": 0,
+        "speculative_retrieval": False,
+        "answer_cache": False,
+        "history_token_budget": BUDGET,
+        "history_summary": True,
+        "history_summary_tokens": SUMMARY_TOKENS,
+        **settings,
+    }.items():
+        monkeypatch.setitem(cfg.config, key, value)
+    db = VectorStore(
+        embeddings_model="FakeEmbeddings",
+        index_type="flat",
+    )
+    db.create_from_docs(
+        [
+            Document(
+                page_content=f"Chunk {i} about AML treatment and FLT3 inhibitors.",
+                metadata={"source": "aml.pdf", "page": i},
+            )
+            for i in range(8)
+        ]
+    )
+    return Chat(cfg, vector_store=db, metrics=metrics).with_history()
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    return make_chat(monkeypatch)
+
+
+def test_history_stays_within_budget(chat):
+    turns = 120
+    with contextlib.redirect_stdout(io.StringIO()):
+        for turn in range(turns):
+            chat.ask(QUESTIONS[turn % len(QUESTIONS)])
+            history = chat.chat_history
+            recent = chat.history_window.format(history[history.summarized :])
+            assert count_tokens(recent, chat.llm_model) <= BUDGET
+            assert count_tokens(history.summary, chat.llm_model) <= SUMMARY_TOKENS
+
+    assert len(chat.chat_history) == turns
+    # Older turns were folded into the summary instead of being sent with every prompt.
+    assert chat.chat_history.summarized > turns // 2
+    assert chat.chat_history.summary
+    formatted = chat.history_window.format(chat.chat_history)
+    assert count_tokens(formatted, chat.llm_model) <= BUDGET + SUMMARY_TOKENS + 10
+
+
+def speculations(metrics):
+    """Return the results of the speculative retrievals recorded in the metrics."""
+    return {
+        dict(labels)["result"]: count
+        for (name, labels), count in metrics.counters.items()
+        if name == "chat_speculative_retrievals_total"
+    }
+
+
+def test_speculative_similarity_of_zero_is_kept(monkeypatch):
+    metrics = Metrics()
+    chat = make_chat(
+        monkeypatch,
+        metrics=metrics,
+        speculative_retrieval=True,
+        speculative_similarity=0.0,
+    )
+    assert chat.speculative_similarity == 0.0
+    with contextlib.redirect_stdout(io.StringIO()):
+        chat.ask(QUESTIONS[0])
+        chat.ask(QUESTIONS[1])
+    # The fake condensed question is not similar to the raw one, but any similarity is enough.
+    assert speculations(metrics) == {"hit": 1}
+
+
+def test_condense_error_finishes_speculation(monkeypatch):
+    metrics = Metrics()
+    chat = make_chat(monkeypatch, metrics=metrics, speculative_retrieval=True)
+
+    def failing_run(*args, **kwargs):
+        raise RuntimeError("condense failed")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        chat.ask(QUESTIONS[0])
+        monkeypatch.setattr(LLMChain, "run", failing_run)
+        with pytest.raises(RuntimeError, match="condense failed"):
+            chat.ask(QUESTIONS[1])
+    assert speculations(metrics) == {"error": 1}
+    # The speculative retrieval trace is finished and recorded once the retrieval is done.
+    key = ("chat_request_seconds", (("operation", "speculative_retrieval"),))
+    deadline = time.monotonic() + 5
+    while key not in metrics.histograms and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert key in metrics.histograms
+
+
+def test_answer_cache_is_invalidated_by_store_changes(monkeypatch):
+    chat = make_chat(monkeypatch)
+    chat.answer_cache = AnswerCache(threshold=0.97)
+    with contextlib.redirect_stdout(io.StringIO()):
+        first = chat.with_history().ask(QUESTIONS[0])
+        second = chat.with_history().ask(QUESTIONS[0])
+        assert second["answer"] == first["answer"]
+        assert chat.answer_cache.stats()["hits"] == 1
+
+        chat.vector_store.add_docs(
+            [
+                Document(
+                    page_content="FLT3-ITD positive AML is treated with midostaurin.",
+                    metadata={"source": "flt3.pdf", "page": 0},
+                )
+            ]
+        )
+        chat.with_history().ask(QUESTIONS[0])
+    assert chat.answer_cache.stats()["hits"] == 1
+    # The answer for the previous contents of the store was dropped.
+    assert len(chat.answer_cache) == 1
+
+
+@pytest.mark.parametrize("speculative_retrieval", [False, True])
+def test_aask_matches_ask(monkeypatch, speculative_retrieval):
+    chat = make_chat(monkeypatch, speculative_retrieval=speculative_retrieval)
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = [chat.ask(question) for question in QUESTIONS]
+
+    async def conversation():
+        view = chat.with_history()
+        return [await view.aask(question) for question in QUESTIONS]
+
+    async def conversations():
+        # Conversations sharing the chains run concurrently on one event loop.
+        return await asyncio.gather(*(conversation() for _ in range(4)))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(conversations())
+    for responses in results:
+        assert [r["answer"] for r in responses] == [r["answer"] for r in expected]
+        assert [r["source_documents"] for r in responses] == [
+            r["source_documents"] for r in expected
+        ]
+
+
+def count_condense_calls(monkeypatch, chat):
+    """Count the calls of the chat's condensing chain."""
+    calls = []
+    run = LLMChain.run
+
+    def counting_run(self, *args, **kwargs):
+        if self is chat.qa_chain.question_generator:
+            calls.append(kwargs.get("question"))
+        return run(self, *args, **kwargs)
+
+    monkeypatch.setattr(LLMChain, "run", counting_run)
+    return calls
+
+
+def test_condense_heuristic_skips_standalone_follow_ups(monkeypatch):
+    chat = make_chat(monkeypatch, condense_heuristic=True)
+    calls = count_condense_calls(monkeypatch, chat)
+    with contextlib.redirect_stdout(io.StringIO()):
+        chat.ask(QUESTIONS[0])
+        chat.ask(QUESTIONS[1])
+        response = chat.ask(QUESTIONS[3])
+    # "When is an allogeneic transplant recommended instead?" is not condensed.
+    assert calls == [QUESTIONS[1]]
+    assert response["answer"].endswith(QUESTIONS[3])
+
+
+def test_condense_cache_reuses_questions_of_the_same_conversation(monkeypatch):
+    chat = make_chat(monkeypatch, condense_cache_size=10)
+    calls = count_condense_calls(monkeypatch, chat)
+    with contextlib.redirect_stdout(io.StringIO()):
+        answers = []
+        for _ in range(2):
+            conversation = chat.with_history()
+            conversation.ask(QUESTIONS[0])
+            answers.append(conversation.ask(QUESTIONS[1])["answer"])
+        # A different history is condensed again.
+        conversation = chat.with_history()
+        conversation.ask(QUESTIONS[2])
+        conversation.ask(QUESTIONS[1])
+    assert calls == [QUESTIONS[1], QUESTIONS[1]]
+    assert answers[0] == answers[1]
+    assert chat.condense_cache.stats()["hits"] == 1
+
+
+def test_stuff_prompt_inputs_format_the_chunks(chat):
+    combine_docs_chain = chat.qa_chain.combine_docs_chain
+    docs = [
+        Document(page_content="First chunk.", metadata={"source": "a.pdf"}),
+        Document(page_content="Second chunk.", metadata={"source": "b.pdf"}),
+    ]
+    inputs = _stuff_prompt_inputs(
+        combine_docs_chain, docs, question="Q?", chat_history="H", unused="x"
+    )
+    # The answer prompt does not use the chat history, only the question and the context.
+    assert inputs == {
+        "question": "Q?",
+        combine_docs_chain.document_variable_name: "First chunk.\n\nSecond chunk.",
+    }
@@ -0,0 +1,37 @@
+"""Tests for the standalone question heuristic and the similarity of question phrasings."""
+import pytest
+
+from src.condense import is_standalone, question_similarity
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "What is the induction regimen for FLT3-ITD positive AML?",
+        "Which gene mutations define favorable risk acute myeloid leukemia?",
+    ],
+)
+def test_self_contained_questions_are_standalone(question):
+    assert is_standalone(question)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Why not?",
+        "Any common side effects?",
+        "And what is the dose for children with AML?",
+        "What about the maintenance therapy after transplant?",
+        "How long does it last in older patients?",
+        "Is the latter regimen approved in Europe?",
+        "What's its response rate in relapsed disease?",
+    ],
+)
+def test_follow_ups_need_condensing(question):
+    assert not is_standalone(question)
+
+
+def test_question_similarity():
+    assert question_similarity([1.0, 0.0], [2.0, 0.0]) == pytest.approx(1.0)
+    assert question_similarity([1.0, 0.0], [0.0, 3.0]) == pytest.approx(0.0)
+    assert question_similarity([0.0, 0.0], [1.0, 0.0]) == 0.0
@@ -0,0 +1,72 @@
+"""Tests for packing retrieved chunks into the context token budget."""
+from langchain.prompts import PromptTemplate
+from langchain.schema import Document
+
+from src.context import context_budget, pack_documents
+from src.utils import count_tokens
+
+SEPARATOR = "\n\n"
+
+
+def make_docs(count, words=50):
+    return [
+        Document(
+            page_content=" ".join(f"chunk{i} word{j}" for j in range(words)),
+            metadata={"source": f"{i}.pdf"},
+        )
+        for i in range(count)
+    ]
+
+
+def tokens(docs, document_prompt=None):
+    """Count the tokens of documents joined into a context the way the chain formats them."""
+    texts = [
+        document_prompt.format(page_content=doc.page_content, **doc.metadata)
+        if document_prompt
+        else doc.page_content
+        for doc in docs
+    ]
+    return count_tokens(SEPARATOR.join(texts))
+
+
+def test_context_budget_by_model():
+    assert context_budget(1500, "gpt-4") == 1500
+    assert context_budget({"gpt-4": 2000, "default": 1500}, "gpt-4") == 2000
+    assert context_budget({"gpt-4": 2000, "default": 1500}, "gpt-3.5-turbo") == 1500
+    assert context_budget({"gpt-4": 2000}, "gpt-3.5-turbo") is None
+
+
+def test_most_relevant_chunks_are_kept_and_the_next_is_trimmed():
+    docs = make_docs(5)
+    size = count_tokens(docs[0].page_content)
+    budget = 2 * size + 150
+
+    packed = pack_documents(docs, budget, separator=SEPARATOR)
+    assert packed[:2] == docs[:2]
+    assert len(packed) == 3
+    assert docs[2].page_content.startswith(packed[2].page_content)
+    assert packed[2].metadata == docs[2].metadata
+    assert tokens(packed) <= budget
+
+
+def test_small_remainder_is_dropped():
+    docs = make_docs(5)
+    size = count_tokens(docs[0].page_content)
+
+    assert pack_documents(docs, 2 * size + 50, separator=SEPARATOR) == docs[:2]
+    assert pack_documents(docs, 50, separator=SEPARATOR) == []
+    assert pack_documents(docs, None) == docs
+
+
+def test_formatted_chunks_count_their_overhead():
+    document_prompt = PromptTemplate.from_template(
+        "Content: {page_content}\nSource: {source}"
+    )
+    docs = make_docs(5)
+    budget = 2 * tokens(docs[:1], document_prompt) + 150
+
+    packed = pack_documents(
+        docs, budget, document_prompt=document_prompt, separator=SEPARATOR
+    )
+    assert len(packed) == 3
+    assert tokens(packed, document_prompt) <= budget
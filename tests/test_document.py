@@ -0,0 +1,92 @@
+"""Tests for loading and splitting documents page by page."""
+import os
+
+import pypdf
+import pytest
+
+from src.document import Document
+from src.ingest import load_and_split
+from src.vector_store import VectorStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDF_PATH = os.path.join(ROOT, "files", "medical", "mm_htn_guidelines.pdf")
+SYLLABUS_PATH = os.path.join(ROOT, "files", "sample", "CS467_Syllabus.pdf")
+
+
+def test_stream_chunks_match_eager_split():
+    eager = Document(PDF_PATH, chunk_size=500, chunk_overlap=50)
+    streamed = Document(PDF_PATH, chunk_size=500, chunk_overlap=50, streaming=True)
+
+    chunks, ids = zip(*streamed.stream_chunks())
+    assert list(chunks) == eager.get_split_document()
+    assert list(ids) == eager.get_ids()
+
+
+def test_stream_chunks_is_lazy(monkeypatch):
+    extracted = []
+    extract_text = pypdf.PageObject.extract_text
+
+    def counting_extract_text(page, *args, **kwargs):
+        extracted.append(page)
+        return extract_text(page, *args, **kwargs)
+
+    monkeypatch.setattr(pypdf.PageObject, "extract_text", counting_extract_text)
+    doc = Document(PDF_PATH, chunk_size=500, chunk_overlap=50, streaming=True)
+    next(doc.stream_chunks())
+    assert len(extracted) == 1
+
+
+def fail_on_page(monkeypatch, failing_page):
+    """Make extracting the text of the failing_page-th page read raise an error."""
+    extract_text = pypdf.PageObject.extract_text
+    calls = []
+
+    def failing_extract_text(page, *args, **kwargs):
+        calls.append(page)
+        if len(calls) == failing_page:
+            raise OSError("damaged page")
+        return extract_text(page, *args, **kwargs)
+
+    monkeypatch.setattr(pypdf.PageObject, "extract_text", failing_extract_text)
+
+
+def test_stream_chunks_raises_on_failing_page(monkeypatch):
+    fail_on_page(monkeypatch, 3)
+    doc = Document(PDF_PATH, chunk_size=500, chunk_overlap=50, streaming=True)
+    chunks = []
+    with pytest.raises(OSError, match="damaged page"):
+        for chunk, _ in doc.stream_chunks():
+            chunks.append(chunk)
+    # The first two pages were yielded before the error.
+    assert {chunk.metadata["page"] for chunk in chunks} == {0, 1}
+
+
+@pytest.mark.parametrize("existing", [False, True])
+def test_add_doc_batches_discards_partial_document(monkeypatch, existing):
+    db = VectorStore(
+        embeddings_model="HashingEmbeddings",
+        embedding_params={"size": 64},
+        index_type="flat",
+    )
+    if existing:
+        other = Document(SYLLABUS_PATH, chunk_size=500, chunk_overlap=50)
+        db.create_from_docs(other.get_split_document(), ids=other.get_ids())
+    stored = set(db.vector_store.index_to_docstore_id.values()) if existing else set()
+
+    fail_on_page(monkeypatch, 3)
+    doc = Document(PDF_PATH, chunk_size=500, chunk_overlap=50, streaming=True)
+    with pytest.raises(OSError, match="damaged page"):
+        db.add_doc_batches(doc.stream_batches(batch_size=2))
+
+    if existing:
+        assert set(db.vector_store.index_to_docstore_id.values()) == stored
+        assert db.vector_store.index.ntotal == len(stored)
+    else:
+        assert db.vector_store is None
+
+
+def test_load_and_split_raises_on_failing_page(monkeypatch):
+    # The ingestion pipeline then logs the error and skips the whole document.
+    fail_on_page(monkeypatch, 3)
+    with pytest.raises(OSError, match="damaged page"):
+        load_and_split(PDF_PATH, "recursive", 500, 50)
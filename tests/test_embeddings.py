@@ -0,0 +1,55 @@
+"""Tests for the embeddings registry and the local HashingEmbeddings backend."""
+import numpy as np
+import pytest
+
+from src.condense import question_similarity
+from src.embeddings import (
+    EMBEDDINGS,
+    HashingEmbeddings,
+    create_embeddings,
+    register_embeddings,
+)
+
+TEXTS = [
+    "FLT3-ITD positive AML",
+    "Induction with 7+3 and midostaurin",
+    "",
+    "Allogeneic transplant in first remission",
+]
+
+
+def test_embeddings_do_not_depend_on_the_batch():
+    embeddings = HashingEmbeddings(size=256)
+    batch = embeddings.embed_documents(TEXTS)
+    small_batches = HashingEmbeddings(size=256, batch_size=1).embed_documents(TEXTS)
+    assert batch == small_batches
+    assert [embeddings.embed_query(text) for text in TEXTS] == batch
+    assert embeddings.embed_documents(TEXTS[::-1]) == batch[::-1]
+    assert embeddings.embed_documents([]) == []
+
+
+def test_embeddings_are_normalized_and_match_related_texts():
+    embeddings = HashingEmbeddings(size=256)
+    vectors = np.asarray(embeddings.embed_documents(TEXTS + ["?!"]), dtype=np.float32)
+    assert np.allclose(np.linalg.norm(vectors[[0, 1, 3]], axis=1), 1.0)
+    # Texts without n-grams embed to zero vectors.
+    assert not vectors[2].any() and not vectors[4].any()
+
+    query = embeddings.embed_query("flt3 itd AML")
+    assert question_similarity(query, vectors[0]) > 0.5
+    assert question_similarity(query, vectors[0]) > question_similarity(
+        query, vectors[3]
+    )
+
+
+def test_registry_creates_backends_by_name(monkeypatch):
+    monkeypatch.setattr("src.embeddings.EMBEDDINGS", dict(EMBEDDINGS))
+    embeddings = create_embeddings("HashingEmbeddings", size=32, ngram_range=[2, 3])
+    assert isinstance(embeddings, HashingEmbeddings)
+    assert embeddings.model == "hashing-32-2-3"
+    assert len(embeddings.embed_query("AML")) == 32
+
+    register_embeddings("Custom", lambda **params: params)
+    assert create_embeddings("Custom", size=8) == {"size": 8}
+    with pytest.raises(ValueError):
+        create_embeddings("Unknown")
@@ -0,0 +1,82 @@
+"""Tests for the batch evaluation runner."""
+import os
+import json
+
+import pytest
+from langchain.schema import Document
+
+from src.chat import Chat
+from src.config import Config
+from src.evaluate import BatchRunner
+from src.vector_store import VectorStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CFG_FILE = os.path.join(ROOT, "config", "config.yaml")
+QUESTIONS = [
+    "What is the induction regimen for AML?",
+    "Which FLT3 inhibitors are approved?",
+]
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    # langchain's OpenAI classes require a key, the fake LLM never calls the API.
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    cfg = Config(CFG_FILE).with_overrides(
+        llm_model="fake", fake_llm_latency=0, answer_cache=False
+    )
+    db = VectorStore(
+        embeddings_model="HashingEmbeddings",
+        embedding_params={"size": 64},
+        index_type="flat",
+    )
+    db.create_from_docs(
+        [
+            Document(
+                page_content=f"Chunk {i} about AML induction and FLT3 inhibitors.",
+                metadata={"source": "aml.pdf", "page": i},
+            )
+            for i in range(6)
+        ]
+    )
+    return Chat(cfg, vector_store=db)
+
+
+def read_results(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_results_have_retrieval_scores(chat, tmp_path):
+    results = BatchRunner(chat, str(tmp_path / "results.jsonl")).run(QUESTIONS)
+
+    assert [r["question"] for r in results] == QUESTIONS
+    for result in results:
+        assert result["answer"]
+        scores = [doc["score"] for doc in result["source_documents"]]
+        assert scores and all(-1 <= score <= 1 for score in scores)
+        # Sorted like the similarity search that retrieved them.
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_resume_only_reuses_results_of_the_same_run(chat, tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    run = {"db": "./db", "llm_model": "fake"}
+    BatchRunner(chat, path, run=run).run(QUESTIONS[:1])
+    BatchRunner(chat, path, run=run).run(QUESTIONS)
+    # The first question was answered once, from the checkpoint on the second run.
+    assert [r["question"] for r in read_results(path)] == QUESTIONS
+
+    BatchRunner(chat, path, run={**run, "db": "./db_sample"}).run(QUESTIONS)
+    results = read_results(path)
+    assert len(results) == 4
+    assert [r["run"]["db"] for r in results[2:]] == ["./db_sample"] * 2
+
+
+def test_with_overrides_leaves_the_shared_config_unchanged():
+    cfg = Config(CFG_FILE)
+    llm_model = cfg.llm_model
+    overridden = cfg.with_overrides(llm_model="fake")
+    assert overridden.llm_model == "fake"
+    assert cfg.llm_model == llm_model
+    assert Config(CFG_FILE) is cfg
@@ -0,0 +1,75 @@
+"""Tests for building and searching FAISS indexes."""
+import numpy as np
+import pytest
+
+from src.index import (
+    RerankIndex,
+    build_index,
+    index_vectors,
+    remove_positions,
+    set_search_params,
+)
+
+
+def test_ivf_default_nprobe_finds_k_neighbours():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((4000, 32)).astype(np.float32)
+    index = build_index(vectors, index_type="ivf_flat", nlist=64)
+    set_search_params(index)
+    assert index.nprobe == 8
+
+    distances, positions = index.search(vectors[:50], 10)
+    assert (positions != -1).all()
+    # Every query vector is in the index, so it is its own nearest neighbour.
+    assert (positions[:, 0] == np.arange(50)).all()
+
+
+def test_configured_nprobe_is_capped_by_nlist():
+    vectors = np.random.default_rng(0).standard_normal((800, 8)).astype(np.float32)
+    index = build_index(vectors, index_type="ivf_flat", nlist=16)
+    set_search_params(index, nprobe=100)
+    assert index.nprobe == 16
+
+
+def test_remove_from_quantized_hnsw_without_exact_vectors_is_refused():
+    vectors = np.random.default_rng(0).standard_normal((800, 8)).astype(np.float32)
+    index = build_index(vectors, index_type="hnsw", quantization="sq8")
+    with pytest.raises(ValueError):
+        remove_positions(index, [3])
+    assert index.ntotal == 800
+
+
+@pytest.mark.parametrize(
+    "index_type,quantization",
+    [("ivf_flat", None), ("ivf_flat", "sq8"), ("ivf_pq", None)],
+)
+def test_remove_from_ivf_index_keeps_codes_and_renumbers(index_type, quantization):
+    vectors = np.random.default_rng(0).standard_normal((2000, 16)).astype(np.float32)
+    index = build_index(
+        vectors, index_type=index_type, nlist=16, pq_m=4, quantization=quantization
+    )
+    set_search_params(index, nprobe=16)
+    stored = index_vectors(index)
+
+    removed = remove_positions(index, [5, 0, 1999, 700])
+    assert removed is index
+    assert index.ntotal == 1996
+    # The remaining codes are untouched, only their labels are shifted.
+    assert np.array_equal(
+        index_vectors(index), np.delete(stored, [0, 5, 700, 1999], axis=0)
+    )
+    _, labels = index.search(np.delete(stored, [0, 5, 700, 1999], axis=0)[:50], 1)
+    assert (labels[:, 0] == np.arange(50)).all()
+
+
+def test_remove_from_rerank_index_keeps_exact_vectors():
+    vectors = np.random.default_rng(0).standard_normal((800, 8)).astype(np.float32)
+    index = build_index(vectors, index_type="hnsw", quantization="sq8")
+    index = RerankIndex(index, vectors, rerank_factor=4)
+
+    for positions in ([3, 10], [0]):
+        index = remove_positions(index, positions)
+        vectors = np.delete(vectors, positions, axis=0)
+    assert index.ntotal == 797
+    assert np.array_equal(index_vectors(index), vectors)
+    assert (index.search(vectors[:20], 1)[1][:, 0] == np.arange(20)).all()
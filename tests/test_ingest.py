@@ -0,0 +1,80 @@
+"""Tests for the parallel ingestion pipeline."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src import ingest
+from src.document import Document
+from src.ingest import IngestionPipeline
+from src.vector_store import VectorStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDF_PATHS = [
+    os.path.join(ROOT, "files", "sample", "CS467_Syllabus.pdf"),
+    os.path.join(ROOT, "files", "medical", "mm_htn_guidelines.pdf"),
+]
+
+
+class FailingExecutor(ThreadPoolExecutor):
+    """Executor whose submit() fails after a number of documents."""
+
+    submits = 1
+
+    def __init__(self, max_workers=None):
+        super().__init__(max_workers=max_workers)
+        self.remaining = self.submits
+
+    def submit(self, fn, *args, **kwargs):
+        if self.remaining == 0:
+            raise RuntimeError("cannot schedule new futures")
+        self.remaining -= 1
+        return super().submit(fn, *args, **kwargs)
+
+
+def make_pipeline():
+    db = VectorStore(
+        embeddings_model="HashingEmbeddings",
+        embedding_params={"size": 64},
+        index_type="flat",
+    )
+    # The store is created from the first ingested document.
+    return IngestionPipeline(db, max_workers=2)
+
+
+def test_run_ingests_in_input_order():
+    ids = make_pipeline().run(PDF_PATHS)
+    assert ids == [_id for path in PDF_PATHS for _id in Document(path).get_ids()]
+
+
+def test_unreadable_document_is_skipped():
+    missing = os.path.join(ROOT, "files", "missing.pdf")
+    ids = make_pipeline().run([missing, PDF_PATHS[0]])
+    assert ids == Document(PDF_PATHS[0]).get_ids()
+
+
+def test_submit_error_is_raised(monkeypatch):
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", FailingExecutor)
+    pipeline = make_pipeline()
+    with pytest.raises(RuntimeError, match="cannot schedule"):
+        pipeline.run(PDF_PATHS)
+    # The document submitted before the error was merged.
+    assert pipeline.vector_store.vector_store.index.ntotal == len(
+        Document(PDF_PATHS[0]).get_ids()
+    )
+
+
+def test_sources_replace_temporary_paths(tmp_path):
+    ids = []
+    for upload in ("first", "second"):
+        temp_path = tmp_path / f"{upload}.pdf"
+        temp_path.write_bytes(open(PDF_PATHS[0], "rb").read())
+        pipeline = make_pipeline()
+        ids.append(pipeline.run([str(temp_path)], sources=["CS467_Syllabus.pdf"]))
+        docstore = pipeline.vector_store.vector_store.docstore
+        assert {docstore.search(_id).metadata["source"] for _id in ids[-1]} == {
+            "CS467_Syllabus.pdf"
+        }
+    # Uploading the same file again gives the same chunk IDs, whatever its temporary path.
+    assert ids[0] == ids[1]
+    assert ids[0] == Document(PDF_PATHS[0], source="CS467_Syllabus.pdf").get_ids()
@@ -0,0 +1,73 @@
+"""Tests for the BM25 lexical index."""
+import pickle
+
+from langchain.schema import Document
+
+from src.lexical import LexicalIndex
+from src.vector_store import VectorStore
+
+TEXTS = {
+    "a": "FLT3-ITD mutations in acute myeloid leukemia",
+    "b": "CPX-351 for secondary acute myeloid leukemia",
+    "c": "AMLSG 09-09 trial of gemtuzumab",
+}
+
+
+def make_index():
+    index = LexicalIndex()
+    index.add(list(TEXTS), list(TEXTS.values()))
+    return index
+
+
+def test_remove_drops_only_the_terms_of_removed_chunks():
+    index = make_index()
+    index.remove(["a", "unknown"])
+
+    assert "flt3-itd" not in index.postings
+    assert index.postings["leukemia"] == {index.slots["b"]: 1}
+    assert index.search("FLT3-ITD leukemia", k=3) == index.search("leukemia", k=3)
+    assert [_id for _id, _ in index.search("leukemia", k=3)] == ["b"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = make_index()
+    index.remove(["b"])
+    index.save(str(tmp_path / "index.bm25"))
+
+    with open(tmp_path / "index.bm25", "rb") as f:
+        assert f.read(6) == b"ARROW1"
+    loaded = LexicalIndex.load(str(tmp_path / "index.bm25"))
+    assert loaded.ids == ["a", "c"]
+    assert loaded.postings == index.postings
+    assert loaded.terms == index.terms
+    assert loaded.search("09-09 leukemia", k=2) == index.search("09-09 leukemia", k=2)
+
+    loaded.remove(["a"])
+    assert [_id for _id, _ in loaded.search("leukemia 09-09", k=2)] == ["c"]
+
+
+def test_pickled_index_is_rebuilt_on_load(tmp_path):
+    def make_store():
+        return VectorStore(
+            folder_path=str(tmp_path),
+            embeddings_model="HashingEmbeddings",
+            embedding_params={"size": 64},
+            index_type="flat",
+            lexical_search=True,
+        )
+
+    db = make_store()
+    db.create_from_docs(
+        [
+            Document(page_content=text, metadata={"source": "a.pdf"})
+            for text in TEXTS.values()
+        ]
+    )
+    db.save()
+    with open(tmp_path / "index.bm25", "wb") as f:
+        pickle.dump((1.5, 0.75, ["stale"], [1], {"stale": {0: 1}}), f)
+
+    db = make_store()
+    db.load()
+    assert len(db.lexical_index) == 3
+    assert db.lexical_index.search("CPX-351", k=1)[0][1] > 0
@@ -0,0 +1,68 @@
+"""Tests for setting up logging repeatedly, as the app does on every Streamlit rerun."""
+import os
+import logging
+
+import pytest
+
+from src import bootstrap as bootstrap_module
+from src.config import Config
+from src.log import reset_logging, setup_logging
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CFG_FILE = os.path.join(ROOT, "config", "config.yaml")
+LOGGERS = ["", "langchain", "urllib3", "faiss", "doc_retrieval", "metrics"]
+
+
+def handler_count():
+    """Return the total number of handlers on the loggers configured by setup_logging."""
+    return sum(len(logging.getLogger(name).handlers) for name in LOGGERS)
+
+
+@pytest.fixture
+def cfg(tmp_path, monkeypatch):
+    cfg = Config(CFG_FILE)
+    for key, value in {
+        "log_to_console": True,
+        "log_to_file": True,
+        "log_file_name": str(tmp_path / "app.log"),
+        "log_doc_retrieval": True,
+        "doc_retrieval_log_file_name": str(tmp_path / "doc_retrieval.log"),
+        "log_metrics": True,
+        "metrics_log_file_name": str(tmp_path / "metrics.jsonl"),
+        "metrics_port": None,
+    }.items():
+        monkeypatch.setitem(cfg.config, key, value)
+    yield cfg
+    reset_logging()
+
+
+def test_setup_logging_is_idempotent(cfg):
+    before = handler_count()
+    setup_logging(cfg)
+    after_first = handler_count()
+    assert after_first > before
+    for _ in range(20):
+        setup_logging(cfg)
+        assert handler_count() == after_first
+
+
+def test_reset_logging_removes_every_handler(cfg):
+    before = handler_count()
+    setup_logging(cfg)
+    reset_logging()
+    assert handler_count() == before
+    setup_logging(cfg)
+    setup_logging(cfg)
+    reset_logging()
+    assert handler_count() == before
+
+
+def test_bootstrap_sets_up_logging_once(cfg, monkeypatch):
+    monkeypatch.setattr(bootstrap_module, "_bootstrapped", {})
+    before = handler_count()
+    first = bootstrap_module.bootstrap(CFG_FILE)
+    after_first = handler_count()
+    assert after_first > before
+    for _ in range(20):
+        assert bootstrap_module.bootstrap(CFG_FILE) == first
+    assert handler_count() == after_first
@@ -0,0 +1,87 @@
+"""Tests for searching the vector store within the chunks selected by their metadata."""
+import numpy as np
+from langchain.schema import Document
+
+import src.index
+from src.index import build_index, search_subset
+from src.metadata import FilteredRetriever, MetadataIndex
+from src.vector_store import VectorStore
+
+
+def test_select_matches_every_field():
+    index = MetadataIndex()
+    index.add(
+        [
+            {"source": "a.pdf", "page": 1},
+            {"source": "a.pdf", "page": 2, "tags": ["aml"]},
+            {"source": "b.pdf", "page": 1},
+        ]
+    )
+    assert index.select({"source": "a.pdf"}).tolist() == [0, 1]
+    assert index.select({"source": ["a.pdf", "b.pdf"], "page": 1}).tolist() == [0, 2]
+    assert index.select({"source": "c.pdf"}).tolist() == []
+    # Unhashable values are not indexed and never match.
+    assert index.select({"tags": ["aml"]}).tolist() == []
+    assert index.select({}).tolist() == [0, 1, 2]
+
+
+def test_search_subset_only_reads_the_subset(monkeypatch):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 16)).astype(np.float32)
+    index = build_index(vectors, index_type="ivf_flat", nlist=16)
+    positions = np.arange(0, 2000, 20)
+    read = []
+    index_rows = src.index.index_rows
+    monkeypatch.setattr(
+        src.index,
+        "index_rows",
+        lambda index, rows: read.extend(rows) or index_rows(index, rows),
+    )
+
+    distances, labels = search_subset(index, vectors[:3], positions, 5, block_size=64)
+    assert sorted(read) == positions.tolist()
+    expected = ((vectors[:3, None, :] - vectors[positions]) ** 2).sum(axis=2)
+    order = np.argsort(expected, axis=1)[:, :5]
+    assert (labels == positions[order]).all()
+    assert np.allclose(distances, np.take_along_axis(expected, order, axis=1), 1e-4)
+
+
+def make_docs(source, count, text):
+    return [
+        Document(
+            page_content=f"{text} {i}",
+            metadata={"source": source, "page": i},
+        )
+        for i in range(count)
+    ]
+
+
+def test_filtered_search_returns_only_matching_chunks():
+    db = VectorStore(
+        embeddings_model="HashingEmbeddings",
+        embedding_params={"size": 64},
+        index_type="flat",
+    )
+    db.create_from_docs(
+        make_docs("a.pdf", 20, "FLT3 inhibitors for AML induction")
+        + make_docs("b.pdf", 3, "Transplant eligibility in older adults")
+        + make_docs("c.pdf", 20, "FLT3 inhibitor maintenance in AML")
+    )
+    query = "FLT3 inhibitors for AML"
+    # The chunks of b.pdf are far from the query, over-fetching would miss them.
+    results = db.similarity_search(query, k=5, filter={"source": "b.pdf"})
+    assert len(results) == 3
+    assert {doc.metadata["source"] for doc in results} == {"b.pdf"}
+
+    db.delete_by_source("a.pdf")
+    results = db.similarity_search(
+        query, k=4, filter={"source": "c.pdf", "page": [1, 2]}
+    )
+    assert sorted(doc.metadata["page"] for doc in results) == [1, 2]
+    assert {doc.metadata["source"] for doc in results} == {"c.pdf"}
+
+    retriever = db.retriever({"k": 2, "filter": {"source": "b.pdf"}})
+    assert isinstance(retriever, FilteredRetriever)
+    docs = retriever.get_relevant_documents(query)
+    assert len(docs) == 2
+    assert {doc.metadata["source"] for doc in docs} == {"b.pdf"}
@@ -0,0 +1,49 @@
+"""Tests for sharing vector stores and chats between sessions."""
+import os
+
+import pytest
+from langchain.schema import Document
+
+from src.config import Config
+from src.prompts import CHAT_QA_PROMPT
+from src.registry import registry, shared_chat
+from src.vector_store import VectorStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CFG_FILE = os.path.join(ROOT, "config", "config.yaml")
+
+
+@pytest.fixture
+def cfg(monkeypatch):
+    # langchain's OpenAI classes require a key, the fake LLM never calls the API.
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    cfg = Config(CFG_FILE)
+    monkeypatch.setitem(cfg.config, "llm_model", "fake")
+    monkeypatch.setitem(cfg.config, "answer_cache", False)
+    yield cfg
+    registry.clear()
+
+
+def make_store(folder_path, source):
+    db = VectorStore(
+        folder_path=str(folder_path),
+        embeddings_model="HashingEmbeddings",
+        embedding_params={"size": 64},
+        index_type="flat",
+    )
+    db.create_from_docs(
+        [Document(page_content=f"{source} chunk", metadata={"source": source})]
+    )
+    return db
+
+
+def test_shared_chat_is_keyed_on_the_store_contents(cfg, tmp_path):
+    first = make_store(tmp_path / "a", "a.pdf")
+    chat = shared_chat(cfg, first, CHAT_QA_PROMPT)
+    assert shared_chat(cfg, make_store(tmp_path / "a", "a.pdf"), CHAT_QA_PROMPT) is chat
+
+    # A store with other chunks or in another directory gets its own chat.
+    other = make_store(tmp_path / "a", "b.pdf")
+    assert shared_chat(cfg, other, CHAT_QA_PROMPT).vector_store is other
+    moved = make_store(tmp_path / "b", "a.pdf")
+    assert shared_chat(cfg, moved, CHAT_QA_PROMPT).vector_store is moved
@@ -0,0 +1,98 @@
+"""Tests for saving and reloading the sharded vector store."""
+import os
+
+import pytest
+from langchain.schema import Document
+
+from src.shards import ShardedVectorStore, shard_name
+from src.vector_store import VectorStore
+
+
+def make_docs(source, count, topic="leukemia"):
+    return [
+        Document(
+            page_content=f"{source} chunk {i} about {topic} topic{i}",
+            metadata={"source": source, "page": i},
+        )
+        for i in range(count)
+    ]
+
+
+def make_store(folder_path, docstore_format="arrow", **options):
+    return ShardedVectorStore(
+        folder_path=str(folder_path),
+        embeddings_model="HashingEmbeddings",
+        embedding_params={"size": 64},
+        docstore_format=docstore_format,
+        index_type="flat",
+        **options,
+    )
+
+
+def test_load_upsert_save_search(tmp_path):
+    db = make_store(tmp_path)
+    db.create_from_docs(make_docs("a.pdf", 4) + make_docs("b.pdf", 4))
+    db.save()
+
+    db = make_store(tmp_path)
+    db.load()
+    # Load the shard before replacing it, so its Arrow file is memory-mapped while it is rewritten.
+    assert len(db.similarity_search("a.pdf chunk", k=8)) == 8
+    # Drops the first chunk of a.pdf, keeps the others (served from its Arrow file) and adds two.
+    upserted = make_docs("a.pdf", 4)[1:] + make_docs("a.pdf", 6, topic="lymphoma")[4:]
+    assert len(db.upsert_docs(upserted)) == 2
+    db.save()
+
+    results = db.similarity_search("a.pdf chunk 5 about lymphoma", k=10)
+    assert results[0].page_content == "a.pdf chunk 5 about lymphoma topic5"
+    assert sorted(r.page_content for r in results) == sorted(
+        doc.page_content for doc in upserted + make_docs("b.pdf", 4)
+    )
+
+    reloaded = make_store(tmp_path)
+    reloaded.load()
+    assert (
+        reloaded.similarity_search("a.pdf chunk 5 about lymphoma", k=1)[0] == results[0]
+    )
+
+
+def test_shards_have_no_lexical_index(tmp_path):
+    db = make_store(
+        tmp_path, lexical_search=True, search_mode="hybrid", hybrid_params={}
+    )
+    db.create_from_docs(make_docs("a.pdf", 2))
+    db.save()
+
+    shard_path = tmp_path / "shards" / shard_name("a.pdf")
+    assert (shard_path / "index.faiss").exists()
+    assert not os.path.exists(shard_path / "index.bm25")
+
+
+@pytest.mark.parametrize("docstore_format", ["pickle", "arrow"])
+def test_load_splits_single_index_into_shards(tmp_path, docstore_format):
+    docs = make_docs("a.pdf", 3) + make_docs("b.pdf", 3, topic="lymphoma")
+    single = VectorStore(
+        folder_path=str(tmp_path),
+        embeddings_model="HashingEmbeddings",
+        embedding_params={"size": 64},
+        docstore_format=docstore_format,
+        index_type="flat",
+    )
+    single.create_from_docs(docs)
+    single.save()
+    expected = single.similarity_search("b.pdf chunk 2 about lymphoma", k=6)
+
+    db = make_store(tmp_path, docstore_format=docstore_format)
+    assert db.load(mmap=True) is db
+    assert sorted(entry["source"] for entry in db.manifest.values()) == [
+        "a.pdf",
+        "b.pdf",
+    ]
+    assert db.read_only
+    assert db.similarity_search("b.pdf chunk 2 about lymphoma", k=6) == expected
+    assert db.similarity_search("chunk", k=6, filter={"source": "a.pdf"}) == [
+        doc for doc in expected if doc.metadata["source"] == "a.pdf"
+    ]
+    # The single index is kept for loading with sharded_index turned off.
+    assert (tmp_path / "index.faiss").exists()
+    assert (tmp_path / "index.shards.json").exists()
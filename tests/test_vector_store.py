@@ -0,0 +1,154 @@
+"""Tests for saving, reloading and searching the vector store with the columnar (Arrow) docstore."""
+import asyncio
+
+import pytest
+from langchain.schema import Document
+
+from src.vector_store import VectorStore
+
+
+def make_docs(source, count):
+    return [
+        Document(
+            page_content=f"{source} chunk {i} about acute myeloid leukemia topic{i}",
+            metadata={"source": source, "page": i},
+        )
+        for i in range(count)
+    ]
+
+
+def make_store(folder_path):
+    return VectorStore(
+        folder_path=str(folder_path),
+        embeddings_model="HashingEmbeddings",
+        embedding_params={"size": 64},
+        docstore_format="arrow",
+        index_type="flat",
+    )
+
+
+@pytest.fixture
+def saved_store(tmp_path):
+    db = make_store(tmp_path)
+    db.create_from_docs(make_docs("a.pdf", 5) + make_docs("b.pdf", 5))
+    db.save()
+    db = make_store(tmp_path)
+    db.load()
+    return db
+
+
+def sources(results):
+    return {doc.metadata["source"] for doc in results}
+
+
+def test_delete_save_search(saved_store, tmp_path):
+    assert len(saved_store.delete_by_source("a.pdf")) == 5
+    saved_store.save()
+
+    results = saved_store.similarity_search("a.pdf chunk 1", k=10)
+    assert len(results) == 5
+    assert sources(results) == {"b.pdf"}
+
+    reloaded = make_store(tmp_path)
+    reloaded.load()
+    assert sources(reloaded.similarity_search("a.pdf chunk 1", k=10)) == {"b.pdf"}
+
+
+def test_add_save_search(saved_store, tmp_path):
+    assert len(saved_store.add_docs(make_docs("c.pdf", 3))) == 3
+    saved_store.save()
+
+    results = saved_store.similarity_search("c.pdf chunk 2", k=13)
+    assert len(results) == 13
+    assert sources(results) == {"a.pdf", "b.pdf", "c.pdf"}
+    assert results[0].page_content.startswith("c.pdf chunk 2")
+
+    reloaded = make_store(tmp_path)
+    reloaded.load()
+    assert reloaded.similarity_search("c.pdf chunk 2", k=1)[0].page_content == (
+        results[0].page_content
+    )
+
+
+def test_save_twice(saved_store):
+    saved_store.delete_by_source("b.pdf")
+    saved_store.save()
+    saved_store.add_docs(make_docs("d.pdf", 2))
+    saved_store.save()
+
+    assert sources(saved_store.similarity_search("chunk", k=10)) == {"a.pdf", "d.pdf"}
+
+
+def test_lexical_only_hybrid_search_fills_up_to_k(tmp_path):
+    db = VectorStore(
+        folder_path=str(tmp_path),
+        embeddings_model="HashingEmbeddings",
+        embedding_params={"size": 64},
+        index_type="flat",
+        lexical_search=True,
+        search_mode="hybrid",
+    )
+    docs = make_docs("a.pdf", 30)
+    docs[7].page_content += " The trial enrolled FLT3-ITD patients."
+    db.create_from_docs(docs)
+
+    results = db.hybrid_search("FLT3-ITD", k=4)
+    assert len(results) == 4
+    # The chunk with the identifier comes first, the others come from the fused search.
+    assert "FLT3-ITD" in results[0].page_content
+    assert len({doc.page_content for doc in results}) == 4
+
+
+def test_save_does_not_rebuild_an_up_to_date_index(tmp_path, monkeypatch):
+    db = VectorStore(
+        folder_path=str(tmp_path),
+        embeddings_model="HashingEmbeddings",
+        embedding_params={"size": 64},
+        index_type="ivf_pq",
+        index_params={"quantization": "sq8", "rerank_factor": 2},
+    )
+    db.create_from_docs(make_docs("a.pdf", 1000))
+    db.save()
+    index = db.vector_store.index
+
+    built = []
+    monkeypatch.setattr(
+        "src.vector_store.build_index", lambda *args, **kwargs: built.append(args)
+    )
+    db.save()
+    assert built == []
+    assert db.vector_store.index is index
+
+
+def test_async_search_matches_sync_search(saved_store):
+    for filter in (None, {"source": "b.pdf"}):
+        expected = saved_store.similarity_search_with_score(
+            "chunk 3", k=4, filter=filter
+        )
+        results = asyncio.run(
+            saved_store.asimilarity_search_with_score("chunk 3", k=4, filter=filter)
+        )
+        assert results == expected
+    docs = asyncio.run(saved_store.asimilarity_search("chunk 3", k=4, filter=filter))
+    assert docs == [doc for doc, _ in expected]
+    assert sources(docs) == {"b.pdf"}
+
+
+def test_switching_docstore_format_removes_the_other_file(saved_store, tmp_path):
+    db = VectorStore(
+        folder_path=str(tmp_path),
+        embeddings_model="HashingEmbeddings",
+        embedding_params={"size": 64},
+        docstore_format="pickle",
+        index_type="flat",
+    )
+    db.load()
+    db.delete_by_source("a.pdf")
+    db.save()
+    assert not (tmp_path / "index.arrow").exists()
+
+    reloaded = make_store(tmp_path)
+    reloaded.load()
+    assert sources(reloaded.similarity_search("chunk", k=10)) == {"b.pdf"}
+    reloaded.save()
+    assert not (tmp_path / "index.pkl").exists()